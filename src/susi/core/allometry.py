@@ -5,49 +5,159 @@ Created on Sun Jan 30 10:44:18 2022
 @author: alauren
 """
 
+import hashlib
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
 from scipy.interpolate import interp1d
 
+MOTTI_COLUMNS = [
+    "yr",
+    "age",
+    "N",
+    "BA",
+    "Hg",
+    "Dg",
+    "hdom",
+    "vol",
+    "logs",
+    "pulp",
+    "loss",
+    "yield",
+    "mortality",
+    "stem",
+    "stemloss",
+    "branch_living",
+    "branch_dead",
+    "leaves",
+    "stump",
+    "roots_coarse",
+    "roots_fine",
+]  # columns of the growth and yield sheet of a Motti file
+
+_motti_tables = {}  # compiled Motti files of this process by content hash
+
+
+def read_motti_tables(ifile):
+    """
+    Parses a Motti .xlsx file
+    Out:
+        dict of arrays: columns of the growth and yield sheet (MOTTI_COLUMNS) and
+        idSpe, the species codes of the second sheet
+    """
+    df = pd.read_excel(ifile, sheet_name=0, usecols=range(22), skiprows=1, header=None)
+    df = df.drop([0], axis=1)
+    df.columns = MOTTI_COLUMNS
+    df2 = pd.read_excel(ifile, sheet_name=1, usecols=[4], skiprows=1, header=None)
+    tables = {c: df[c].to_numpy() for c in MOTTI_COLUMNS}
+    tables["idSpe"] = df2[4].to_numpy()
+    return tables
+
+
+def motti_tables(ifile, cache=None):
+    """
+    Columns of a Motti file. The Excel file is parsed once, after that the compiled columns are
+    read from memory within the process and from cache (TableCache, .npz) across runs. Keyed by
+    the content of the file, an edited file is parsed again.
+    Input:
+        ifile Motti-input file name including the folder path
+        cache TableCache or None
+    """
+    digest = hashlib.sha256(Path(ifile).read_bytes()).hexdigest()
+    if digest not in _motti_tables:
+        if cache is None:
+            _motti_tables[digest] = read_motti_tables(ifile)
+        else:
+            _motti_tables[digest] = cache.fetch(
+                "motti", {"sha256": digest}, lambda: read_motti_tables(ifile)
+            )
+    return _motti_tables[digest]
+
+
+class StackedInterpolator:
+    """
+    Linear interpolation of several allometric variables with one bracket search. The
+    variables tabulated on the same grid are stacked into one value matrix, the search is done
+    once for each grid. Values are identical to those of the interp1d functions it is built from
+    (kind linear, bounds_error False, fill_value tuple).
+    """
+
+    def __init__(self, functions):
+        """
+        Input:
+            functions dict of name: interp1d
+        """
+        self.grids = []  # (x, names, Y, below, above) of each grid
+        for name, f in functions.items():
+            for grid in self.grids:
+                if np.array_equal(grid[0], f.x):
+                    break
+            else:
+                grid = (f.x, [], [], [], [])
+                self.grids.append(grid)
+            below, above = f.fill_value
+            grid[1].append(name)
+            grid[2].append(f.y)
+            grid[3].append(below)
+            grid[4].append(above)
+        self.grids = [
+            (x, names, np.vstack(Y), np.array(below), np.array(above))
+            for x, names, Y, below, above in self.grids
+        ]
+
+    def __call__(self, xnew):
+        """
+        Out:
+            dict of name: array of the values at xnew
+        """
+        xnew = np.asarray(xnew, dtype=float)
+        out = {}
+        for x, names, Y, below, above in self.grids:
+            # bracket as in numpy.interp: x[j] <= xnew < x[j+1]
+            j = np.searchsorted(x, xnew, side="right") - 1
+            lo = np.clip(j, 0, len(x) - 2)
+            y_lo, y_hi = Y[:, lo], Y[:, lo + 1]
+            slope = (y_hi - y_lo) / (x[lo + 1] - x[lo])
+            y = slope * (xnew - x[lo]) + y_lo
+            retry = np.isnan(y)
+            if retry.any():  # nan in one direction, numpy.interp tries the other
+                y = np.where(retry, slope * (xnew - x[lo + 1]) + y_hi, y)
+                y = np.where(np.isnan(y) & (y_lo == y_hi), y_lo, y)
+            at = np.clip(j, 0, len(x) - 1)
+            on_grid = (j >= 0) & (x[at] == xnew)
+            if on_grid.any():
+                y = np.where(on_grid, Y[:, at], y)
+            outside = (xnew < x[0]) | (xnew > x[-1]) | np.isnan(xnew)
+            if outside.any():
+                fill = np.where(xnew[..., None] < x[0], below, above)
+                y = np.where(outside, np.moveaxis(fill, -1, 0), y)
+                y = np.where(np.isnan(xnew), xnew, y)
+            out.update(zip(names, y))
+        return out
+
 
 class Allometry:
     def __init__(self):
-        pass
+        self.stacks = {}  # stacked interpolators by tuple of variable names
 
-    def get_motti(self, ifile, return_spe=False):
-        # ---read the Motti-simulation to be used as a basis for the Susi-simulation
+    def stacked(self, names):
+        """
+        Stacked interpolator of the allometry functions names, all of the same argument, built
+        on first use
+        """
+        names = tuple(names)
+        if names not in self.stacks:
+            self.stacks[names] = StackedInterpolator(
+                {name: self.allometry_f[name] for name in names}
+            )
+        return self.stacks[names]
 
-        cnames = [
-            "yr",
-            "age",
-            "N",
-            "BA",
-            "Hg",
-            "Dg",
-            "hdom",
-            "vol",
-            "logs",
-            "pulp",
-            "loss",
-            "yield",
-            "mortality",
-            "stem",
-            "stemloss",
-            "branch_living",
-            "branch_dead",
-            "leaves",
-            "stump",
-            "roots_coarse",
-            "roots_fine",
-        ]
-        df = pd.read_excel(
-            ifile, sheet_name=0, usecols=range(22), skiprows=1, header=None
-        )
-        df = df.drop([0], axis=1)
-        df.columns = cnames
-        cname = ["idSpe"]
-        df2 = pd.read_excel(ifile, sheet_name=1, usecols=[4], skiprows=1, header=None)
-        df2.columns = cname
+    def get_motti(self, ifile, return_spe=False, cache=None):
+        # ---read the Motti-simulation to be used as a basis for the Susi-simulation
+        tables = motti_tables(ifile, cache)
+        df = pd.DataFrame({c: tables[c] for c in MOTTI_COLUMNS})
+        df2 = pd.DataFrame({"idSpe": tables["idSpe"]})
 
         # ---- find thinnings and add a small time to lines with the age to enable interpolation---------
         df = df.loc[df["age"] != 0]
@@ -61,10 +171,12 @@ class Allometry:
         else:
             return df
 
-    def motti_development(self, ifile, sfc):
+    def motti_development(self, ifile, sfc, cache=None):
         """
         Input:
             Motti-input file name including the folder path
+            sfc site fertility class
+            cache TableCache for the compiled Motti files, or None
         Out:
             ALL UNITS converted to /tree, except for number of stems, which is /ha
             interpolation functions:
@@ -123,7 +235,7 @@ class Allometry:
             "roots_fine",
         ]
         species_codes = {1: "Pine", 2: "Spruce", 3: "Birch"}
-        df, sp = self.get_motti(ifile, return_spe=True)
+        df, sp = self.get_motti(ifile, return_spe=True, cache=cache)
         sp = sp if sp < 4 else 3
         spe = species_codes[sp]
         # leaf_scale ={1: 1.1, 2: 1.2, 3: 1.355, 4:1.4, 5: 1.5, 6: 1.6 }    # scales the leaf mass down from mineral soil, key is the site fertility class
@@ -35,7 +35,9 @@ class CanopyGrid:
 
         Args:
             cpara - parameter
-            state - initial state array
+            state - initial state array, shape (ncols,) or (nscens, ncols): with the scenarios
+                in the first axis one run_timestep advances all of them, each with its own
+                hc, LAIconif, Rew and beta of the same shape
             outputs - True saves output grids to list at each timestep
 
         Returns:
@@ -128,6 +130,7 @@ class CanopyGrid:
         Rew=1.0,
         beta=1.0,
         P=101300.0,
+        day=None,
     ):
         """
         Runs CanopyGrid instance for one timestep
@@ -144,6 +147,8 @@ class CanopyGrid:
             Rew - relative extractable water [-], scalar or matrix
             beta - term for soil evaporation resistance (Wliq/FC) [-]
             P - pressure [Pa], scalar or matrix
+            day - index of the day in the series given to precompute_forcing; the weather terms
+                are then read from there instead of computed from Ta, Prec and VPD
         OUT:
             updated CanopyGrid instance state variables
             flux grids PotInf, Trfall, Interc, Evap, ET, MBE [m]
@@ -161,7 +166,11 @@ class CanopyGrid:
         )  # Launiainen et al. 2016 GCB, fit to Fig 2a
 
         """ --- update phenology: self.ddsum & self.X ---"""
-        fPheno = self._photoacclim(Ta)
+        if day is None:
+            fPheno = self._photoacclim(Ta)
+        else:
+            self.X = self.forcing["X"][day]
+            fPheno = self.forcing["fPheno"][day]
 
         """ --- aerodynamic conductances --- """
         Ra, Rb, Ras, ustar, Uh, Ug = aerodynamics(
@@ -175,13 +184,25 @@ class CanopyGrid:
         )
 
         """ --- interception, evaporation and snowpack --- """
-        PotInf, Trfall, Evap, Interc, MBE, erate, unload, fact = self.canopy_water_snow(
-            dt, Ta, Prec, Rn, VPD, Ra=Ra
-        )
+        if day is None:
+            water_snow = self.canopy_water_snow(dt, Ta, Prec, Rn, VPD, Ra=Ra)
+        else:
+            water_snow = self.canopy_water_snow_day(dt, day, Rn, Ra=Ra)
+        PotInf, Trfall, Evap, Interc, MBE, erate, unload, fact = water_snow
 
         """--- dry-canopy evapotranspiration [mm s-1] --- """
         Transpi, Efloor, Gc = self.dry_canopy_et(
-            VPD, Par, Rn, Ta, Ra=Ra, Ras=Ras, CO2=CO2, Rew=Rew, beta=beta, fPheno=fPheno
+            VPD,
+            Par,
+            Rn,
+            Ta,
+            Ra=Ra,
+            Ras=Ras,
+            CO2=CO2,
+            Rew=Rew,
+            beta=beta,
+            fPheno=fPheno,
+            day=day,
         )
 
         Transpi = Transpi * dt
@@ -245,6 +266,62 @@ class CanopyGrid:
         )
         return fPheno
 
+    def precompute_forcing(self, Ta, Prec, VPD, dt, P=101300.0):
+        """
+        Computes the terms of the timestep that depend only on the weather for the whole period
+        at once: phenology state X and modifier fPheno, latent heats, fractions of rain and snow,
+        slope of the saturation vapor pressure curve and air density. run_timestep(..., day=d)
+        then reads the terms of day d. The phenology recursion starts from the current self.X,
+        see precompute_phenology.
+        IN:
+            Ta - daily air temperature [degC], array (days,)
+            Prec - precipitation rate [mm/s], array (days,)
+            VPD - vapor pressure deficit [kPa], array (days,)
+            dt - timestep [s]
+            P - pressure [Pa]
+        """
+        Ta = np.asarray(Ta, dtype=float)
+        Tmin = 0.0  # 'C, below all is snow
+        Tmax = 1.0  # 'C, above all is water
+        fW = np.where(
+            Ta >= Tmax, 1.0, np.where(Ta > Tmin, (Ta - Tmin) / (Tmax - Tmin), 0.0)
+        )
+        fS = np.where(Ta <= Tmin, 1.0, np.where(Ta < Tmax, 1.0 - fW, 0.0))
+
+        Lv = 1e3 * (3147.5 - 2.37 * (Ta + 273.15))  # J kg-1
+        _, s, g = e_sat(Ta, P)
+
+        self.forcing = {
+            "Ta": Ta,
+            "Prec": np.asarray(Prec, dtype=float) * dt,  # mm
+            "VPD": np.asarray(VPD, dtype=float),
+            "fW": fW,
+            "fS": fS,
+            "Lv": Lv,
+            "Ls": Lv + 3.3e5,
+            "s": s,
+            "g": g,
+            "rhoa": 101300.0 / (8.31 * (Ta + 273.15)),  # mol m-3
+        }
+        self.precompute_phenology()
+
+    def precompute_phenology(self):
+        """
+        Phenology state X and modifier fPheno of the precomputed period, starting from the current
+        self.X. The weather terms stay: a new run over the same weather, e.g. the next scenario,
+        only needs this to continue from the phenology state where the previous run ended.
+        """
+        X = np.empty(len(self.forcing["Ta"]))
+        x = self.X
+        for d, T in enumerate(self.forcing["Ta"]):
+            x = x + 1.0 / self.phenopara.tau * (T - x)  # degC
+            X[d] = x
+        S = np.maximum(X - self.phenopara.xo, 0.0)
+        self.forcing["X"] = X
+        self.forcing["fPheno"] = np.maximum(
+            self.phenopara.fmin, np.minimum(S / self.phenopara.smax, 1.0)
+        )
+
     def _lai_dynamics(self, doy):
         """
         Seasonal cycle of deciduous leaf area
@@ -295,6 +372,7 @@ class CanopyGrid:
         Rew=1.0,
         beta=1.0,
         fPheno=1.0,
+        day=None,
     ):
         """
         Computes ET from 2-layer canopy in absense of intercepted precipitiation,
@@ -311,6 +389,7 @@ class CanopyGrid:
            Rew - relative extractable water [-]
            beta - relative soil conductance for evaporation [-]
            fPheno - phenology modifier [-]
+           day - day index of the precomputed weather terms, see precompute_forcing
         Args:
            Tr - transpiration rate (mm s-1)
            Efloor - forest floor evaporation rate (mm s-1)
@@ -331,7 +410,16 @@ class CanopyGrid:
 
         # ---Amax and g1 as LAI -weighted average of conifers and decid.
 
-        rhoa = 101300.0 / (8.31 * (Ta + 273.15))  # mol m-3
+        if day is None:
+            rhoa = 101300.0 / (8.31 * (Ta + 273.15))  # mol m-3
+            esat = None
+        else:
+            rhoa = self.forcing["rhoa"][day]
+            esat = (
+                self.forcing["s"][day],
+                self.forcing["g"][day],
+                self.forcing["Lv"][day],
+            )
 
         Amax = (
             1.0
@@ -387,7 +475,9 @@ class CanopyGrid:
         Gc[np.isnan(Gc)] = eps
 
         """ --- transpiration rate --- """
-        Tr = penman_monteith((1.0 - tau) * AE, 1e3 * D, Ta, Gc, 1.0 / Ra, units="mm")
+        Tr = penman_monteith(
+            (1.0 - tau) * AE, 1e3 * D, Ta, Gc, 1.0 / Ra, units="mm", esat=esat
+        )
         Tr[Tr < 0] = 0.0
 
         """--- forest floor evaporation rate--- """
@@ -397,7 +487,7 @@ class CanopyGrid:
         Gcs = self.gsoil
 
         Efloor = beta * penman_monteith(
-            tau * AE, 1e3 * D, Ta, Gcs, 1.0 / Ras, units="mm"
+            tau * AE, 1e3 * D, Ta, Gcs, 1.0 / Ras, units="mm", esat=esat
         )
         Efloor[self.SWE > 0] = (
             0.0  # no evaporation from floor if snow on ground or beta == 0
@@ -428,18 +518,8 @@ class CanopyGrid:
         # quality of precipitation
         Tmin = 0.0  # 'C, below all is snow
         Tmax = 1.0  # 'C, above all is water
-        Tmelt = 0.0  # 'C, T when melting starts
 
-        # storage capacities mm
-        Wmax = self.wmax * self.LAI
-        Wmaxsnow = self.wmaxsnow * self.LAI
-
-        # melting/freezing coefficients mm/s
-        Kmelt = self.Kmelt - 1.64 * self.cf / dt  # Kuusisto E, 'Lumi Suomessa'
-        Kfreeze = self.Kfreeze
-
-        kp = self.physpara.kp
-        tau = np.exp(-kp * self.LAI)  # fraction of Rn at ground
+        Wmax, Wmaxsnow, tau = self._storage_capacities()
 
         # inputs to arrays, needed for indexing later in the code
         gridshape = np.shape(self.LAI)  # rows, cols
@@ -462,14 +542,7 @@ class CanopyGrid:
         ixr = np.where((Prec == 0) & (T > Tmin))
         Ga = 1.0 / Ra  # aerodynamic conductance
 
-        # resistance for snow sublimation adopted from:
-        # Pomeroy et al. 1998 Hydrol proc; Essery et al. 2003 J. Climate;
-        # Best et al. 2011 Geosci. Mod. Dev.
-        # ri = (2/3*rhoi*r**2/Dw) / (Ce*Sh*W) == 7.68 / (Ce*Sh*W
-
-        Ce = 0.01 * ((self.W + eps) / Wmaxsnow) ** (-0.4)  # exposure coeff (-)
-        Sh = 1.79 + 3.0 * U**0.5  # Sherwood numbner (-)
-        gi = Sh * self.W * Ce / 7.68 + eps  # m s-1
+        gi = self._sublimation_conductance(Wmaxsnow, U)  # m s-1
         # print ixs
         # print('ixs', np.shape(ixs), 'gi', np.shape(gi[ixs]), 'ga', np.shape(Ga[ixs]),
         #      'T', np.shape(T[ixs]), 'AE', np.shape(AE[ixs]), 'tau', np.shape(tau[ixs]))
@@ -511,12 +584,120 @@ class CanopyGrid:
         fS[ix] = 1.0 - fW[ix]
         del ix
 
-        # --- Local fluxes (mm)
-        Unload = np.zeros(gridshape)  # snow unloading
-        Interc = np.zeros(gridshape)  # interception
-        Melt = np.zeros(gridshape)  # melting
-        Freeze = np.zeros(gridshape)  # freezing
-        Evap = np.zeros(gridshape)
+        PotInf, Trfall, Evap, Interc, MBE, Unload = self._canopy_and_snowpack(
+            dt, T, Prec, erate, fW, fS, Wmax, Wmaxsnow
+        )
+
+        return PotInf, Trfall, Evap, Interc, MBE, erate, Unload, fS + fW
+
+    def canopy_water_snow_day(self, dt, day, AE, Ra=25.0, U=2.0):
+        """
+        canopy_water_snow for weather that is the same in every grid cell, with the weather terms
+        of day from precompute_forcing. The rain/snow regime is then the same in the whole grid
+        and only the state dependent terms are computed for the cells. Results are identical to
+        canopy_water_snow.
+        Args:
+            dt - timestep [s]
+            day - day index of the precomputed weather terms
+            AE - available energy (~net radiation) (Wm-2)
+            Ra - canopy aerodynamic resistance (s m-1)
+        Returns:
+            as canopy_water_snow
+        """
+        f = self.forcing
+        T = f["Ta"][day]
+        Prec = f["Prec"][day]  # mm
+        D = f["VPD"][day]
+        fW = f["fW"][day]
+        fS = f["fS"][day]
+        esat = (f["s"][day], f["g"][day], f["Lv"][day])
+
+        Tmin = 0.0  # 'C, below all is snow
+
+        Wmax, Wmaxsnow, tau = self._storage_capacities()
+        gridshape = np.shape(self.LAI)  # rows, cols
+        Ga = 1.0 / Ra  # aerodynamic conductance
+
+        # 'potential' evaporation / sublimation rates
+        if Prec == 0 and T <= Tmin:
+            gi = self._sublimation_conductance(Wmaxsnow, U)  # m s-1
+            erate = (
+                dt
+                / f["Ls"][day]
+                * penman_monteith(
+                    (1.0 - tau) * AE, 1e3 * D, T, gi, Ga, units="W", esat=esat
+                )
+            )
+        elif Prec == 0 and T > Tmin:
+            gs = 1e6
+            erate = (
+                dt
+                / f["Lv"][day]
+                * penman_monteith(
+                    (1.0 - tau) * AE, 1e3 * D, T, gs, Ga, units="W", esat=esat
+                )
+            )
+        else:
+            erate = np.zeros(gridshape)
+
+        PotInf, Trfall, Evap, Interc, MBE, Unload = self._canopy_and_snowpack(
+            dt, T, Prec, erate, fW, fS, Wmax, Wmaxsnow
+        )
+
+        return (
+            PotInf,
+            Trfall,
+            Evap,
+            Interc,
+            MBE,
+            erate,
+            Unload,
+            np.full(gridshape, fS + fW),
+        )
+
+    def _storage_capacities(self):
+        """
+        Interception storage capacities of rain and snow Wmax, Wmaxsnow (mm) and the fraction
+        of net radiation at the ground tau at the current LAI
+        """
+        Wmax = self.wmax * self.LAI
+        Wmaxsnow = self.wmaxsnow * self.LAI
+        kp = self.physpara.kp
+        tau = np.exp(-kp * self.LAI)  # fraction of Rn at ground
+        return Wmax, Wmaxsnow, tau
+
+    def _sublimation_conductance(self, Wmaxsnow, U):
+        """
+        Conductance of the sublimation of intercepted snow (m s-1), Pomeroy et al. 1998 Hydrol proc;
+        Essery et al. 2003 J. Climate; Best et al. 2011 Geosci. Mod. Dev.
+        """
+        # ri = (2/3*rhoi*r**2/Dw) / (Ce*Sh*W) == 7.68 / (Ce*Sh*W
+        Ce = 0.01 * ((self.W + eps) / Wmaxsnow) ** (-0.4)  # exposure coeff (-)
+        Sh = 1.79 + 3.0 * U**0.5  # Sherwood numbner (-)
+        return Sh * self.W * Ce / 7.68 + eps  # m s-1
+
+    def _canopy_and_snowpack(self, dt, T, Prec, erate, fW, fS, Wmax, Wmaxsnow):
+        """
+        Canopy water storage and snowpack over the timestep, shared by canopy_water_snow and
+        canopy_water_snow_day. T, Prec, fW and fS are scalars or grids.
+        Args:
+            dt - timestep [s]
+            T - air temperature (degC)
+            Prec - precipitation (mm)
+            erate - potential evaporation / sublimation from the canopy store (mm)
+            fW, fS - fractions of precipitation as water and as snow
+            Wmax, Wmaxsnow - interception storage capacities (mm)
+        Returns:
+            self - updated state W, SWE, SWEi, SWEl
+            PotInf, Trfall, Evap, Interc, MBE, Unload (mm)
+        """
+        Tmin = 0.0  # 'C, below all is snow
+        Tmax = 1.0  # 'C, above all is water
+        Tmelt = 0.0  # 'C, T when melting starts
+
+        # melting/freezing coefficients mm/s
+        Kmelt = self.Kmelt - 1.64 * self.cf / dt  # Kuusisto E, 'Lumi Suomessa'
+        Kfreeze = self.Kfreeze
 
         """ --- initial conditions for calculating mass balance error --"""
         Wo = self.W  # canopy storage
@@ -525,27 +706,25 @@ class CanopyGrid:
         """ --------- Canopy water storage change -----"""
         # snow unloading from canopy, ensures also that seasonal LAI development does
         # not mess up computations
-        ix = T >= Tmax
-        Unload[ix] = np.maximum(self.W[ix] - Wmax[ix], 0.0)
+        Unload = select(
+            T >= Tmax,
+            lambda: np.maximum(self.W - Wmax, 0.0),
+            lambda: np.zeros_like(self.W),
+        )
         self.W = self.W - Unload
-        del ix
-        # dW = self.W - Wo
 
         # Interception of rain or snow: asymptotic approach of saturation.
         # Hedstrom & Pomeroy 1998. Hydrol. Proc 12, 1611-1625;
         # Koivusalo & Kokkonen 2002 J.Hydrol. 262, 145-164.
-        ix = T < Tmin
-        Interc[ix] = (Wmaxsnow[ix] - self.W[ix]) * (
-            1.0 - np.exp(-(self.cf[ix] / Wmaxsnow[ix]) * Prec[ix])
-        )
-        del ix
-
-        # above Tmin, interception capacity equals that of liquid precip
-        ix = T >= Tmin
-        Interc[ix] = np.maximum(0.0, (Wmax[ix] - self.W[ix])) * (
-            1.0 - np.exp(-(self.cf[ix] / Wmax[ix]) * Prec[ix])
+        # Above Tmin, interception capacity equals that of liquid precip
+        Interc = select(
+            T < Tmin,
+            lambda: (Wmaxsnow - self.W) * (1.0 - np.exp(-(self.cf / Wmaxsnow) * Prec)),
+            lambda: (
+                np.maximum(0.0, (Wmax - self.W))
+                * (1.0 - np.exp(-(self.cf / Wmax) * Prec))
+            ),
         )
-        del ix
         self.W = self.W + Interc  # new canopy storage, mm
 
         Trfall = Prec + Unload - Interc  # Throughfall to field layer or snowpack
@@ -555,12 +734,16 @@ class CanopyGrid:
         self.W = self.W - Evap
 
         """ Snowpack (in case no snow, all Trfall routed to floor) """
-        ix = np.where(T >= Tmelt)
-        Melt[ix] = np.minimum(self.SWEi[ix], Kmelt[ix] * dt * (T[ix] - Tmelt))  # mm
-        del ix
-        ix = np.where(T < Tmelt)
-        Freeze[ix] = np.minimum(self.SWEl[ix], Kfreeze * dt * (Tmelt - T[ix]))  # mm
-        del ix
+        Melt = select(
+            T >= Tmelt,
+            lambda: np.minimum(self.SWEi, Kmelt * dt * (T - Tmelt)),
+            lambda: np.zeros_like(self.SWEi),
+        )  # mm
+        Freeze = select(
+            T < Tmelt,
+            lambda: np.minimum(self.SWEl, Kfreeze * dt * (Tmelt - T)),
+            lambda: np.zeros_like(self.SWEl),
+        )  # mm
 
         # amount of water as ice and liquid in snowpack
         Sice = np.maximum(0.0, self.SWEi + fS * Trfall + Freeze - Melt)
@@ -576,27 +759,7 @@ class CanopyGrid:
 
         # mass-balance error mm
         MBE = (self.W + self.SWE) - (Wo + SWEo) - (Prec - Evap - PotInf)
-
-        # MBEsnow = self.SWE - SWEo - (Trfall - PotInf)
-        #        if np.nanmax(MBEsnow) > 0.1:
-        #            print('MBEsnow', MBEsnow)
-        #            print('Freeze', Freeze)
-        #            print('melt', Melt)
-        #            print('Potinf', PotInf)
-        #            print('Trfall', Trfall)
-        #            print('SWE', self.SWE)
-        #            print('SWo', SWEo)
-        #            print('dSWE', self.SWE-SWEo)
-        #            print('T', T)
-        #            print('fS', fS)
-        #            print('fW', fW)
-        #        MBEcan = (self.W - Wo) - (Interc - Evap - Unload)
-        #        if np.nanmax(MBEcan) > 0.1:
-        #            print('Mbecan', MBEcan)
-        #            print('Unload', Unload)
-        #            print('dW', dW)
-
-        return PotInf, Trfall, Evap, Interc, MBE, erate, Unload, fS + fW
+        return PotInf, Trfall, Evap, Interc, MBE, Unload
 
     def create_outarrays(self, nrounds, ndays, ncols):
         self.intercs = np.zeros((nrounds, ndays, ncols), dtype=float)
@@ -616,6 +779,10 @@ class CanopyGrid:
         )
 
     def update_outarrays(self, scen, d, interc, evap, ET, transpi, efloor, SWE):
+        """
+        Stores the fluxes of day d, scen index of the scenario or slice(None) for all
+        scenarios of a grid of shape (nscens, ncols)
+        """
         self.intercs[scen, d, :] = interc
         self.evaps[scen, d, :] = evap
         self.ETs[scen, d, :] = ET
@@ -637,6 +804,16 @@ class CanopyGrid:
 
 
 # @staticmethod
+def select(cond, value, other):
+    """
+    np.where(cond, value(), other()) that evaluates only the branch in use when cond is the same
+    in the whole grid, e.g. a scalar air temperature
+    """
+    if np.ndim(cond) == 0:
+        return value() if cond else other()
+    return np.where(cond, value(), other())
+
+
 def degreeDays(dd0, T, Tbase, doy):
     """
     Calculates degree-day sum from the current mean Tair.
@@ -709,7 +886,7 @@ def e_sat(T, P=101300):
 
 
 # @staticmethod
-def penman_monteith(AE, D, T, Gs, Ga, P=101300.0, units="W"):
+def penman_monteith(AE, D, T, Gs, Ga, P=101300.0, units="W", esat=None):
     """
     Computes latent heat flux LE (Wm-2) i.e evapotranspiration rate ET (mm/s)
     from Penman-Monteith equation
@@ -721,6 +898,8 @@ def penman_monteith(AE, D, T, Gs, Ga, P=101300.0, units="W"):
        Ga - aerodynamic conductance [ms-1]
        P - ambient pressure [Pa]
        units - W (Wm-2), mm (mms-1=kg m-2 s-1), mol (mol m-2 s-1)
+       esat - optional (s, g, L) precomputed at T: slope of sat. vapor pressure [Pa K-1],
+              psychrometric constant [Pa K-1] and latent heat of vaporization [J kg-1]
     OUTPUT:
        x - evaporation rate in 'units'
     """
@@ -728,8 +907,11 @@ def penman_monteith(AE, D, T, Gs, Ga, P=101300.0, units="W"):
     cp = 1004.67  # J kg-1 K-1
     rho = 1.25  # kg m-3
     Mw = 18e-3  # kg mol-1
-    _, s, g = e_sat(T, P)  # slope of sat. vapor pressure, psycrom const
-    L = 1e3 * (3147.5 - 2.37 * (T + 273.15))
+    if esat is None:
+        _, s, g = e_sat(T, P)  # slope of sat. vapor pressure, psycrom const
+        L = 1e3 * (3147.5 - 2.37 * (T + 273.15))
+    else:
+        s, g, L = esat  # precomputed at T
 
     x = (s * AE + rho * cp * Ga * D) / (s + g * (1.0 + Ga / Gs))  # Wm-2
 
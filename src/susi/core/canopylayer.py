@@ -11,6 +11,54 @@ from scipy.interpolate import interp1d
 from susi.core.allometry import Allometry
 from susi.core.susi_utils import assimilation_yr
 
+UPDATE_VARIABLES = (
+    "bmToStems",
+    "bmToBa",
+    "bmToHdom",
+    "bmToLAI",
+    "bmToLeafMass",
+    "bmToVol",
+    "bmToNdemand",
+    "bmToPdemand",
+    "bmToKdemand",
+    "bmToFinerootLitter",
+    "bmToNFineRootLitter",
+    "bmToPFineRootLitter",
+    "bmToKFineRootLitter",
+    "bmToWoodyLitter",
+    "bmToNWoodyLitter",
+    "bmToPWoodyLitter",
+    "bmToKWoodyLitter",
+    "bmToMortalityWoody",
+    "bmToNMortalityWoody",
+    "bmToPMortalityWoody",
+    "bmToKMortalityWoody",
+    "bmToMortalityFineRoot",
+    "bmToMortalityLeaves",
+    "bmToNMortalityFineRoot",
+    "bmToNMortalityLeaves",
+    "bmToPMortalityFineRoot",
+    "bmToPMortalityLeaves",
+    "bmToKMortalityFineRoot",
+    "bmToKMortalityLeaves",
+    "bmToYi",
+    "bmToNLeafDemand",
+    "bmToPLeafDemand",
+    "bmToKLeafDemand",
+)  # biomass keyed allometry in the annual update
+
+CUTTING_VARIABLES = (
+    "bmToFineRoots",
+    "bmToNFineRoots",
+    "bmToPFineRoots",
+    "bmToKFineRoots",
+    "bmToWoodyLoggingResidues",
+    "bmToNWoodyLoggingResidues",
+    "bmToPWoodyLoggingResidues",
+    "bmToKWoodyLoggingResidues",
+    "bmToBa",
+)  # biomass keyed allometry of the logging residues
+
 
 class Canopylayer:
     """
@@ -36,6 +84,8 @@ class Canopylayer:
         ixs,
         photopara,
         nut_stat,
+        column_groups=False,
+        table_cache=None,
     ):
         self.name = (
             name  # name of the canopy layer e.g. 'dominant', 'subdominant', etc.
@@ -47,6 +97,12 @@ class Canopylayer:
         self.photopara = photopara  # photosynthesis parameters for assimilation model (Mäkelä et al. 2008)
         self.nscens = nscens  # number of scenarion in the simulation
         self.yrs = yrs  # number od years in the simulation
+        self.column_groups = (
+            column_groups  # assimilation only in the columns with trees
+        )
+        self.tree_columns = np.sort(
+            np.concatenate([ixs[m][0] for m in nlyrs if m > 0] + [np.zeros(0, int)])
+        )  # columns of the groups that have this canopy layer
         self.remaining_share = np.ones(
             self.ncols
         )  # share of remaining stems after thinning 0...1
@@ -72,7 +128,7 @@ class Canopylayer:
                     mottipath + mottifile[ncanopy]
                 )  # mottifile where the allometry tables exist
                 self.allodic[ncanopy].motti_development(
-                    mfile, self.sfc
+                    mfile, self.sfc, cache=table_cache
                 )  # run the allometry; interpolation functions in the instance
                 self.tree_species[self.ixs[ncanopy]] = int(self.allodic[ncanopy].sp)
         self.initialize_domain(
@@ -307,6 +363,9 @@ class Canopylayer:
         ixs = self.ixs
         for m in self.nlyrs:
             if m > 0:
+                v = self.allodic[m].stacked(UPDATE_VARIABLES)(
+                    bm[ixs[m]]
+                )  # all biomass keyed variables with one interpolation
                 # print ('**********************')
                 # print (np.round(np.mean(self.allodic[m].allometry_f['bmToVol'](bm[ixs[m]])*self.stems),2))
                 # print (np.round(np.mean(self.allodic[m].allometry_f['ageToVol'](self.agearr[ixs[m]])*self.stems), 2))
@@ -316,48 +375,25 @@ class Canopylayer:
                 # print (self.stems)
                 # print ('**********************')
 
-                self.stems[ixs[m]] = (
-                    self.allodic[m].allometry_f["bmToStems"](bm[ixs[m]])
-                    * self.remaining_share[ixs[m]]
-                )
+                self.stems[ixs[m]] = v["bmToStems"] * self.remaining_share[ixs[m]]
 
-                self.basalarea[ixs[m]] = self.allodic[m].allometry_f["bmToBa"](
-                    bm[ixs[m]]
-                )
+                self.basalarea[ixs[m]] = v["bmToBa"]
                 self.biomass[ixs[m]] = bm[ixs[m]]
-                self.hdom[ixs[m]] = self.allodic[m].allometry_f["bmToHdom"](bm[ixs[m]])
-                self.leafarea[ixs[m]] = self.allodic[m].allometry_f["bmToLAI"](
-                    bm[ixs[m]]
-                )
-                self.leafmass[ixs[m]] = self.allodic[m].allometry_f["bmToLeafMass"](
-                    bm[ixs[m]]
-                )
+                self.hdom[ixs[m]] = v["bmToHdom"]
+                self.leafarea[ixs[m]] = v["bmToLAI"]
+                self.leafmass[ixs[m]] = v["bmToLeafMass"]
                 # self.volume[ixs[m]] = self.allodic[m].allometry_f['bmToYi'](bm[ixs[m]])
-                self.volume[ixs[m]] = self.allodic[m].allometry_f["bmToVol"](bm[ixs[m]])
-                self.n_demand[ixs[m]] = self.allodic[m].allometry_f["bmToNdemand"](
-                    bm[ixs[m]]
-                )
-                self.p_demand[ixs[m]] = self.allodic[m].allometry_f["bmToPdemand"](
-                    bm[ixs[m]]
-                )
-                self.k_demand[ixs[m]] = self.allodic[m].allometry_f["bmToKdemand"](
-                    bm[ixs[m]]
-                )
+                self.volume[ixs[m]] = v["bmToVol"]
+                self.n_demand[ixs[m]] = v["bmToNdemand"]
+                self.p_demand[ixs[m]] = v["bmToPdemand"]
+                self.k_demand[ixs[m]] = v["bmToKdemand"]
                 self.logvolume[ixs[m]] = self.allodic[m].allometry_f["volToLogs"](
                     self.volume[ixs[m]]
                 )
-                self.finerootlitter[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToFinerootLitter"
-                ](bm[ixs[m]])
-                self.n_finerootlitter[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToNFineRootLitter"
-                ](bm[ixs[m]])
-                self.p_finerootlitter[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToPFineRootLitter"
-                ](bm[ixs[m]])
-                self.k_finerootlitter[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToKFineRootLitter"
-                ](bm[ixs[m]])
+                self.finerootlitter[ixs[m]] = v["bmToFinerootLitter"]
+                self.n_finerootlitter[ixs[m]] = v["bmToNFineRootLitter"]
+                self.p_finerootlitter[ixs[m]] = v["bmToPFineRootLitter"]
+                self.k_finerootlitter[ixs[m]] = v["bmToKFineRootLitter"]
 
                 self.nonwoodylitter[ixs[m]] = (
                     self.finerootlitter[ixs[m]] + self.leaf_litter[ixs[m]]
@@ -375,67 +411,39 @@ class Canopylayer:
                 self.pulpvolume[ixs[m]] = self.allodic[m].allometry_f["volToPulp"](
                     self.volume[ixs[m]]
                 )
-                self.woodylitter[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToWoodyLitter"
-                ](bm[ixs[m]])
-                self.n_woodylitter[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToNWoodyLitter"
-                ](bm[ixs[m]])
-                self.p_woodylitter[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToPWoodyLitter"
-                ](bm[ixs[m]])
-                self.k_woodylitter[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToKWoodyLitter"
-                ](bm[ixs[m]])
-
-                self.woody_litter_mort[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToMortalityWoody"
-                ](bm[ixs[m]])
-                self.n_woody_litter_mort[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToNMortalityWoody"
-                ](bm[ixs[m]])
-                self.p_woody_litter_mort[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToPMortalityWoody"
-                ](bm[ixs[m]])
-                self.k_woody_litter_mort[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToKMortalityWoody"
-                ](bm[ixs[m]])
-
-                self.non_woody_litter_mort[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToMortalityFineRoot"
-                ](bm[ixs[m]])
-                +self.allodic[m].allometry_f["bmToMortalityLeaves"](bm[ixs[m]])
-                self.n_non_woody_litter_mort[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToNMortalityFineRoot"
-                ](bm[ixs[m]])
-                +self.allodic[m].allometry_f["bmToNMortalityLeaves"](bm[ixs[m]])
-                self.p_non_woody_litter_mort[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToPMortalityFineRoot"
-                ](bm[ixs[m]])
-                +self.allodic[m].allometry_f["bmToPMortalityLeaves"](bm[ixs[m]])
-                self.k_non_woody_litter_mort[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToKMortalityFineRoot"
-                ](bm[ixs[m]])
-                +self.allodic[m].allometry_f["bmToKMortalityLeaves"](bm[ixs[m]])
-
-                self.yi[ixs[m]] = self.allodic[m].allometry_f["bmToYi"](bm[ixs[m]])
-
-                self.basNdemand[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToNLeafDemand"
-                ](bm[ixs[m]])
-                self.basPdemand[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToPLeafDemand"
-                ](bm[ixs[m]])
-                self.basKdemand[ixs[m]] = self.allodic[m].allometry_f[
-                    "bmToKLeafDemand"
-                ](bm[ixs[m]])
+                self.woodylitter[ixs[m]] = v["bmToWoodyLitter"]
+                self.n_woodylitter[ixs[m]] = v["bmToNWoodyLitter"]
+                self.p_woodylitter[ixs[m]] = v["bmToPWoodyLitter"]
+                self.k_woodylitter[ixs[m]] = v["bmToKWoodyLitter"]
+
+                self.woody_litter_mort[ixs[m]] = v["bmToMortalityWoody"]
+                self.n_woody_litter_mort[ixs[m]] = v["bmToNMortalityWoody"]
+                self.p_woody_litter_mort[ixs[m]] = v["bmToPMortalityWoody"]
+                self.k_woody_litter_mort[ixs[m]] = v["bmToKMortalityWoody"]
+
+                self.non_woody_litter_mort[ixs[m]] = v["bmToMortalityFineRoot"]
+                +v["bmToMortalityLeaves"]
+                self.n_non_woody_litter_mort[ixs[m]] = v["bmToNMortalityFineRoot"]
+                +v["bmToNMortalityLeaves"]
+                self.p_non_woody_litter_mort[ixs[m]] = v["bmToPMortalityFineRoot"]
+                +v["bmToPMortalityLeaves"]
+                self.k_non_woody_litter_mort[ixs[m]] = v["bmToKMortalityFineRoot"]
+                +v["bmToKMortalityLeaves"]
+
+                self.yi[ixs[m]] = v["bmToYi"]
+
+                self.basNdemand[ixs[m]] = v["bmToNLeafDemand"]
+                self.basPdemand[ixs[m]] = v["bmToPLeafDemand"]
+                self.basKdemand[ixs[m]] = v["bmToKLeafDemand"]
                 self.agearr[ixs[m]] = self.agearr[ixs[m]] + 1
                 # print ('vol')
                 # print (self.volume)
                 # print ('n stems')
                 # print (self.stems)
 
-    def assimilate(self, forc, wt, afp, previous_nut_stat, nut_stat, lai_above):
+    def assimilate(
+        self, forc, wt, afp, previous_nut_stat, nut_stat, lai_above, production=None
+    ):
         """
         Calls photosynthesis model (Mäkelä et al. 2008, standwise model) and leaf dynamics model that
         accounts for leaf mass, longevity and nutrient contents. This is a canopy model instance
@@ -455,6 +463,9 @@ class Canopylayer:
             DESCRIPTION. nutrient staus along the strip in the current year
         lai_above: TYPE: array
             DESCRIPTION, leaf area above the canopy layer incoming unit: m2 m-2
+        production: TYPE: tuple of arrays, optional
+            DESCRIPTION, NPP and potential NPP kg/ha/yr already computed for the canopy layer,
+            by default computed here
         Returns
         -------
         None.
@@ -464,9 +475,26 @@ class Canopylayer:
         """ Change unit of all variables to /tree """
         """ assimilation_yr function operates in /ha basis,"""
         lai_above = lai_above * 2  # lai_above is updated in stand object
-        self.NPP, self.NPP_pot = assimilation_yr(
-            self.photopara, forc, wt, afp, self.leafarea * 2 * self.stems, lai_above
-        )  # double sided LAI required
+        lai = self.leafarea * 2 * self.stems  # double sided LAI required
+        if production is not None:
+            self.NPP, self.NPP_pot = production
+        elif self.column_groups:
+            # without trees the leaf area is zero and so is the production
+            cols = self.tree_columns
+            self.NPP, self.NPP_pot = np.zeros(self.ncols), np.zeros(self.ncols)
+            if len(cols) > 0:
+                self.NPP[cols], self.NPP_pot[cols] = assimilation_yr(
+                    self.photopara,
+                    forc,
+                    np.asarray(wt)[:, cols],
+                    np.asarray(afp)[:, cols],
+                    lai[cols],
+                    lai_above[cols],
+                )
+        else:
+            self.NPP, self.NPP_pot = assimilation_yr(
+                self.photopara, forc, wt, afp, lai, lai_above
+            )
 
         self.NPP = (
             self.NPP * nut_stat / self.stems * 1.1
@@ -743,46 +771,31 @@ class Canopylayer:
             ixs = self.ixs
             for m in self.nlyrs:
                 if m > 0:
+                    v = self.allodic[m].stacked(CUTTING_VARIABLES)(self.biomass)
                     self.nonwoody_lresid[ixs[m]] = (
-                        self.new_lmass[ixs[m]]
-                        + self.allodic[m].allometry_f["bmToFineRoots"](self.biomass)
+                        self.new_lmass[ixs[m]] + v["bmToFineRoots"]
                     ) * self.stems
                     self.n_nonwoody_lresid[ixs[m]] = (
-                        self.N_leaf
-                        + self.allodic[m].allometry_f["bmToNFineRoots"](self.biomass)
+                        self.N_leaf + v["bmToNFineRoots"]
                     ) * self.stems
                     self.p_nonwoody_lresid[ixs[m]] = (
-                        self.P_leaf
-                        + self.allodic[m].allometry_f["bmToPFineRoots"](self.biomass)
+                        self.P_leaf + v["bmToPFineRoots"]
                     ) * self.stems
                     self.k_nonwoody_lresid[ixs[m]] = (
-                        self.K_leaf
-                        + self.allodic[m].allometry_f["bmToKFineRoots"](self.biomass)
+                        self.K_leaf + v["bmToKFineRoots"]
                     ) * self.stems
 
                     self.woody_lresid[ixs[m]] = (
-                        self.allodic[m].allometry_f["bmToWoodyLoggingResidues"](
-                            self.biomass
-                        )
-                        * self.stems
+                        v["bmToWoodyLoggingResidues"] * self.stems
                     )
                     self.n_woody_lresid[ixs[m]] = (
-                        self.allodic[m].allometry_f["bmToNWoodyLoggingResidues"](
-                            self.biomass
-                        )
-                        * self.stems
+                        v["bmToNWoodyLoggingResidues"] * self.stems
                     )
                     self.p_woody_lresid[ixs[m]] = (
-                        self.allodic[m].allometry_f["bmToPWoodyLoggingResidues"](
-                            self.biomass
-                        )
-                        * self.stems
+                        v["bmToPWoodyLoggingResidues"] * self.stems
                     )
                     self.k_woody_lresid[ixs[m]] = (
-                        self.allodic[m].allometry_f["bmToKWoodyLoggingResidues"](
-                            self.biomass
-                        )
-                        * self.stems
+                        v["bmToKWoodyLoggingResidues"] * self.stems
                     )
 
                     agearr[ixs[m]] = np.ones(self.ncols)[ixs[m]]
@@ -791,6 +804,7 @@ class Canopylayer:
         else:
             for m in self.nlyrs:
                 if m > 0:
+                    v = self.allodic[m].stacked(CUTTING_VARIABLES)(self.biomass)
                     print("******** Now cutting to: ", to_ba)
                     print(self.name)
                     print("basal area")
@@ -811,7 +825,7 @@ class Canopylayer:
                     print("Harvested volume ", np.mean(self.volume * cut_stems))
 
                     self.remaining_share = to_ba / (
-                        self.allodic[m].allometry_f["bmToBa"](self.biomass) * self.stems
+                        v["bmToBa"] * self.stems
                     )  # shate of stems remaining
 
                     print("remaining share")
@@ -824,65 +838,36 @@ class Canopylayer:
                         np.mean(self.new_lmass[ixs[m]] * cut_stems[ixs[m]])
                     )  # leaf logging residues
                     print(
-                        np.mean(
-                            self.allodic[m].allometry_f["bmToFineRoots"](
-                                self.biomass[ixs[m]]
-                            )
-                            * cut_stems[ixs[m]]
-                        )
+                        np.mean(v["bmToFineRoots"][ixs[m]] * cut_stems[ixs[m]])
                     )  # fine root logging residues
 
                     self.nonwoody_lresid[ixs[m]] = (
-                        self.new_lmass[ixs[m]]
-                        + self.allodic[m].allometry_f["bmToFineRoots"](
-                            self.biomass[ixs[m]]
-                        )
+                        self.new_lmass[ixs[m]] + v["bmToFineRoots"][ixs[m]]
                     ) * cut_stems[
                         ixs[m]
                     ]  # stemwise fineroot biomass multipled by number of cut stems
 
                     self.n_nonwoody_lresid[ixs[m]] = (
-                        self.N_leaf[ixs[m]]
-                        + self.allodic[m].allometry_f["bmToNFineRoots"](
-                            self.biomass[ixs[m]]
-                        )
+                        self.N_leaf[ixs[m]] + v["bmToNFineRoots"][ixs[m]]
                     ) * cut_stems[ixs[m]]
                     self.p_nonwoody_lresid[ixs[m]] = (
-                        self.P_leaf[ixs[m]]
-                        + self.allodic[m].allometry_f["bmToPFineRoots"](
-                            self.biomass[ixs[m]]
-                        )
+                        self.P_leaf[ixs[m]] + v["bmToPFineRoots"][ixs[m]]
                     ) * cut_stems[ixs[m]]
                     self.k_nonwoody_lresid[ixs[m]] = (
-                        self.K_leaf[ixs[m]]
-                        + self.allodic[m].allometry_f["bmToKFineRoots"](
-                            self.biomass[ixs[m]]
-                        )
+                        self.K_leaf[ixs[m]] + v["bmToKFineRoots"][ixs[m]]
                     ) * cut_stems[ixs[m]]
 
                     self.woody_lresid[ixs[m]] = (
-                        self.allodic[m].allometry_f["bmToWoodyLoggingResidues"](
-                            self.biomass[ixs[m]]
-                        )
-                        * cut_stems[ixs[m]]
+                        v["bmToWoodyLoggingResidues"][ixs[m]] * cut_stems[ixs[m]]
                     )
                     self.n_woody_lresid[ixs[m]] = (
-                        self.allodic[m].allometry_f["bmToNWoodyLoggingResidues"](
-                            self.biomass[ixs[m]]
-                        )
-                        * cut_stems[ixs[m]]
+                        v["bmToNWoodyLoggingResidues"][ixs[m]] * cut_stems[ixs[m]]
                     )
                     self.p_woody_lresid[ixs[m]] = (
-                        self.allodic[m].allometry_f["bmToPWoodyLoggingResidues"](
-                            self.biomass[ixs[m]]
-                        )
-                        * cut_stems[ixs[m]]
+                        v["bmToPWoodyLoggingResidues"][ixs[m]] * cut_stems[ixs[m]]
                     )
                     self.k_woody_lresid[ixs[m]] = (
-                        self.allodic[m].allometry_f["bmToKWoodyLoggingResidues"](
-                            self.biomass[ixs[m]]
-                        )
-                        * cut_stems[ixs[m]]
+                        v["bmToKWoodyLoggingResidues"][ixs[m]] * cut_stems[ixs[m]]
                     )
 
                     print("nonwoodylogging resids after adding")
@@ -5,15 +5,311 @@ Created on Wed Feb  9 10:41:03 2022
 @author: alauren
 """
 
+import copy
+import warnings
+from pathlib import Path
+
 import numpy as np
+from numpy.lib.format import open_memmap
 from scipy.interpolate import interp1d
 from scipy.sparse import diags
 
-from susi.core.susi_utils import peat_hydrol_properties, wrc
+from susi.core.susi_utils import LookupTable, peat_hydrol_properties, wrc
+from susi.core.table_cache import cached_tables
+
+
+def decompose_flows(M, rates, nutc, mu_k1, mu_k2, mu_k3, work):
+    """
+    Daily flows between the storages of Esom.decompose applied in place to M, without building the matrix.
+    Each storage is updated after all storages flowing from it, so the old values are still in place,
+    and the terms are summed in the order of the sparse matrix product: the results are identical.
+    Input:
+        M storages, shape (..., 11), any leading axes, e.g. (x, y) or (substances, x, y)
+        rates k1...k9, each broadcastable to M[..., 0]
+        nutc dict of release modifiers k1, k2, k6, broadcastable to M[..., 0]
+        mu_k1, mu_k2, mu_k3 lignin corrections
+        work preallocated buffer of shape (3,) + M[..., 0].shape, the only temporary storage
+    """
+    acc, c, p = work
+    n1, n2, n6 = nutc["k1"], nutc["k2"], nutc["k6"]
+    k1, k2, k3, k4, k5, k6, k7, k8, k9 = rates
+
+    # Out: cumulative output from LL, LW, FL, FW, H, P1, P2, P3
+    np.multiply(n1, k1, out=c)
+    np.multiply(c, M[..., 2], out=acc)  # from LL
+    c *= mu_k1
+    np.multiply(c, M[..., 3], out=p)  # from LW
+    acc += p
+    np.multiply(n2, k2, out=c)
+    np.multiply(c, M[..., 4], out=p)  # from FL
+    acc += p
+    c *= mu_k2
+    np.multiply(c, M[..., 5], out=p)  # from FW
+    acc += p
+    for k, s in ((k6, 6), (k7, 7), (k8, 8), (k9, 9)):  # from H, P1, P2, P3
+        np.multiply(n6, k, out=c)
+        np.multiply(c, M[..., s], out=p)
+        acc += p
+    M[..., 10] += acc
+
+    # P1, P2, P3 staying fraction
+    for k, s in ((k7, 7), (k8, 8), (k9, 9)):
+        np.multiply(n6, k, out=c)
+        np.subtract(1.0, c, out=c)
+        M[..., s] *= c
+
+    # H from FL and FW
+    np.add(k4, k5, out=c)
+    np.multiply(c, M[..., 4], out=acc)
+    np.multiply(c, M[..., 5], out=p)
+    acc += p
+    np.multiply(n6, k6, out=c)
+    np.subtract(1.0, c, out=c)
+    M[..., 6] *= c
+    M[..., 6] += acc
+
+    # FW from LW
+    np.multiply(n2, k2, out=c)
+    c *= mu_k2
+    c += k4
+    c += k5
+    np.subtract(1.0, c, out=c)
+    M[..., 5] *= c
+    np.multiply(k3, mu_k3, out=c)
+    c *= M[..., 3]
+    M[..., 5] += c
+
+    # FL from LL
+    np.multiply(n2, k2, out=c)
+    c += k4
+    c += k5
+    np.subtract(1.0, c, out=c)
+    M[..., 4] *= c
+    np.multiply(k3, M[..., 2], out=c)
+    M[..., 4] += c
+
+    # LW from L0W
+    np.multiply(n1, k1, out=c)
+    c *= mu_k1
+    np.multiply(k3, mu_k3, out=p)
+    c += p
+    np.subtract(1.0, c, out=c)
+    M[..., 3] *= c
+    M[..., 3] += M[..., 1]
+
+    # LL from L0L
+    np.multiply(n1, k1, out=c)
+    c += k3
+    np.subtract(1.0, c, out=c)
+    M[..., 2] *= c
+    M[..., 2] += M[..., 0]
+
+    M[..., :2] = 0.0  # litter inputs are moved to L
+    return M
+
+
+def flow_coefficients(rates, nutc, mu_k1, mu_k2, mu_k3):
+    """
+    The coefficients of the flows of decompose_flows that depend only on the rates, for apply_flows.
+    Computed with the same operations as in decompose_flows, so that apply_flows gives identical results.
+    Input as in decompose_flows, with any leading axes in the rates, e.g. (days, substances, x, y)
+    Returns tuple of arrays, leading shape of rates and nutc broadcast together +
+        (8,) release to Out from LL, LW, FL, FW, H, P1, P2, P3
+        (8,) staying fraction of the same storages
+        (4,) flows LL to FL, LW to FW, FL to H and FW to H per unit storage
+    """
+    k1, k2, k3, k4, k5, k6, k7, k8, k9 = rates
+    n1k1 = nutc["k1"] * k1
+    n2k2 = nutc["k2"] * k2
+    out = [n1k1, n1k1 * mu_k1, n2k2, n2k2 * mu_k2] + [
+        nutc["k6"] * k for k in (k6, k7, k8, k9)
+    ]
+    loss = [
+        n1k1 + k3,
+        n1k1 * mu_k1 + k3 * mu_k3,
+        n2k2 + k4 + k5,
+        n2k2 * mu_k2 + k4 + k5,
+    ] + out[4:]
+    to_humus = k4 + k5
+    transfer = [k3, k3 * mu_k3, to_humus, to_humus]
+    out, loss, transfer = (
+        np.stack(np.broadcast_arrays(*c), axis=-1) for c in (out, loss, transfer)
+    )
+    return out, np.subtract(1.0, loss, out=loss), transfer
+
+
+def apply_flows(M, coefficients, work):
+    """
+    Daily flows of decompose_flows applied in place to M with the coefficients of one day from
+    flow_coefficients. The storages L, F, H and P are updated together, the results are identical.
+        M storages, shape (..., 11)
+        work preallocated buffers of shapes M[..., 0].shape + (8,) and M[..., 0].shape + (4,)
+    """
+    out, stay, transfer = coefficients
+    release, flow = work
+    np.multiply(out, M[..., 2:10], out=release)
+    np.add.accumulate(
+        release, axis=-1, out=release
+    )  # summed in the order of decompose_flows
+    M[..., 10] += release[..., 7]
+    np.multiply(transfer, M[..., 2:6], out=flow)  # from the old storages
+    M[..., 2:10] *= stay
+    M[..., 2:4] += M[..., :2]  # LL from L0L, LW from L0W
+    M[..., 4:6] += flow[..., :2]  # FL from LL, FW from LW
+    flow[..., 2] += flow[..., 3]
+    M[..., 6] += flow[..., 2]  # H from FL and FW
+    M[..., :2] = 0.0  # litter inputs are moved to L
+    return M
+
+
+def transfer_matrices(rates, nutc, mu_k1, mu_k2, mu_k3, shape):
+    """
+    Daily transfer matrices K of the storages with the rates k1...k9, so that M(t+1) = K M(t).
+    Column j is the result of decompose_flows for a unit mass in storage j.
+        shape leading shape of the storages, e.g. (x, y) or (substances, x, y), other input as in decompose_flows
+    Returns array of shape + (11, 11)
+    """
+    unit = np.zeros((11,) + tuple(shape) + (11,))
+    for j in range(11):
+        unit[j, ..., j] = 1.0  # unit mass in storage j
+    decompose_flows(
+        unit, rates, nutc, mu_k1, mu_k2, mu_k3, np.empty((3, 11) + tuple(shape))
+    )
+    return np.moveaxis(unit, 0, -1)
+
+
+def rate_blocks(rates, tolerance, breaks=(243,), max_length=60):
+    """
+    Groups the days of the year into blocks of consecutive days that can be advanced with constant rates.
+    A block grows as long as the sum over its days of the departure of each rate from its value on the
+    first day stays below tolerance: at most that fraction of a storage is moved on another day than in
+    the daily steps. A new block starts also on each day in breaks, e.g. the litter input.
+        rates k1...k9 for each day, each array (days, x, y)
+        max_length longest block, days
+    Returns list of (start, stop) day indices
+    """
+    days = len(rates[0])
+    r = np.stack(rates, axis=1).reshape(days, -1)
+    blocks = []
+    start = 0
+    while start < days:
+        stop = min([b for b in breaks if b > start] + [days, start + max_length])
+        departure = np.max(
+            np.cumsum(np.abs(r[start + 1 : stop] - r[start]), axis=0), axis=1
+        )
+        end = start + 1 + np.searchsorted(departure, tolerance, side="right")
+        blocks.append((start, end))
+        start = end
+    return blocks
+
+
+def transfer_basis(nutc, mu_k1, mu_k2, mu_k3):
+    """
+    The transfer matrix is linear in the rates: K = K0 + sum_i k_i B_i.
+    Returns K0, array shape + (11, 11), and B, array (9,) + shape + (11, 11),
+    where shape is the shape of the release modifiers in nutc
+    """
+    shape = np.shape(nutc["k1"])
+    K0 = transfer_matrices([0.0] * 9, nutc, mu_k1, mu_k2, mu_k3, shape)
+    B = np.array(
+        [
+            transfer_matrices(np.eye(9)[i], nutc, mu_k1, mu_k2, mu_k3, shape) - K0
+            for i in range(9)
+        ]
+    )
+    return K0, B
+
+
+def decompose_blocks(M, rates, blocks, basis, L0L, L0W, litter_day=243):
+    """
+    Advances the storages M in place over the blocks of days from rate_blocks: each block is one step with
+    the matrix power of the transfer matrix of the mean rates in the block. The matrices and their powers
+    are computed for all blocks at once. The litter input is located to M in the beginning of the block
+    starting on litter_day, as in the daily loop.
+        basis (K0, B) of the transfer matrices from transfer_basis
+    Returns the storages at the block boundaries, array (len(blocks) + 1,) + M.shape
+    """
+    starts = np.array([start for start, _ in blocks])
+    lengths = np.array([stop - start for start, stop in blocks])
+    lead = M.shape[:-1]  # shape of the storages without the storage axis
+    mean_rates = np.add.reduceat(
+        np.stack(rates, axis=1), starts, axis=0
+    ) / lengths.reshape(-1, 1, 1, 1)  # (blocks, 9, x, y)
+
+    K0, B = basis
+    K = np.broadcast_to(K0, (len(blocks),) + lead + (11, 11)).copy()
+    for i in range(9):
+        k = mean_rates[:, i].reshape(
+            (len(blocks),) + (1,) * (len(lead) - 2) + mean_rates.shape[2:] + (1, 1)
+        )
+        K += k * B[i]
+
+    # Matrix powers K**length of all blocks by repeated squaring
+    P = np.broadcast_to(np.eye(11), K.shape).copy()
+    exponents = lengths.copy()
+    while exponents.any():
+        odd = exponents % 2 == 1
+        P[odd] = np.matmul(P[odd], K[odd])
+        exponents //= 2
+        K = np.matmul(K, K)
+
+    states = np.empty((len(blocks) + 1,) + M.shape)
+    states[0] = M
+    for b, start in enumerate(starts):
+        if start == litter_day:
+            M[..., 0] = L0L
+            M[..., 1] = L0W
+        M[:] = np.matmul(P[b], M[..., np.newaxis])[..., 0]  # step over the block
+        states[b + 1] = M
+    return states
+
+
+def interpolate_blocks(blocks, states, daily):
+    """
+    Daily values between the states at the block boundaries by linear interpolation,
+    written to daily, an array with the days of the year on the first axis
+    """
+    for b, (start, stop) in enumerate(blocks):
+        frac = np.arange(1, stop - start + 1) / (stop - start)
+        frac = frac.reshape((-1,) + (1,) * (states.ndim - 1))
+        daily[start:stop] = states[b] + frac * (states[b + 1] - states[b])
+
+
+def interpolate_output(blocks, states, rates, basis, daily):
+    """
+    Daily cumulative output (storage 10) inside the blocks of decompose_blocks: the output of each block
+    is divided to its days in proportion to the daily release with the daily rates from the storages in the
+    beginning of the block, linearly if there is no release. Written to daily, array (days,) + M.shape[:-1]
+    """
+    starts = np.array([start for start, _ in blocks])
+    lengths = np.array([stop - start for start, stop in blocks])
+    block = np.repeat(np.arange(len(blocks)), lengths)  # block of each day
+    lead = states.shape[1:-1]
+    _, B = basis
+    B = B[..., 10, :]
+    B = B.reshape(B.shape[:1] + (1,) * (len(lead) + 2 - B.ndim) + B.shape[1:])
+    release = np.sum(
+        B * states[:-1, np.newaxis], axis=-1
+    )  # release per unit rate in each block, (blocks, 9) + lead
+    r = np.stack(rates, axis=1)
+    r = r.reshape(r.shape[:2] + (1,) * (len(lead) - 2) + r.shape[2:])
+    weight = np.sum(r * release[block], axis=1)  # daily release, (days,) + lead
+    cumulative = np.cumsum(weight, axis=0)
+    before = np.concatenate([np.zeros((1,) + lead), cumulative[starts[1:] - 1]])
+    total = cumulative[starts + lengths - 1] - before
+    linear = (np.arange(len(block)) - starts[block] + 1) / lengths[block]
+    linear = linear.reshape((-1,) + (1,) * len(lead))
+    frac = np.where(
+        total[block] > 0.0,
+        (cumulative - before[block]) / np.where(total > 0.0, total, 1.0)[block],
+        linear,
+    )
+    out = states[..., 10]
+    daily[: len(block)] = out[block] + frac * (out[block + 1] - out[block])
 
 
 class Esom:
-    def __init__(self, spara, sfc, days, substance="Mass"):
+    def __init__(self, spara, sfc, days, substance="Mass", nscens=1):
         # =============================================================================
         #         Input
         #             shape_area shape of the computation domain, tuple (x, y)
@@ -21,6 +317,7 @@ class Esom:
         #             litter N content %
         #             sfc site fertility class, array of integers between 1 and 6, shape as shape_area
         #             days length of the simuilation in days to be used in the output array
+        #             nscens number of management scenarios in the x axis of the domain, decomposed together
         #             substance defines what is this instance for:
         #                                          can be 'Mass'              - organic matter decomposition
         #                                                   'N'               - nitrogen dynamics
@@ -28,7 +325,6 @@ class Esom:
         #                                                   'K'               - potassium dynamics
         #         TODO:
         #             change self.M update to only one place, so it can be called outside
-        #             create an initialization loop where mor layer M[2,3,4,5,6] are iterated with a given wt, temperature and litterfall
         #
         #        BEFORE CONTINUE: change initial values and layers boundaries, share between CO2 and DOC
 
@@ -117,7 +413,7 @@ class Esom:
         }  # pH according to site fertility class
 
         # ------------These from spara dictionary
-        x = 1
+        x = nscens  # management scenarios, decomposed together
         y = spara.n  # shape of the domain
         shape_area = (x, y)  # input shape
 
@@ -149,75 +445,58 @@ class Esom:
         self.bound2 = 0.4  # 0.5                                              # boundary between middle and bottom layers, m
         self.i = 0  # day counter
         self.x, self.y = shape_area  # shape of the computation domain
-        self.mass = np.zeros(
-            (self.x, self.y, 11, days)
-        )  # model output in four dimensions (area: x,y, storages 0:8, time)
+        self.days = days  # length of the simulation in days
+        self.cumulative_out = np.zeros(
+            (366, self.x, self.y)
+        )  # cumulative output (storage 10) on each day of the current year
+        self.history_dir = spara.esom_history_dir
+        self.history = (
+            None  # daily storages of the whole run on disk, if history_dir is set
+        )
+        self.runs = 0  # number of runs recorded to history_dir
+        self.decompose_mode = spara.esom_decompose_mode
+        self.rate_mode = spara.esom_rate_mode
+        self.step_mode = spara.esom_step_mode
+        self.step_tolerance = spara.esom_step_tolerance
+        self.work = np.empty(
+            (3, self.x, self.y)
+        )  # preallocated work buffer of the in-place decomposition kernel
         self.pH = np.zeros(shape_area)
         self.ash = np.ones(shape_area) * 5.0  # %
         self.litterN = np.ones(shape_area) * 1.2  # %
-        self.sfc = np.expand_dims(sfc, axis=0)
+        self.sfc = np.tile(sfc, (x, 1))  # site fertility class in each scenario
         self.reset_storages()
 
         #
         gwl = np.linspace(0, -6, 150)
-        pF, _ = peat_hydrol_properties(
-            self.bd[self.idtop], var="bd", ptype="A"
-        )  # peat hydraulic properties after Päivänen 1973
-        water_sto = [
-            sum(
-                wrc(pF, x=np.minimum(self.z[self.idtop] + g, 0.0)) * self.dz[self.idtop]
-            )
-            for g in gwl
-        ]  # equilibrium head m
-        volume_fraction_of_air = (water_sto[0] - water_sto) / water_sto[0]
-        self.wtToVfAir_top = interp1d(
+        tables = cached_tables(
+            spara,
+            "esom",
+            {
+                "bd": self.bd,
+                "z": self.z,
+                "dz": self.dz,
+                "bound1": self.bound1,
+                "bound2": self.bound2,
+            },
+            lambda: self.build_hydraulic_tables(gwl),
+        )  # same for all substances, reused from the cache for identical profiles
+        self.wtToVfAir_top = LookupTable(
             gwl,
-            volume_fraction_of_air,
-            fill_value=(volume_fraction_of_air[0], volume_fraction_of_air[-1]),
-            bounds_error=False,
+            tables["vfair_top"],
+            fill_value=(tables["vfair_top"][0], tables["vfair_top"][-1]),
         )
-
-        pF, _ = peat_hydrol_properties(
-            self.bd[self.idmiddle], var="bd", ptype="A"
-        )  # peat hydraulic properties after Päivänen 1973
-        water_sto = [
-            sum(
-                wrc(pF, x=np.minimum(self.z[self.idmiddle] + g, 0.0))
-                * self.dz[self.idmiddle]
-            )
-            for g in gwl
-        ]  # equilibrium head m
-        water_sto
-        volume_fraction_of_air = (water_sto[0] - water_sto) / water_sto[0]
-        self.wtToVfAir_middle = interp1d(
+        self.wtToVfAir_middle = LookupTable(
             gwl,
-            volume_fraction_of_air,
-            fill_value=(volume_fraction_of_air[0], volume_fraction_of_air[-1]),
-            bounds_error=False,
+            tables["vfair_middle"],
+            fill_value=(tables["vfair_middle"][0], tables["vfair_middle"][-1]),
         )
-
-        pF, _ = peat_hydrol_properties(
-            self.bd[self.idbottom], var="bd", ptype="A"
-        )  # peat hydraulic properties after Päivänen 1973
-        water_sto = [
-            sum(
-                wrc(pF, x=np.minimum(self.z[self.idbottom] + g, 0.0))
-                * self.dz[self.idbottom]
-            )
-            for g in gwl
-        ]  # equilibrium head m
-        water_sto
-        volume_fraction_of_air = (water_sto[0] - water_sto) / water_sto[0]
-        self.wtToVfAir_bottom = interp1d(
+        self.wtToVfAir_bottom = LookupTable(
             gwl,
-            volume_fraction_of_air,
-            fill_value=(volume_fraction_of_air[0], volume_fraction_of_air[-1]),
-            bounds_error=False,
+            tables["vfair_bottom"],
+            fill_value=(tables["vfair_bottom"][0], tables["vfair_bottom"][-1]),
         )
-
-        self.pF, _ = peat_hydrol_properties(
-            self.bd, var="bd", ptype="A"
-        )  # peat hydraulic properties after Päivänen 1973
+        self.pF = tables["pF"]  # peat hydraulic properties after Päivänen 1973
 
         # temperature_functions:
         self.t2 = interp1d(
@@ -317,10 +596,38 @@ class Esom:
         self.mu_k1 = 0.092 * (lignin / nitrogen) ** -0.7396 * adjust
         self.mu_k2 = 0.0027 * (lignin / nitrogen) ** -0.3917 * adjust
         self.mu_k3 = 0.062 * (lignin / nitrogen) ** -0.3972 * adjust
+        self.transfer_basis = transfer_basis(
+            self.nutc, self.mu_k1, self.mu_k2, self.mu_k3
+        )  # transfer matrix as a function of the rates, for the steps over several days
         # return  mu_k1, mu_k2, mu_k3
         self.out_root_lyr = np.zeros(self.y)
         self.out_below_root_lyr = np.zeros(self.y)
 
+    def build_hydraulic_tables(self, gwl):
+        """
+        Volume fraction of air in the top, middle and bottom peat layers as a function of
+        water table depth gwl, and the water retention parameters of the peat profile
+        """
+        tables = {}
+        for name, idx in (
+            ("top", self.idtop),
+            ("middle", self.idmiddle),
+            ("bottom", self.idbottom),
+        ):
+            pF, _ = peat_hydrol_properties(
+                self.bd[idx], var="bd", ptype="A"
+            )  # peat hydraulic properties after Päivänen 1973
+            water_sto = [
+                sum(wrc(pF, x=np.minimum(self.z[idx] + g, 0.0)) * self.dz[idx])
+                for g in gwl
+            ]  # equilibrium head m
+            tables["vfair_" + name] = (water_sto[0] - water_sto) / water_sto[0]
+
+        tables["pF"], _ = peat_hydrol_properties(
+            self.bd, var="bd", ptype="A"
+        )  # peat hydraulic properties after Päivänen 1973
+        return tables
+
     def reset_storages(self):
         # initial values for the storages -> make these to dictionary and input values
         self.previous_mass = np.zeros(self.y)
@@ -455,7 +762,7 @@ class Esom:
 
         k1 = (
             (0.002 + 0.00009 * self.ash + 0.003 * self.litterN)
-            * min(0.1754 * np.exp(0.0871 * tair), 1.0)
+            * np.minimum(0.1754 * np.exp(0.0871 * tair), 1.0)
             * self.phi1236(wn)
             * nu
         )  # adjusted decomposition rates
@@ -593,51 +900,27 @@ class Esom:
         self.M = np.reshape(M_tmp, (self.x, self.y, 11))
         return self.M
 
-    def run_yr(
-        self, weather, df_peat_temperatures, water_tables, nonwoodylitter, woodylitter
-    ):
-        self.ini_i = self.i  # Day calculator, set the first day of the year
-        P1_ini = (
-            self.M[:, :, 7] * 10000.0
-        )  # top layer peat mass in the in the beginning of yr
-        P2_ini = (
-            self.M[:, :, 8] * 10000.0
-        )  # middle layer peat mass in the in the beginning of yr
-        P3_ini = (
-            self.M[:, :, 9] * 10000.0
-        )  # bottom layer peat mass in the in the beginning of yr
-
-        L0L = np.zeros(
-            (self.x, self.y)
-        )  # Litterfall time series (leaf & fineroots), kg m-2, along the strip
-        L0L[0, :] = (
-            nonwoodylitter  # Leaf and fine root litter, kg m-2, locate the litter to array
-        )
-        self.nonwoodylitter = nonwoodylitter  # litter to instance variables
-        self.woodylitter = woodylitter  # litter to instance variables
-
-        L0W = np.zeros(
-            (self.x, self.y)
-        )  # Litterfall time series (woody litter), kg m-2, empty strip shape array
-        L0W[0, :] = (
-            woodylitter  # Leaf and fine root litter, kg m-2, locate the intput to arrays
+    def decompose_inplace(self, k1, k2, k3, k4, k5, k6, k7, k8, k9, M):
+        """
+        Same flows as in decompose, applied directly to the storages of M with decompose_flows.
+        Only the preallocated work buffer is used as temporary storage, the results are identical.
+        """
+        return decompose_flows(
+            M,
+            (k1, k2, k3, k4, k5, k6, k7, k8, k9),
+            self.nutc,
+            self.mu_k1,
+            self.mu_k2,
+            self.mu_k3,
+            self.work,
         )
-        air_ts = weather["T"].values  # Daily air temperatures, deg C
-        tp_top_ts = df_peat_temperatures.iloc[
-            :, 2
-        ].values  # Peat temperature -0.125 m depth
-        tp_middle_ts = df_peat_temperatures.iloc[
-            :, 8
-        ].values  # Peat temperature -0.4 m depth
-
-        tp_bottom_ts = df_peat_temperatures.iloc[
-            :, 9
-        ].values  # Peat temperature -0.75 m depth
 
-        # tp_bottom_ts = df_peat_temperatures.iloc[:,15].values                      # Peat temperature -0.75 m depth
-
-        for n, (tair, tp_top, tp_middle, tp_bottom, wts) in enumerate(
-            zip(air_ts, tp_top_ts, tp_middle_ts, tp_bottom_ts, water_tables.values)
+    def daily_rates(self, air_ts, tp_top_ts, tp_middle_ts, tp_bottom_ts, wt_ts):
+        """
+        Decomposition rates k1...k9 day by day, yields a tuple for each day of the input time series
+        """
+        for tair, tp_top, tp_middle, tp_bottom, wts in zip(
+            air_ts, tp_top_ts, tp_middle_ts, tp_bottom_ts, wt_ts
         ):
             # Physical conditions in the peat profile
             wn = (
@@ -668,7 +951,86 @@ class Esom:
                 )
             except Exception as e:
                 print(f"fail in rates, esom run_yr. Error: {e}")
+            yield k1, k2, k3, k4, k5, k6, k7, k8, k9
 
+    def get_year_rates(self, air_ts, tp_top_ts, tp_middle_ts, tp_bottom_ts, wt_ts):
+        """
+        Decomposition rates k1...k9 for the whole year with vectorised calls, same values as daily_rates
+        Input:
+            air_ts air temperature, deg C, shape (days,)
+            tp_top_ts, tp_middle_ts, tp_bottom_ts peat temperatures, deg C, shape (days,) or (days, y),
+                or (days, x, 1) or (days, x, y) for each scenario
+            wt_ts water table depth, m, shape (days, y) or (days, x, y)
+        Output:
+            tuple of nine arrays of shape (days, x, y)
+        """
+        days = len(air_ts)
+
+        def day_axis(a):
+            a = np.asarray(a, dtype=float)
+            return a if a.ndim == 3 else a.reshape(days, 1, -1)
+
+        tair = day_axis(air_ts)
+        wts = day_axis(wt_ts)
+        wn = wrc(self.pF[0], wts) / wrc(
+            self.pF[0], -0.3
+        )  # Relative water content with respect to field capacity
+        H_w = wrc(self.pF[0], 0.0) - wrc(self.pF[0], wts)  # Air filled pore space
+        rates = self.get_rates(
+            tair,
+            day_axis(tp_top_ts),
+            day_axis(tp_middle_ts),
+            day_axis(tp_bottom_ts),
+            wn,
+            self.wtToVfAir_top(wts),
+            self.wtToVfAir_middle(wts),
+            self.wtToVfAir_bottom(wts),
+            H_w,
+        )
+        return tuple(np.broadcast_to(k, (days, self.x, self.y)) for k in rates)
+
+    def run_yr(
+        self,
+        weather,
+        df_peat_temperatures,
+        water_tables,
+        nonwoodylitter,
+        woodylitter,
+        column_temperatures=None,
+    ):
+        """
+        Decomposition of organic matter over one year
+            weather daily forcing of the year with air temperature "T", data frame or dict of arrays
+            df_peat_temperatures, water_tables daily data frames of the year, or for several
+                scenarios df_peat_temperatures array (x, days, nLyrs) and water_tables array (x, days, y)
+            nonwoodylitter, woodylitter annual litter input, kg m-2, (y,) or (x, y)
+            column_temperatures optional peat temperatures in each column, array (days, ncols, nLyrs)
+                or (x, days, ncols, nLyrs), used instead of the strip profile in df_peat_temperatures
+        """
+        L0L, L0W = self.begin_year(nonwoodylitter, woodylitter)
+        if self.step_mode == "blocks":
+            rates = self.get_year_rates(
+                *self.rate_inputs(
+                    weather, df_peat_temperatures, water_tables, column_temperatures
+                )
+            )
+            blocks = rate_blocks(rates, self.step_tolerance)
+            states = decompose_blocks(
+                self.M, rates, blocks, self.transfer_basis, L0L, L0W
+            )
+            interpolate_output(
+                blocks, states, rates, self.transfer_basis, self.cumulative_out
+            )
+            if self.history is not None:
+                interpolate_blocks(blocks, states, self.history[self.i :])
+            self.i += blocks[-1][1]  # day counter
+            self.end_year()
+            return
+
+        daily_rates = self.year_rates(
+            weather, df_peat_temperatures, water_tables, column_temperatures
+        )
+        for n, (k1, k2, k3, k4, k5, k6, k7, k8, k9) in enumerate(daily_rates):
             if n == 243:  # n is day of the year
                 self.M[:, :, 0] = (
                     L0L  # fresh litter leaves and fine roots, kg m-2, locate end of August
@@ -677,22 +1039,275 @@ class Esom:
                     L0W  # woody litter branches and coarse roots, kg m-2, locate end of August
                 )
 
-            self.M = self.decompose(k1, k2, k3, k4, k5, k6, k7, k8, k9, self.M)
-            self.mass[:, :, :, self.i] = self.M  # locate mass to output array
+            if self.decompose_mode == "inplace":
+                self.decompose_inplace(k1, k2, k3, k4, k5, k6, k7, k8, k9, self.M)
+            else:
+                self.M = self.decompose(k1, k2, k3, k4, k5, k6, k7, k8, k9, self.M)
+            self.cumulative_out[n] = self.M[:, :, 10]
+            if self.history is not None:
+                self.history[self.i] = self.M  # locate mass to output file
             self.i += 1  # day counter
+        self.end_year()
+
+    def transfer_matrix(self, rates):
+        """
+        Daily transfer matrix K of the storages with the rates k1...k9, so that M(t+1) = K M(t),
+        shape (x, y, 11, 11)
+        """
+        return transfer_matrices(
+            rates, self.nutc, self.mu_k1, self.mu_k2, self.mu_k3, (self.x, self.y)
+        )
+
+    def mean_rates(self, daily_rates):
+        """
+        Mean of the daily rates k1...k9 from year_rates, array (9, x, y)
+        """
+        return np.mean(
+            [
+                [np.broadcast_to(k, (self.x, self.y)) for k in rates]
+                for rates in daily_rates
+            ],
+            axis=0,
+        )
+
+    def steady_state(self, rates, nonwoodylitter, woodylitter, days=365):
+        """
+        Equilibrium of the mor storages LL, LW, FL, FW and H (storages 2...6) with constant daily rates
+        k1...k9 and the annual litter input spread evenly over the days: solves (I - K) M = L in each node,
+        where K is the daily transfer matrix between the mor storages and L the daily litter input.
+        The peat storages have no input and no equilibrium.
+        Returns the storages, array (x, y, 5), kg m-2
+        """
+        K = self.transfer_matrix(rates)
+        litter = np.zeros((self.x, self.y, 2))
+        litter[:, :, 0] = nonwoodylitter  # to L0L
+        litter[:, :, 1] = woodylitter  # to L0W
+        L = np.einsum("xyij,xyj->xyi", K[:, :, 2:7, :2], litter / days)
+        A = np.eye(5) - K[:, :, 2:7, 2:7]
+        return np.linalg.solve(A, L[..., np.newaxis])[..., 0]
+
+    def spin_up(
+        self,
+        weather,
+        df_peat_temperatures,
+        water_tables,
+        nonwoodylitter,
+        woodylitter,
+        column_temperatures=None,
+        tolerance=1.0e-9,
+        max_years=100,
+        depth=5,
+    ):
+        """
+        Periodic steady state of the mor storages (2...6) over the annual cycle of the year given
+        as in run_yr: the state in the beginning of the year that is repeated after one year of
+        decomposition and litter input. Instead of running the year again and again, the fixed point of
+        the annual map is found with Anderson acceleration, starting from steady_state with the mean rates.
+            tolerance max change of the storages over the year, kg m-2
+            max_years max number of annual cycles
+            depth number of previous years in the Anderson mixing
+        Returns the storages, array (x, y, 5), kg m-2, and the number of annual cycles
+        Warns if the storages still change more than tolerance after max_years
+        """
+        daily_rates = list(
+            self.year_rates(
+                weather, df_peat_temperatures, water_tables, column_temperatures
+            )
+        )
+        L0L = np.zeros((self.x, self.y))
+        L0L[:, :] = nonwoodylitter
+        L0W = np.zeros((self.x, self.y))
+        L0W[:, :] = woodylitter
+        M = np.zeros((self.x, self.y, 11))
+        work = np.empty((3, self.x, self.y))
+
+        def annual_map(mor):
+            M[:] = 0.0
+            M[:, :, 2:7] = mor.reshape(self.x, self.y, 5)
+            for n, rates in enumerate(daily_rates):
+                if n == 243:  # litter input at the end of August as in run_yr
+                    M[:, :, 0] = L0L
+                    M[:, :, 1] = L0W
+                decompose_flows(
+                    M, rates, self.nutc, self.mu_k1, self.mu_k2, self.mu_k3, work
+                )
+            return M[:, :, 2:7].ravel()
+
+        mor = self.steady_state(
+            self.mean_rates(daily_rates), nonwoodylitter, woodylitter, len(daily_rates)
+        ).ravel()
+        images, residuals = [], []
+        for year in range(1, max_years + 1):
+            image = annual_map(mor)
+            residual = image - mor
+            if np.max(np.abs(residual)) < tolerance:
+                break
+            images.append(image)
+            residuals.append(residual)
+            images, residuals = images[-depth - 1 :], residuals[-depth - 1 :]
+            if len(residuals) == 1:
+                mor = image  # plain annual cycle
+            else:
+                dF = np.diff(residuals, axis=0).T
+                dG = np.diff(images, axis=0).T
+                gamma = np.linalg.lstsq(dF, residual, rcond=None)[0]
+                mor = image - dG @ gamma  # Anderson mixing of the previous years
+        else:
+            warnings.warn(
+                f"Esom spin-up of {self.substance} did not converge in {max_years} years, "
+                f"max change of the storages {np.max(np.abs(residual)):.3g} kg m-2",
+                RuntimeWarning,
+                stacklevel=2,
+            )
+        return mor.reshape(self.x, self.y, 5), year
+
+    def initialize_mor(
+        self,
+        mode,
+        weather,
+        df_peat_temperatures,
+        water_tables,
+        nonwoodylitter,
+        woodylitter,
+        column_temperatures=None,
+    ):
+        """
+        Replaces the mor storages (2...6) of reset_storages with their equilibrium under the conditions
+        and litter input of the year, instead of a spin-up simulation of several decades.
+            mode 'steady_state' for the equilibrium with mean rates, 'spin_up' for the periodic
+            steady state over the annual cycle, other input as in run_yr
+        """
+        if mode == "spin_up":
+            mor, _ = self.spin_up(
+                weather,
+                df_peat_temperatures,
+                water_tables,
+                nonwoodylitter,
+                woodylitter,
+                column_temperatures,
+            )
+        else:
+            daily_rates = self.year_rates(
+                weather, df_peat_temperatures, water_tables, column_temperatures
+            )
+            mor = self.steady_state(
+                self.mean_rates(daily_rates), nonwoodylitter, woodylitter
+            )
+        self.M[:, :, 2:7] = (
+            mor  # in place, M can be a view to the state of EsomSubstances
+        )
+
+    def open_history(self):
+        """
+        Starts the record of the daily storages of a new run to history_dir/esom_<substance>_<run>.npy,
+        a memory mapped array of shape (days, x, y, 11) written day by day
+        """
+        Path(self.history_dir).mkdir(parents=True, exist_ok=True)
+        self.history = open_memmap(
+            Path(self.history_dir) / f"esom_{self.substance}_{self.runs}.npy",
+            mode="w+",
+            dtype=float,
+            shape=(self.days, self.x, self.y, 11),
+        )
+        self.runs += 1
+
+    def begin_year(self, nonwoodylitter, woodylitter):
+        """
+        Stores the peat storages in the beginning of the year and the annual litter input,
+        returns the litter input arrays (L0L, L0W) of shape (x, y), kg m-2
+        """
+        if self.i == 0 and self.history_dir is not None:
+            self.open_history()
+        self.ini_i = self.i  # Day calculator, set the first day of the year
+        self.P1_ini = (
+            self.M[:, :, 7] * 10000.0
+        )  # top layer peat mass in the in the beginning of yr
+        self.P2_ini = (
+            self.M[:, :, 8] * 10000.0
+        )  # middle layer peat mass in the in the beginning of yr
+        self.P3_ini = (
+            self.M[:, :, 9] * 10000.0
+        )  # bottom layer peat mass in the in the beginning of yr
+
+        L0L = np.zeros(
+            (self.x, self.y)
+        )  # Litterfall time series (leaf & fineroots), kg m-2, along the strip
+        L0L[:, :] = (
+            nonwoodylitter  # Leaf and fine root litter, kg m-2, (y,) or per scenario (x, y)
+        )
+        self.nonwoodylitter = nonwoodylitter  # litter to instance variables
+        self.woodylitter = woodylitter  # litter to instance variables
+
+        L0W = np.zeros(
+            (self.x, self.y)
+        )  # Litterfall time series (woody litter), kg m-2, empty strip shape array
+        L0W[:, :] = woodylitter  # Woody litter, kg m-2, (y,) or per scenario (x, y)
+        return L0L, L0W
+
+    def year_rates(
+        self, weather, df_peat_temperatures, water_tables, column_temperatures=None
+    ):
+        """
+        Decomposition rates k1...k9 of each day of the year, input as in run_yr
+        """
+        inputs = self.rate_inputs(
+            weather, df_peat_temperatures, water_tables, column_temperatures
+        )
+        if self.rate_mode == "year":
+            return zip(
+                *self.get_year_rates(*inputs)
+            )  # k1...k9 for all days of the year, each (days, x, y)
+        return self.daily_rates(*inputs)
+
+    def rate_inputs(
+        self, weather, df_peat_temperatures, water_tables, column_temperatures=None
+    ):
+        """
+        Daily air temperature, peat temperatures in the top, middle and bottom layers and water table
+        of the year as arrays, input as in run_yr
+        """
+        air_ts = np.asarray(weather["T"])  # Daily air temperatures, deg C
+        peat_temperatures = np.asarray(df_peat_temperatures)  # (days, nLyrs)
+        wts = np.asarray(water_tables)  # (days, y)
+        if wts.ndim == 3:  # scenarios first, (x, days, ...) -> (days, x, ...)
+            peat_temperatures = np.moveaxis(peat_temperatures, 0, 1)[
+                :, :, np.newaxis
+            ]  # (days, x, 1, nLyrs)
+            wts = np.moveaxis(wts, 0, 1)
+            if column_temperatures is not None:
+                column_temperatures = np.moveaxis(column_temperatures, 0, 1)
+        tp_top_ts = peat_temperatures[..., 2]  # Peat temperature -0.125 m depth
+        tp_middle_ts = peat_temperatures[..., 8]  # Peat temperature -0.4 m depth
+
+        tp_bottom_ts = peat_temperatures[..., 9]  # Peat temperature -0.75 m depth
+
+        # tp_bottom_ts = df_peat_temperatures.iloc[:,15].values                      # Peat temperature -0.75 m depth
+        if column_temperatures is not None:
+            tp_top_ts = column_temperatures[..., 2]  # (days, ncols) or (days, x, ncols)
+            tp_middle_ts = column_temperatures[..., 8]
+            tp_bottom_ts = column_temperatures[..., 9]
+
+        return air_ts, tp_top_ts, tp_middle_ts, tp_bottom_ts, wts
+
+    def end_year(self):
+        """
+        Annual output from the storages, after the daily loop
+        """
         self.end_i = self.i
+        if self.history is not None:
+            self.history.flush()
 
         self.out = self.M[:, :, 10] * 10000.0 - self.previous_mass
         self.previous_mass = self.M[:, :, 10] * 10000.0
-        self.P1_out = P1_ini - self.M[:, :, 7] * 10000.0
-        self.P2_out = P2_ini - self.M[:, :, 8] * 10000.0
-        self.P3_out = P3_ini - self.M[:, :, 9] * 10000.0
+        self.P1_out = self.P1_ini - self.M[:, :, 7] * 10000.0
+        self.P2_out = self.P2_ini - self.M[:, :, 8] * 10000.0
+        self.P3_out = self.P3_ini - self.M[:, :, 9] * 10000.0
         self.out_root_lyr = self.out - self.P2_out - self.P3_out
         self.out_below_root_lyr = self.P2_out + self.P3_out
 
         # return self.out
 
-    def compose_export(self, stp, df_peat_temperatures):
+    def compose_export(self, stp, df_peat_temperatures, column_temperatures=None):
         # To get total export, sum the left and right ditches
         # UPDATE THESE
         """
@@ -715,20 +1330,28 @@ class Esom:
         self.lmw_to_east = len(np.ravel(stp.ixeast))/stp.n * np.mean(self.lmwtoditch[0, np.ravel(stp.ixeast)])
         """
         mass_to_c = 0.5
-        peat_T = df_peat_temperatures.iloc[:, 2].values
-
-        doc = np.zeros((self.x, self.y))
-        for x in range(self.x):
-            for y in range(self.y):
-                doc[x, y] = (
-                    np.sum(
-                        0.066
-                        * np.exp(-0.061 * peat_T)
-                        * np.gradient(self.mass[x, y, 10, self.ini_i : self.end_i])
-                    )
-                    * 10000
-                    * mass_to_c
-                )
+        peat_T = np.asarray(df_peat_temperatures)[..., 2]  # (days,) or (x, days)
+        if column_temperatures is not None:
+            peat_T = np.swapaxes(
+                column_temperatures[..., 2], -1, -2
+            )  # (ncols, days) or (x, ncols, days)
+        elif peat_T.ndim == 2:
+            peat_T = peat_T[:, np.newaxis]  # (x, 1, days)
+
+        # Daily release of the year in all nodes at once, days as the last, contiguous axis:
+        # the sums are then the same as for each node separately
+        cumulative_out = np.ascontiguousarray(
+            np.moveaxis(self.cumulative_out[: self.end_i - self.ini_i], 0, -1)
+        )  # (..., x, y, days)
+        temperature_factor = 0.066 * np.exp(-0.061 * peat_T)
+        doc = (
+            np.sum(
+                temperature_factor * np.gradient(cumulative_out, axis=-1),
+                axis=-1,
+            )
+            * 10000
+            * mass_to_c
+        )
 
         lmwtohmwshare = 0.04
 
@@ -742,23 +1365,163 @@ class Esom:
         )  # biodegradation parameters from Kalbiz et al 2003
         self.lmwtoditch = self.lmw * np.exp(-0.15 * stp.residence_time)
         # print (hmw)
-        self.hmw_to_west = (
-            len(np.ravel(stp.ixwest))
-            / stp.n
-            * np.mean(self.hmwtoditch[0, np.ravel(stp.ixwest)])
-        )
-        self.hmw_to_east = (
-            len(np.ravel(stp.ixeast))
-            / stp.n
-            * np.mean(self.hmwtoditch[0, np.ravel(stp.ixeast)])
-        )
-        self.lmw_to_west = (
-            len(np.ravel(stp.ixwest))
-            / stp.n
-            * np.mean(self.lmwtoditch[0, np.ravel(stp.ixwest)])
-        )
-        self.lmw_to_east = (
-            len(np.ravel(stp.ixeast))
-            / stp.n
-            * np.mean(self.lmwtoditch[0, np.ravel(stp.ixeast)])
+        west = np.broadcast_to(
+            stp.west, self.hmwtoditch.shape
+        )  # the flow divide can differ between the scenarios
+        east = np.broadcast_to(stp.east, self.hmwtoditch.shape)
+
+        def ditch_mean(toditch, side):
+            return np.array([np.mean(t[c]) for t, c in zip(toditch, side)])
+
+        self.hmw_to_west = stp.west_share * ditch_mean(self.hmwtoditch, west)
+        self.hmw_to_east = stp.east_share * ditch_mean(self.hmwtoditch, east)
+        self.lmw_to_west = stp.west_share * ditch_mean(self.lmwtoditch, west)
+        self.lmw_to_east = stp.east_share * ditch_mean(self.lmwtoditch, east)
+
+    def scenario(self, r):
+        """
+        Results of scenario r as an instance with x = 1, for Outputs.write_esom and the other writers
+        """
+        view = copy.copy(
+            self
+        )  # shares the parameters, per-scenario arrays replaced below
+        view.x = 1
+        view.M = self.M[r : r + 1]
+        for name in (
+            "out",
+            "P1_out",
+            "P2_out",
+            "P3_out",
+            "out_root_lyr",
+            "out_below_root_lyr",
+            "nonwoodylitter",
+            "woodylitter",
+            "hmw",
+            "lmw",
+            "hmwtoditch",
+            "lmwtoditch",
+        ):
+            if hasattr(self, name):
+                value = np.broadcast_to(getattr(self, name), (self.x, self.y))
+                setattr(view, name, value[r : r + 1])
+        for name in ("hmw_to_west", "hmw_to_east", "lmw_to_west", "lmw_to_east"):
+            if hasattr(self, name):
+                setattr(view, name, np.broadcast_to(getattr(self, name), self.x)[r])
+        return view
+
+
+class EsomSubstances:
+    def __init__(self, spara, sfc, days, substances=("Mass", "N", "P", "K"), nscens=1):
+        """
+        Organic matter decomposition and nutrient release of several substances in one state array
+        of shape (substances, x, y, 11). The decomposition rates depend only on the weather, peat
+        temperature, water table and soil pH, which are the same for all substances: they are
+        computed once per year and only the release modifiers (nutc) differ between the substances.
+        Input as in Esom, substances tuple of the substance names
+        The Esom instance of each substance is available in self.substances[name] with M and
+        cumulative_out as views to the common arrays, to be used as before in the outputs and compose_export.
+        """
+        self.substances = {
+            substance: Esom(spara, sfc, days, substance=substance, nscens=nscens)
+            for substance in substances
+        }
+        self.members = list(self.substances.values())
+        first = self.members[0]
+        self.x, self.y = first.x, first.y
+        self.nutc = {
+            k: np.array([es.nutc[k] for es in self.members]).reshape(-1, 1, 1)
+            for k in ("k1", "k2", "k6")
+        }  # release modifiers of each substance, broadcast over the domain
+        self.transfer_basis = transfer_basis(
+            self.nutc, first.mu_k1, first.mu_k2, first.mu_k3
+        )
+        self.work = tuple(
+            np.empty((len(self.members), self.x, self.y, n)) for n in (8, 4)
+        )  # work buffers of apply_flows
+        self.cumulative_out = np.zeros(
+            (366, len(self.members), self.x, self.y)
+        )  # cumulative output of all substances on each day of the current year
+        for s, es in enumerate(self.members):
+            es.cumulative_out = self.cumulative_out[
+                :, s
+            ]  # the instance reads its own view
+        self.reset_storages()
+
+    def reset_storages(self):
+        for es in self.members:
+            es.reset_storages()
+        self.M = np.stack([es.M for es in self.members])
+        for es, M in zip(self.members, self.M):
+            es.M = M  # storages of the substance as a view to the common state
+
+    def update_soil_pH(self, increment):
+        for es in self.members:
+            es.update_soil_pH(increment)
+
+    def run_yr(
+        self,
+        weather,
+        df_peat_temperatures,
+        water_tables,
+        litter,
+        column_temperatures=None,
+    ):
+        """
+        Decomposition of all substances over one year
+            litter dict of substance name: (nonwoodylitter, woodylitter) annual litter input, kg m-2
+            other input as in Esom.run_yr
+        """
+        L0 = np.array(
+            [es.begin_year(*litter[name]) for name, es in self.substances.items()]
+        )  # (substances, 2, x, y)
+        first = self.members[0]
+        i = first.i
+        if first.step_mode == "blocks":
+            rates = first.get_year_rates(
+                *first.rate_inputs(
+                    weather, df_peat_temperatures, water_tables, column_temperatures
+                )
+            )  # common to all substances
+            blocks = rate_blocks(rates, first.step_tolerance)
+            states = decompose_blocks(
+                self.M, rates, blocks, self.transfer_basis, L0[:, 0], L0[:, 1]
+            )
+            interpolate_output(
+                blocks, states, rates, self.transfer_basis, self.cumulative_out
+            )
+            for s, es in enumerate(self.members):
+                if es.history is not None:
+                    interpolate_blocks(blocks, states[:, s], es.history[i:])
+                es.i = i + blocks[-1][1]
+                es.end_year()
+            return
+
+        inputs = first.rate_inputs(
+            weather, df_peat_temperatures, water_tables, column_temperatures
         )
+        mu = first.mu_k1, first.mu_k2, first.mu_k3
+        if first.rate_mode == "year":
+            rates = first.get_year_rates(*inputs)  # common to all substances
+            daily_coefficients = zip(
+                *flow_coefficients(
+                    [k[:, np.newaxis] for k in rates], self.nutc, *mu
+                )  # all days and substances at once, (days, substances, x, y, ...)
+            )
+        else:
+            daily_coefficients = (
+                flow_coefficients(rates, self.nutc, *mu)
+                for rates in first.daily_rates(*inputs)
+            )
+        for n, coefficients in enumerate(daily_coefficients):
+            if n == 243:  # n is day of the year
+                self.M[..., 0] = L0[:, 0]  # fresh litter, locate end of August
+                self.M[..., 1] = L0[:, 1]  # woody litter, locate end of August
+            apply_flows(self.M, coefficients, self.work)
+            self.cumulative_out[n] = self.M[..., 10]
+            for es in self.members:
+                if es.history is not None:
+                    es.history[i] = es.M  # locate mass to output file
+            i += 1  # day counter
+        for es in self.members:
+            es.i = i
+            es.end_year()
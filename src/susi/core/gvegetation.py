@@ -8,6 +8,83 @@ Created on Thu Feb  3 15:32:24 2022
 import numpy as np
 from pyproj import CRS, Transformer
 
+# Ground vegetation models from Muukkonen & Mäkipää 2006 BER vol 11, Tables 6,7,8:
+# biomass = square(sum of terms) - 0.5 + constant. Terms are (coefficient, variable, variable)
+# multiplied from left to right and summed in the order of the equation. Site variables
+# (one, lon, lat, dem, sfc, drain_s, drain_s2) are constant in time, the others change annually.
+GV_EQUATIONS = {
+    "spruce_mire": {
+        "tot": (
+            116.54,
+            [
+                (35.52, "one", "one"),
+                (0.001, "lon", "dem"),
+                (-1.1, "drain_s2", "one"),
+                (-2e-5, "vol", "stems"),
+                (4e-5, "stems", "age"),
+                (0.139, "lon", "drain_s"),
+            ],
+        ),  # Total, Eq.39, Table 9
+        "bot": (
+            98.10,
+            [
+                (-3.182, "one", "one"),
+                (0.022, "lat", "lon"),
+                (2e-4, "dem", "age"),
+                (-0.077, "sfc", "lon"),
+                (-0.003, "lon", "vol"),
+                (2e-4, "vol2", "one"),
+            ],
+        ),  # Bottom layer total, Eq. 35, Table 9
+        "field": (
+            162.58,
+            [
+                (23.24, "one", "one"),
+                (-1.163, "drain_s2", "one"),
+                (1.515, "sfc", "drain_s"),
+                (-2e-5, "vol", "stems"),
+                (8e-5, "ts", "age"),
+                (1e-5, "stems", "dem"),
+            ],
+        ),  # Field layer total, Eq. 37, Table 9
+    },
+    "pine_bog": {
+        "tot": (
+            167.40,
+            [
+                (50.098, "one", "one"),
+                (0.005, "lon", "dem"),
+                (-1e-5, "vol", "stems"),
+                (0.026, "sfc", "age"),
+                (-1e-4, "dem", "ts"),
+                (-0.014, "vol", "drain_s"),
+            ],
+        ),  # Total, Eq 45, Table 9
+        "bot": (
+            222.22,
+            [
+                (31.809, "one", "one"),
+                (0.008, "lon", "dem"),
+                (-3e-4, "stems", "ba"),
+                (6e-5, "stems", "age"),
+                (-0.188, "dem", "one"),
+            ],
+        ),  # Bottom layer total, Eq 41, Table 9
+        "field": (
+            133.26,
+            [
+                (48.12, "one", "one"),
+                (-1e-5, "ts2", "one"),
+                (0.013, "sfc", "age"),
+                (-0.04, "vol", "drain_s"),
+                (0.026, "sfc", "vol"),
+            ],
+        ),  # Field layer total, Eq. 43, Table 9
+    },
+}
+SITE_VARIABLES = ("one", "lon", "lat", "dem", "sfc", "drain_s", "drain_s2")
+ANNUAL_VARIABLES = ("vol", "stems", "age", "ba", "ts", "vol2", "ts2")
+
 
 class Gvegetation:
     def __init__(self, n, lat, lon, sfc, species):
@@ -154,8 +231,94 @@ class Gvegetation:
         transformer = Transformer.from_crs(inProj, outProj)
         self.latitude, self.longitude = transformer.transform(lon, lat)
 
+        self.compile_equations(species)
         self.reset_domain()
 
+    def compile_equations(self, species):
+        """
+        Compiles the ground vegetation equations of all mire types into coefficient tables over
+        the vegetated columns. The leading site constant terms are folded into an intercept, the
+        rest are kept as (coefficient, variable, variable) slots in the order of the equations
+        so that the annual evaluation gives the same values as the equations written out.
+        """
+        mire_types = {"spruce_mire": 2, "pine_bog": 1}  # species of the mire types
+        species = np.asarray(species)
+        self.gv_cols = np.flatnonzero(np.isin(species, list(mire_types.values())))
+        cols_species = species[self.gv_cols]
+        m = len(self.gv_cols)
+        site = {
+            "one": np.ones(m),
+            "lon": np.full(m, self.longitude),
+            "lat": np.full(m, self.latitude),
+            "dem": self.dem[self.gv_cols],
+            "sfc": np.asarray(self.sfc)[self.gv_cols],
+            "drain_s": np.full(m, self.drain_s),
+            "drain_s2": np.full(m, self.drain_s**2),
+        }
+        self.gv_variables = SITE_VARIABLES + ANNUAL_VARIABLES
+        one = self.gv_variables.index("one")
+
+        self.gv_share = {
+            part: np.zeros(m) for part in ("ds", "h")
+        }  # share of dwarf shrubs and herbs in the field layer
+        self.gv_tables = {}
+        for eq in ("tot", "bot", "field"):
+            compiled = {}
+            for mire, sp in mire_types.items():
+                ix = cols_species == sp
+                constant, terms = GV_EQUATIONS[mire][eq]
+                intercept, slots = None, []
+                for c, x, y in terms:
+                    if x in SITE_VARIABLES and y in SITE_VARIABLES:
+                        value = c * site[x][ix] * site[y][ix]
+                        # leading site terms are summed into the intercept
+                        if not slots:
+                            intercept = (
+                                value if intercept is None else intercept + value
+                            )
+                        else:
+                            slots.append((value, one, one))
+                    elif x in SITE_VARIABLES:
+                        slots.append((c * site[x][ix], self.gv_variables.index(y), one))
+                    else:
+                        slots.append(
+                            (
+                                np.full(ix.sum(), c),
+                                self.gv_variables.index(x),
+                                self.gv_variables.index(y),
+                            )
+                        )
+                compiled[mire] = (ix, constant, intercept, slots)
+            nslots = max(len(c[3]) for c in compiled.values())
+            table = {
+                "constant": np.zeros(m),
+                "intercept": np.zeros(m),
+                "coef": np.zeros((nslots, m)),  # empty slots add zero
+                "x": np.full((nslots, m), one),
+                "y": np.full((nslots, m), one),
+            }
+            for ix, constant, intercept, slots in compiled.values():
+                table["constant"][ix] = constant
+                table["intercept"][ix] = intercept
+                for k, (c, x, y) in enumerate(slots):
+                    table["coef"][k, ix], table["x"][k, ix], table["y"][k, ix] = c, x, y
+            self.gv_tables[eq] = table
+        self.gv_site = np.stack([site[name] for name in SITE_VARIABLES])
+        for mire, sp in mire_types.items():
+            for part in ("ds", "h"):
+                self.gv_share[part][cols_species == sp] = self.fl_share[mire][part]
+
+    def gv_equation(self, eq, variables):
+        """
+        Evaluates the compiled equation eq, variables shape (..., n variables, vegetated columns)
+        """
+        table = self.gv_tables[eq]
+        cols = np.arange(variables.shape[-1])
+        total = table["intercept"]
+        for coef, x, y in zip(table["coef"], table["x"], table["y"]):
+            total = total + coef * variables[..., x, cols] * variables[..., y, cols]
+        return np.square(total) - 0.5 + table["constant"]
+
     def reset_domain(self):
         # --------- create output arrays -----------------------------
         self.gv_tot = np.zeros(self.n)  # Ground vegetation mass kg ha-1
@@ -184,398 +347,107 @@ class Gvegetation:
         self.k_gv = np.zeros(self.n)  # K in ground vegetation kg ha-1
 
     def gv_biomass_and_nutrients(self, ts, vol, Nstems, ba, age):
-        # --------------- nutrient contents in vegetation-----------------------
-        gv_tot = np.zeros(self.n)  # Ground vegetation mass kg ha-1
-        gv_field = np.zeros(self.n)  # Field layer vegetation mass
-        gv_bot = np.zeros(self.n)  # Bottom layer vegetation mass
-        gv_leafmass = np.zeros(self.n)  # Leaf mass in ground vegetation kg ha-1
-        ds_litterfall = np.zeros(self.n)  # dwarf shrub litterfall kg ha-1 yr-1
-        h_litterfall = np.zeros(self.n)  # herbs and grasses litterfall kg ha-1 yr-1
-        s_litterfall = np.zeros(self.n)  # sphagnum mosses litterfall kg ha-1 yr-1
-
-        n_litter_nw = np.zeros(self.n)  # N uptake due to litterfall kg ha-1 yr-1
-        p_litter_nw = np.zeros(self.n)  # P uptake due to litterfall kg ha-1 yr-1
-        k_litter_nw = np.zeros(self.n)  # K uptake due to litterfall kg ha-1 yr-1
-
-        n_litter_w = np.zeros(self.n)  # N uptake due to litterfall kg ha-1 yr-1
-        p_litter_w = np.zeros(self.n)  # P uptake due to litterfall kg ha-1 yr-1
-        k_litter_w = np.zeros(self.n)  # K uptake due to litterfall kg ha-1 yr-1
-
-        n_gv = np.zeros(self.n)  # N in ground vegetation kg ha-1
-        p_gv = np.zeros(self.n)  # P in ground vegetation kg ha-1
-        k_gv = np.zeros(self.n)  # K in ground vegetation kg ha-1
-
         """------ Ground vegetation models from Muukkonen & Mäkipää 2006 BER vol 11, Tables 6,7,8"""
-
-        #     ***************** Spruce mire ***************************************
-        ix = self.ix_spruce_mire
-        gv_tot[ix] = (
-            np.square(
-                35.52
-                + 0.001 * self.longitude * self.dem[ix]
-                - 1.1 * self.drain_s**2
-                - 2e-5 * vol[ix] * Nstems[ix]
-                + 4e-5 * Nstems[ix] * age[ix]
-                + 0.139 * self.longitude * self.drain_s
-            )
-            - 0.5
-            + 116.54
-        )  # Total, Eq.39, Table 9
-        gv_bot[ix] = (
-            np.square(
-                -3.182
-                + 0.022 * self.latitude * self.longitude
-                + 2e-4 * self.dem[ix] * age[ix]
-                - 0.077 * self.sfc[ix] * self.longitude
-                - 0.003 * self.longitude * vol[ix]
-                + 2e-4 * np.square(vol[ix])
-            )
-            - 0.5
-            + 98.10
-        )  # Bottom layer total, Eq. 35, Table 9
-        gv_field[ix] = (
-            np.square(
-                23.24
-                - 1.163 * self.drain_s**2
-                + 1.515 * self.sfc[ix] * self.drain_s
-                - 2e-5 * vol[ix] * Nstems[ix]
-                + 8e-5 * ts * age[ix]
-                + 1e-5 * Nstems[ix] * self.dem[ix]
-            )
-            - 0.5
-            + 162.58
-        )  # Field layer total, Eq. 37, Table 9
+        # all mire types at once from the compiled equations, annual inputs may have leading
+        # (scenario) axes
+        ix = self.gv_cols
+        annual = {
+            "vol": vol[..., ix],
+            "stems": Nstems[..., ix],
+            "age": age[..., ix],
+            "ba": ba[..., ix],
+            "ts": ts,
+            "vol2": np.square(vol[..., ix]),
+            "ts2": ts**2,
+        }
+        shape = np.broadcast_shapes(*(np.shape(v) for v in annual.values()))
+        variables = np.concatenate(
+            [
+                np.broadcast_to(self.gv_site, shape[:-1] + self.gv_site.shape),
+                np.stack(
+                    [np.broadcast_to(annual[v], shape) for v in ANNUAL_VARIABLES],
+                    axis=-2,
+                ),
+            ],
+            axis=-2,
+        )  # shape (..., variables, vegetated columns)
+        tot = self.gv_equation("tot", variables)
+        bot = self.gv_equation("bot", variables)
+        field = self.gv_equation("field", variables)
 
         # removing inconsistent values
-        gv_field[ix] = np.minimum(gv_tot[ix], gv_field[ix])
-        gv_bot[ix] = np.minimum(gv_tot[ix], gv_bot[ix])
-        gv_field[ix] = np.maximum(gv_field[ix], gv_tot[ix] - gv_bot[ix])
+        field = np.minimum(tot, field)
+        bot = np.minimum(tot, bot)
+        field = np.maximum(field, tot - bot)
+
+        ds_share, h_share = self.gv_share["ds"], self.gv_share["h"]
 
         # annual litterfall rates
         # ATTN! vaihda nämä suoraan field layeriksi, poista tot ja bommomin kautta menevä yhteys
-        ds_litterfall[ix] = (
-            self.fl_share["spruce_mire"]["ds"]
-            * (gv_tot[ix] - gv_bot[ix])
-            * self.lit_share["ds"]
-            * self.fl_to_total_turnover
-        )
-        h_litterfall[ix] = (
-            self.fl_share["spruce_mire"]["h"]
-            * (gv_tot[ix] - gv_bot[ix])
-            * self.lit_share["h"]
-            * self.fl_to_total_turnover
+        ds_lit = (
+            ds_share * (tot - bot) * self.lit_share["ds"] * self.fl_to_total_turnover
         )
-        s_litterfall[ix] = gv_bot[ix] * self.lit_share["s"]
+        h_lit = h_share * (tot - bot) * self.lit_share["h"] * self.fl_to_total_turnover
+        s_lit = bot * self.lit_share["s"]
 
         # ATTN! tarkista tämä, onko järkevä? Tee oma dictionary lehtimassalle
-        gv_leafmass[ix] = (
-            self.fl_share["spruce_mire"]["ds"]
-            * (gv_tot[ix] - gv_bot[ix])
-            * self.green_share["ds"]
-            + self.fl_share["spruce_mire"]["h"]
-            * (gv_tot[ix] - gv_bot[ix])
-            * self.green_share["h"]
-            + gv_bot[ix] * self.green_share["s"]
-        )
-
-        n_gv[ix] = (
-            gv_field[ix]
-            * self.fl_share["spruce_mire"]["ds"]
-            * self.nut_con["ds"]["N"]
-            * 1e-3
-            * self.fl_above_to_total
-            + gv_field[ix]
-            * self.fl_share["spruce_mire"]["h"]
-            * self.nut_con["h"]["N"]
-            * 1e-3
-            * self.fl_above_to_total
-            + gv_bot[ix] * self.nut_con["s"]["N"] * 1e-3
-        )
-        p_gv[ix] = (
-            gv_field[ix]
-            * self.fl_share["spruce_mire"]["ds"]
-            * self.nut_con["ds"]["P"]
-            * 1e-3
-            * self.fl_above_to_total
-            + gv_field[ix]
-            * self.fl_share["spruce_mire"]["h"]
-            * self.nut_con["h"]["P"]
-            * 1e-3
-            * self.fl_above_to_total
-            + gv_bot[ix] * self.nut_con["s"]["P"] * 1e-3
-        )
-        k_gv[ix] = (
-            gv_field[ix]
-            * self.fl_share["spruce_mire"]["ds"]
-            * self.nut_con["ds"]["K"]
-            * 1e-3
-            * self.fl_above_to_total
-            + gv_field[ix]
-            * self.fl_share["spruce_mire"]["h"]
-            * self.nut_con["h"]["K"]
-            * 1e-3
-            * self.fl_above_to_total
-            + gv_bot[ix] * self.nut_con["s"]["K"] * 1e-3
-        )
-
-        n_litter_nw[ix] = (
-            ds_litterfall[ix]
-            * self.nut_con["ds"]["N"]
-            * 1e-3
-            * (1.0 - self.retrans["ds"]["N"])
-            * 0.25
-            + h_litterfall[ix]
-            * self.nut_con["h"]["N"]
-            * 1e-3
-            * (1.0 - self.retrans["h"]["N"])
-            + s_litterfall[ix]
-            * self.nut_con["s"]["N"]
-            * 1e-3
-            * (1.0 - self.retrans["s"]["N"])
-        )
-
-        p_litter_nw[ix] = (
-            ds_litterfall[ix]
-            * self.nut_con["ds"]["P"]
-            * 1e-3
-            * (1.0 - self.retrans["ds"]["P"])
-            * 0.25
-            + h_litterfall[ix]
-            * self.nut_con["h"]["P"]
-            * 1e-3
-            * (1.0 - self.retrans["h"]["P"])
-            + s_litterfall[ix]
-            * self.nut_con["s"]["P"]
-            * 1e-3
-            * (1.0 - self.retrans["s"]["P"])
-        )
-
-        k_litter_nw[ix] = (
-            ds_litterfall[ix]
-            * self.nut_con["ds"]["K"]
-            * 1e-3
-            * (1.0 - self.retrans["ds"]["K"])
-            * 0.25
-            + h_litterfall[ix]
-            * self.nut_con["h"]["K"]
-            * 1e-3
-            * (1.0 - self.retrans["h"]["K"])
-            + s_litterfall[ix]
-            * self.nut_con["s"]["K"]
-            * 1e-3
-            * (1.0 - self.retrans["s"]["K"])
-        )
-
-        n_litter_w[ix] = (
-            ds_litterfall[ix]
-            * self.nut_con["ds"]["N"]
-            * 1e-3
-            * (1.0 - self.retrans["ds"]["N"])
-            * 0.75
-        )
-
-        p_litter_w[ix] = (
-            ds_litterfall[ix]
-            * self.nut_con["ds"]["P"]
-            * 1e-3
-            * (1.0 - self.retrans["ds"]["P"])
-            * 0.75
+        leafmass = (
+            ds_share * (tot - bot) * self.green_share["ds"]
+            + h_share * (tot - bot) * self.green_share["h"]
+            + bot * self.green_share["s"]
         )
 
-        k_litter_w[ix] = (
-            ds_litterfall[ix]
-            * self.nut_con["ds"]["K"]
-            * 1e-3
-            * (1.0 - self.retrans["ds"]["K"])
-            * 0.75
-        )
-
-        # ***************** Pine bogs ***************************************
-
-        ix = self.ix_pine_bog
-        gv_tot[ix] = (
-            np.square(
-                50.098
-                + 0.005 * self.longitude * self.dem[ix]
-                - 1e-5 * vol[ix] * Nstems[ix]
-                + 0.026 * self.sfc[ix] * age[ix]
-                - 1e-4 * self.dem[ix] * ts
-                - 0.014 * vol[ix] * self.drain_s
+        shape = shape[:-1] + (self.n,)
+        gv_tot, gv_field, gv_bot, gv_leafmass = (np.zeros(shape) for _ in range(4))
+        ds_litterfall, h_litterfall, s_litterfall = (np.zeros(shape) for _ in range(3))
+        gv_tot[..., ix], gv_field[..., ix], gv_bot[..., ix] = tot, field, bot
+        gv_leafmass[..., ix] = leafmass
+        ds_litterfall[..., ix], h_litterfall[..., ix] = ds_lit, h_lit
+        s_litterfall[..., ix] = s_lit
+
+        nutrients = {}
+        for nut in ("N", "P", "K"):
+            gv = np.zeros(shape)  # nutrients in ground vegetation kg ha-1
+            litter_nw = np.zeros(shape)  # uptake due to nonwoody litter kg ha-1 yr-1
+            litter_w = np.zeros(shape)  # uptake due to woody litterfall kg ha-1 yr-1
+            gv[..., ix] = (
+                field
+                * ds_share
+                * self.nut_con["ds"][nut]
+                * 1e-3
+                * self.fl_above_to_total
+                + field
+                * h_share
+                * self.nut_con["h"][nut]
+                * 1e-3
+                * self.fl_above_to_total
+                + bot * self.nut_con["s"][nut] * 1e-3
             )
-            - 0.5
-            + 167.40
-        )  # Total, Eq 45, Table 9
-        gv_bot[ix] = (
-            np.square(
-                31.809
-                + 0.008 * self.longitude * self.dem[ix]
-                - 3e-4 * Nstems[ix] * ba[ix]
-                + 6e-5 * Nstems[ix] * age[ix]
-                - 0.188 * self.dem[ix]
+            litter_nw[..., ix] = (
+                ds_lit
+                * self.nut_con["ds"][nut]
+                * 1e-3
+                * (1.0 - self.retrans["ds"][nut])
+                * 0.25
+                + h_lit * self.nut_con["h"][nut] * 1e-3 * (1.0 - self.retrans["h"][nut])
+                + s_lit * self.nut_con["s"][nut] * 1e-3 * (1.0 - self.retrans["s"][nut])
             )
-            - 0.5
-            + 222.22
-        )  # Bottom layer total, Eq 41, Table 9
-        gv_field[ix] = (
-            np.square(
-                48.12
-                - 1e-5 * ts**2
-                + 0.013 * self.sfc[ix] * age[ix]
-                - 0.04 * vol[ix] * self.drain_s
-                + 0.026 * self.sfc[ix] * vol[ix]
+            litter_w[..., ix] = (
+                ds_lit
+                * self.nut_con["ds"][nut]
+                * 1e-3
+                * (1.0 - self.retrans["ds"][nut])
+                * 0.75
             )
-            - 0.5
-            + 133.26
-        )  # Field layer total, Eq. 43, Table 9
-
-        # removing inconsistent values
-        gv_field[ix] = np.minimum(gv_tot[ix], gv_field[ix])
-        gv_bot[ix] = np.minimum(gv_tot[ix], gv_bot[ix])
-        gv_field[ix] = np.maximum(gv_field[ix], gv_tot[ix] - gv_bot[ix])
-
-        # annual litterfall rates
-
-        ds_litterfall[ix] = (
-            self.fl_share["pine_bog"]["ds"]
-            * (gv_tot[ix] - gv_bot[ix])
-            * self.lit_share["ds"]
-            * self.fl_to_total_turnover
-        )
-        h_litterfall[ix] = (
-            self.fl_share["pine_bog"]["h"]
-            * (gv_tot[ix] - gv_bot[ix])
-            * self.lit_share["h"]
-            * self.fl_to_total_turnover
-        )
-        s_litterfall[ix] = gv_bot[ix] * self.lit_share["s"]
-        gv_leafmass[ix] = (
-            self.fl_share["pine_bog"]["ds"]
-            * (gv_tot[ix] - gv_bot[ix])
-            * self.green_share["ds"]
-            + self.fl_share["pine_bog"]["h"]
-            * (gv_tot[ix] - gv_bot[ix])
-            * self.green_share["h"]
-            + gv_bot[ix] * self.green_share["s"]
-        )
-
-        n_gv[ix] = (
-            gv_field[ix]
-            * self.fl_share["pine_bog"]["ds"]
-            * self.nut_con["ds"]["N"]
-            * 1e-3
-            * self.fl_above_to_total
-            + gv_field[ix]
-            * self.fl_share["pine_bog"]["h"]
-            * self.nut_con["h"]["N"]
-            * 1e-3
-            * self.fl_above_to_total
-            + gv_bot[ix] * self.nut_con["s"]["N"] * 1e-3
-        )
-
-        p_gv[ix] = (
-            gv_field[ix]
-            * self.fl_share["pine_bog"]["ds"]
-            * self.nut_con["ds"]["P"]
-            * 1e-3
-            * self.fl_above_to_total
-            + gv_field[ix]
-            * self.fl_share["pine_bog"]["h"]
-            * self.nut_con["h"]["P"]
-            * 1e-3
-            * self.fl_above_to_total
-            + gv_bot[ix] * self.nut_con["s"]["P"] * 1e-3
-        )
-
-        k_gv[ix] = (
-            gv_field[ix]
-            * self.fl_share["pine_bog"]["ds"]
-            * self.nut_con["ds"]["K"]
-            * 1e-3
-            * self.fl_above_to_total
-            + gv_field[ix]
-            * self.fl_share["pine_bog"]["h"]
-            * self.nut_con["h"]["K"]
-            * 1e-3
-            * self.fl_above_to_total
-            + gv_bot[ix] * self.nut_con["s"]["K"] * 1e-3
-        )
-
-        n_litter_nw[ix] = (
-            ds_litterfall[ix]
-            * self.nut_con["ds"]["N"]
-            * 1e-3
-            * (1.0 - self.retrans["ds"]["N"])
-            * 0.25
-            + h_litterfall[ix]
-            * self.nut_con["h"]["N"]
-            * 1e-3
-            * (1.0 - self.retrans["h"]["N"])
-            + s_litterfall[ix]
-            * self.nut_con["s"]["N"]
-            * 1e-3
-            * (1.0 - self.retrans["s"]["N"])
-        )
-
-        p_litter_nw[ix] = (
-            ds_litterfall[ix]
-            * self.nut_con["ds"]["P"]
-            * 1e-3
-            * (1.0 - self.retrans["ds"]["P"])
-            * 0.25
-            + h_litterfall[ix]
-            * self.nut_con["h"]["P"]
-            * 1e-3
-            * (1.0 - self.retrans["h"]["P"])
-            + s_litterfall[ix]
-            * self.nut_con["s"]["P"]
-            * 1e-3
-            * (1.0 - self.retrans["s"]["P"])
-        )
-
-        k_litter_nw[ix] = (
-            ds_litterfall[ix]
-            * self.nut_con["ds"]["K"]
-            * 1e-3
-            * (1.0 - self.retrans["ds"]["K"])
-            * 0.25
-            + h_litterfall[ix]
-            * self.nut_con["h"]["K"]
-            * 1e-3
-            * (1.0 - self.retrans["h"]["K"])
-            + s_litterfall[ix]
-            * self.nut_con["s"]["K"]
-            * 1e-3
-            * (1.0 - self.retrans["s"]["K"])
-        )
-
-        n_litter_w[ix] = (
-            ds_litterfall[ix]
-            * self.nut_con["ds"]["N"]
-            * 1e-3
-            * (1.0 - self.retrans["ds"]["N"])
-            * 0.75
-        )
-
-        p_litter_w[ix] = (
-            ds_litterfall[ix]
-            * self.nut_con["ds"]["P"]
-            * 1e-3
-            * (1.0 - self.retrans["ds"]["P"])
-            * 0.75
-        )
-
-        k_litter_w[ix] = (
-            ds_litterfall[ix]
-            * self.nut_con["ds"]["K"]
-            * 1e-3
-            * (1.0 - self.retrans["ds"]["K"])
-            * 0.75
-        )
+            nutrients[nut] = (gv, litter_nw, litter_w)
+        n_gv, n_litter_nw, n_litter_w = nutrients["N"]
+        p_gv, p_litter_nw, p_litter_w = nutrients["P"]
+        k_gv, k_litter_nw, k_litter_w = nutrients["K"]
 
         # ------------Change clear-cut areas: reduce to 1/3 of modelled ---------------------------------------------------
         to_cc = 0.33
         # ix_cc = np.where(np.logical_and(gisdata['age']<5.0, gisdata['smc']!=4))  #small stands excluding open peatlands
-        ix_cc = np.where(age < 5.0)
+        ix_cc = np.broadcast_to(np.asarray(age) < 5.0, shape)
         n_gv[ix_cc] = n_gv[ix_cc] * to_cc
         p_gv[ix_cc] = p_gv[ix_cc] * to_cc
         k_gv[ix_cc] = k_gv[ix_cc] * to_cc
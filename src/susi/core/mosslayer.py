@@ -19,7 +19,8 @@ class MossLayer(object):
 
     def __init__(self, org_para_array: OrganicLayerParametersArray, outputs=False):
         """
-        Initializes MossLayer:
+        Initializes MossLayer, state of the shape of the parameter arrays: (ncols,) or
+        (nscens, ncols) for the scenarios in lock-step
         Args:
             org_para (dict):
                 # parameters
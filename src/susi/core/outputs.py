@@ -1736,6 +1736,17 @@ class Outputs:
             ),
         )
         surfacerunoff.units = "surface runoff generated from each column, has to be averaged through columns to be at the same unit than west east runoff [m/area/day]"
+        iterations = self.ncf.createVariable(
+            "/strip/iterations",
+            "i4",
+            (
+                "nscens",
+                "ndays",
+            ),
+        )
+        iterations.units = (
+            "number of nonlinear iterations in the strip hydrology solution [-]"
+        )
 
         residencetime = self.ncf.createVariable(
             "/strip/residencetime",
@@ -2443,6 +2454,9 @@ class Outputs:
         self.ncf["strip"]["surfacerunoff"][scen, start : start + days] = stpout[
             "surfacerunoff"
         ][scen, start : start + days, :]
+        self.ncf["strip"]["iterations"][scen, start : start + days] = stpout[
+            "iterations"
+        ][scen, start : start + days]
         self.ncf["strip"]["deltas"][scen, year, :] = np.sum(
             stpout["deltas"][scen, start : start + days, :], axis=0
         )
@@ -8,11 +8,22 @@ Created on Tue Feb  1 18:59:52 2022
 import numpy as np
 
 from susi.core.canopylayer import Canopylayer
+from susi.core.susi_utils import assimilation_yr
 
 
 class Stand:
     def __init__(
-        self, nscens, yrs, canopylayers, ncols, sfc, agearr, mottifile, photopara
+        self,
+        nscens,
+        yrs,
+        canopylayers,
+        ncols,
+        sfc,
+        agearr,
+        mottifile,
+        photopara,
+        column_groups=False,
+        table_cache=None,
     ):
         """
         ALL VARIABLES IN STAND OBJECT ARE IN ha AND kg -BASIS
@@ -29,11 +40,16 @@ class Stand:
             agearr, dict of float arrays (len(ncols)) for stand age in the particular column and canopylayer
             mottifile, dict of dicts, telling the growth and yield (Motti files) in each canopy layer with key pointing to integer in the canopylayer dict
             photopara - photosynthesis parameters used in the assimilation model
+            column_groups - bool, assimilation of the canopy layers computed only in the columns with trees
+            table_cache - TableCache for the compiled Motti files, or None
         """
         self.ncols = ncols  # number of columns along the strip
         self.nscens = nscens  # number of ditch depth scenarios in the simulation
         self.yrs = yrs  # number of years in the simulation
         self.photopara = photopara  # photosynthesis parameters for the assimilation function (Mäkelä et al. 2008)
+        self.column_groups = (
+            column_groups  # assimilation only in the columns with trees
+        )
         self.nut_stat = np.ones(
             ncols
         )  # *0.5                                   # nutrient status, make this an argument
@@ -76,6 +92,8 @@ class Stand:
             ixdominants,
             photopara,
             self.nut_stat,
+            column_groups=column_groups,
+            table_cache=table_cache,
         )
         self.subdominant = Canopylayer(
             "subdominant",
@@ -90,6 +108,8 @@ class Stand:
             ixsubdominants,
             photopara,
             self.nut_stat,
+            column_groups=column_groups,
+            table_cache=table_cache,
         )
         self.under = Canopylayer(
             "under",
@@ -104,6 +124,8 @@ class Stand:
             ixunder,
             photopara,
             self.nut_stat,
+            column_groups=column_groups,
+            table_cache=table_cache,
         )
         self.clyrs = [
             self.dominant,
@@ -506,15 +528,36 @@ class Stand:
             col = np.arange(0, self.ncols, 1)
             lai_above[layer + 1, :] = laiabove[order, col]
 
-        self.dominant.assimilate(
-            forc, wt, afp, self.previous_nut_stat, self.nut_stat, lai_above[0, :]
-        )  # npp, leaf dynamics and updating the canopylayers
-        self.subdominant.assimilate(
-            forc, wt, afp, self.previous_nut_stat, self.nut_stat, lai_above[1, :]
-        )  # npp, leaf dynamics and updating the canopylayers
-        self.under.assimilate(
-            forc, wt, afp, self.previous_nut_stat, self.nut_stat, lai_above[2, :]
-        )  # npp, leaf dynamics and updating the canopylayers
+        # npp of all canopy layers at once, weather and soil modifiers shared by the layers
+        lai = np.vstack(
+            [cl.leafarea * 2 * cl.stems for cl in self.clyrs]
+        )  # double sided
+        npp, npp_pot = np.zeros((3, self.ncols)), np.zeros((3, self.ncols))
+        if self.column_groups:
+            # without trees the leaf area is zero and so is the production
+            cols = np.unique(np.concatenate([cl.tree_columns for cl in self.clyrs]))
+        else:
+            cols = np.arange(self.ncols)
+        if len(cols) > 0:
+            npp[:, cols], npp_pot[:, cols] = assimilation_yr(
+                self.photopara,
+                forc,
+                np.asarray(wt)[:, cols],
+                np.asarray(afp)[:, cols],
+                lai[:, cols],
+                lai_above[:3, cols] * 2,
+            )
+
+        for layer, cl in enumerate(self.clyrs):
+            cl.assimilate(
+                forc,
+                wt,
+                afp,
+                self.previous_nut_stat,
+                self.nut_stat,
+                lai_above[layer, :],
+                production=(npp[layer], npp_pot[layer]),
+            )  # npp, leaf dynamics and updating the canopylayers
 
         # updating call from the main program
 
@@ -7,6 +7,7 @@ Created on Sat Nov  4 15:15:55 2023
 
 import numpy as np
 from scipy.integrate import quad
+from scipy.interpolate import RegularGridInterpolator
 
 # Copied from Vauhkonen (2019):
 
@@ -16,6 +17,14 @@ from scipy.integrate import quad
 """ based on the tapering and allowable log dimensions, with an aim to produce as much saw wood logs as possible. """  # (Vauhkonen 2019)
 
 
+# powers of 1 - hx/h in the stem curve
+TAPER_EXPONENTS = np.array([1, 2, 3, 5, 8, 13, 21, 34])
+# Gauss-Legendre quadrature, exact for the squared stem curve (a polynomial of degree 68)
+GAUSS_NODES, GAUSS_WEIGHTS = np.polynomial.legendre.leggauss(35)
+D13_GRID = np.arange(1.0, 61.0, 1.0)  # default grids of the assortment table, cm
+H_GRID = np.arange(2.0, 40.5, 0.5)  # m
+
+
 class StemCurve:
     def __init__(self):
         self.min_diams = {"log": (0, 15, 16, 18), "pulp": (0, 7, 7, 7)}
@@ -41,6 +50,17 @@ class StemCurve:
             2: (0.56, 0.5089),
             3: (0.497936, 0.4862),
         }
+        # arrays indexed by species for the vectorised methods, row 0 unused
+        self.taper_coefs = np.array(
+            [np.zeros(8)] + [self.stemcurve_coefs[sp] for sp in (1, 2, 3)]
+        )
+        self.stump_coefs = np.array(
+            [np.zeros(2)] + [self.stumpheight_coefs[sp] for sp in (1, 2, 3)]
+        )
+        self.length_sums = {
+            kind: {sp: self.lengthCombinations(kind, sp) for sp in (1, 2, 3)}
+            for kind in ("log", "pulp")
+        }  # feasible bucking lengths: sorted sums and the lengths of the logs
 
     def stemCurve(self, hx, h, species):
         x = 1 - hx / h
@@ -159,3 +179,130 @@ class StemCurve:
             d13, h, sp, 0, cutPoints["stump"][0]
         )
         return volume
+
+    # ---------- Vectorised methods for arrays of stems (d13 cm, h m, sp) -------------------------
+
+    def lengthCombinations(self, kind, sp):
+        # all combinations of four log lengths in the loop order of buckStem, summed in the same
+        # order; for each distinct sum the first combination found by buckStem is kept
+        lengths = np.array(self.lengths[kind][sp])
+        log, k, j, i = np.meshgrid(lengths, lengths, lengths, lengths, indexing="ij")
+        apu = (i + j + k + log).ravel()
+        parts = np.column_stack([i.ravel(), j.ravel(), k.ravel(), log.ravel()])
+        sums, first = np.unique(apu, return_index=True)
+        return sums, parts[first]
+
+    def taper(self, hx, h, sp):
+        # stem curve, diameter relative to d20 at heights hx
+        x = 1 - np.asarray(hx, dtype=float) / h
+        b = self.taper_coefs[sp]
+        return np.sum(b * x[..., None] ** TAPER_EXPONENTS, axis=-1)
+
+    def stumpHeights(self, d13, h, sp):
+        c = self.stump_coefs[sp]
+        return np.maximum((c[..., 0] * h + c[..., 1] * d13) / 100, 0.10)
+
+    def cutHeights(self, dcut, d13, h, sp, iterations=60):
+        # height where the stem diameter is dcut, bisection of all stems at once
+        d20 = d13 / self.taper(1.3, h, sp)
+        lower, upper = np.zeros(np.shape(d20)), np.broadcast_to(h, np.shape(d20))
+        for _ in range(iterations):
+            middle = 0.5 * (lower + upper)
+            thicker = self.taper(middle, h, sp) * d20 > dcut
+            lower = np.where(thicker, middle, lower)
+            upper = np.where(thicker, upper, middle)
+        return 0.5 * (lower + upper)
+
+    def stemVolumes(self, d13, h, sp, lower, upper):
+        # volumes dm3 between the heights lower and upper, Gauss-Legendre quadrature
+        d20 = d13 / self.taper(1.3, h, sp)
+        half = 0.5 * (upper - lower)
+        hx = (0.5 * (upper + lower))[..., None] + half[..., None] * GAUSS_NODES
+        d = self.taper(hx, np.asarray(h)[..., None], np.asarray(sp)[..., None])
+        area = np.pi / 4 * (d * np.asarray(d20)[..., None] / 100) ** 2 * 1000
+        return half * np.sum(GAUSS_WEIGHTS * area, axis=-1)
+
+    def buckLengths(self, kind, prop, sp):
+        # longest feasible combination of log lengths for the available stem lengths prop
+        cut = np.zeros(np.shape(prop) + (5,))
+        for s in np.unique(sp):
+            ix = sp == s
+            sums, parts = self.length_sums[kind][s]
+            j = np.searchsorted(sums, prop[ix], side="right") - 1
+            found = j >= 0
+            cut[ix, 0] = np.where(found, sums[j], 0.0)
+            cut[ix, 1:] = np.where(found[:, None], parts[j], 0.0)
+        return cut
+
+    def buckStems(self, d13, h, sp):
+        # as buckStem for arrays of stems: cut points arrays of shape (stems, 5)
+        d13, h = np.atleast_1d(d13).astype(float), np.atleast_1d(h).astype(float)
+        sp = np.broadcast_to(sp, d13.shape)
+        stump = self.stumpHeights(d13, h, sp)
+        cutPoints = {"stump": np.zeros((len(d13), 5))}
+        cutPoints["stump"][:, 0] = stump
+        top = stump
+        for kind in ("log", "pulp"):
+            mindiam = np.array(self.min_diams[kind])[sp]
+            cut = np.zeros((len(d13), 5))
+            flag = d13 >= mindiam
+            if flag.any():
+                hcut = self.cutHeights(mindiam[flag], d13[flag], h[flag], sp[flag])
+                cut[flag] = self.buckLengths(kind, hcut - top[flag], sp[flag])
+            cut[:, 0] = cut[:, 0] + top
+            cutPoints[kind] = cut
+            top = cut[:, 0]
+        return cutPoints
+
+    def assortmentVolumes(self, d13, h, sp):
+        # as predictAssortmentVolumes for arrays of stems, volumes dm3
+        d13, h = np.atleast_1d(d13).astype(float), np.atleast_1d(h).astype(float)
+        sp = np.broadcast_to(sp, d13.shape)
+        cutPoints = self.buckStems(d13, h, sp)
+        stump, log, pulp = (cutPoints[kind][:, 0] for kind in ("stump", "log", "pulp"))
+        volume = {
+            "log": self.stemVolumes(d13, h, sp, stump, log),
+            "pulp": self.stemVolumes(d13, h, sp, log, pulp),
+        }
+        stumpvolume = self.stemVolumes(d13, h, sp, np.zeros_like(stump), stump)
+        residual = stumpvolume + self.stemVolumes(d13, h, sp, pulp, h)
+        volume["total"] = volume["log"] + volume["pulp"] + residual
+        volume["residual"] = residual - stumpvolume
+        return volume
+
+
+class AssortmentTable:
+    """
+    Precomputed assortment volumes of the stems (dm3) on a (species, d13, h) grid, interpolated
+    bilinearly for bulk harvest accounting. Diameters and heights outside the grid are clipped
+    to its edges. The table of a species is computed on first use.
+    """
+
+    kinds = ("log", "pulp", "residual", "total")
+
+    def __init__(self, d13=D13_GRID, h=H_GRID):
+        self.d13 = np.asarray(d13, dtype=float)  # diameter grid at 1.3 m, cm
+        self.h = np.asarray(h, dtype=float)  # height grid, m
+        self.stemcurve = StemCurve()
+        self.tables = {}  # interpolators by species
+
+    def table(self, sp):
+        if sp not in self.tables:
+            d13, h = np.meshgrid(self.d13, self.h, indexing="ij")
+            volume = self.stemcurve.assortmentVolumes(d13.ravel(), h.ravel(), sp)
+            values = np.stack([volume[kind] for kind in self.kinds], axis=-1)
+            self.tables[sp] = RegularGridInterpolator(
+                (self.d13, self.h), values.reshape(d13.shape + (len(self.kinds),))
+            )
+        return self.tables[sp]
+
+    def __call__(self, d13, h, sp):
+        d13 = np.clip(np.atleast_1d(d13).astype(float), self.d13[0], self.d13[-1])
+        h = np.clip(np.atleast_1d(h).astype(float), self.h[0], self.h[-1])
+        d13, h = np.broadcast_arrays(d13, h)
+        sp = np.broadcast_to(sp, d13.shape)
+        values = np.zeros(d13.shape + (len(self.kinds),))
+        for s in np.unique(sp):
+            ix = sp == s
+            values[ix] = self.table(s)(np.column_stack([d13[ix], h[ix]]))
+        return {kind: values[..., n] for n, kind in enumerate(self.kinds)}
@@ -5,44 +5,60 @@ Created on Sat Jan 19 19:59:31 2019
 @author: lauren
 """
 
+import warnings
+
 import numpy as np
+from scipy import linalg
 
-from susi.core.susi_utils import CWTr, peat_hydrol_properties
+from susi.core.susi_utils import (
+    hydraulic_functions,
+    hydraulic_tables,
+    peat_hydrol_properties,
+)
+from susi.core.table_cache import cached_tables
 
 
 class StripHydrology:
-    def __init__(self, spara):
+    def __init__(self, spara, nscens=None):
+        """
+        Input:
+            spara simulation parameters
+            nscens number of ditch depth scenarios solved together in lock-step, heads of shape
+                (nscens, n) and boundary heads of shape (nscens,); None for a single strip of shape (n,).
+                The scenarios iterate with Picard in fixed daily steps and one banded solve for all.
+        """
+        if nscens is not None and (
+            spara.strip_nonlinear_solve_mode != "picard"
+            or spara.strip_time_stepping != "fixed"
+        ):
+            raise ValueError(
+                "Scenarios in lock-step are solved with Picard iteration in fixed daily steps"
+            )
         self.nLyrs = spara.nLyrs  # number of soil layers
         dz = np.ones(self.nLyrs) * spara.dzLyr  # thickness of layers, m
         z = np.cumsum(dz) - dz / 2.0  # depth of the layer center point, m
         self.spara = spara
-        if spara.vonP:
-            lenvp = len(spara.vonP_top)
-            vonP = np.ones(self.nLyrs) * spara.vonP_bottom
-            vonP[0:lenvp] = spara.vonP_top
-            ptype = spara.peat_type_bottom * spara.nLyrs
-            lenpt = len(spara.peat_type)
-            ptype[0:lenpt] = spara.peat_type
-            self.pF, self.Ksat = peat_hydrol_properties(
-                vonP, var="H", ptype=ptype
-            )  # peat hydraulic properties after Päivänen 1973
-        else:
-            lenbd = len(spara.bd_top)  # Bulk density in unit of g/cm3
-            bd = np.ones(self.nLyrs) * spara.bd_bottom
-            bd[0:lenbd] = spara.bd_top  # degree of  decomposition, von Post scale
-            ptype = spara.peat_type_bottom * spara.nLyrs
-            lenpt = len(spara.peat_type)
-            ptype[0:lenpt] = spara.peat_type
-            self.pF, self.Ksat = peat_hydrol_properties(
-                bd, var="bd", ptype=ptype
-            )  # peat hydraulic properties after Päivänen 1973
-
-        for n in range(self.nLyrs):
-            if z[n] < 0.41:
-                self.Ksat[n] = self.Ksat[n] * spara.anisotropy
-            else:
-                self.Ksat[n] = self.Ksat[n] * 1.0
-
+        tables = cached_tables(
+            spara,
+            "strip",
+            {
+                key: getattr(spara, key)
+                for key in (
+                    "nLyrs",
+                    "dzLyr",
+                    "vonP",
+                    "vonP_top",
+                    "vonP_bottom",
+                    "bd_top",
+                    "bd_bottom",
+                    "peat_type",
+                    "peat_type_bottom",
+                    "anisotropy",
+                )
+            },
+            lambda: self.build_hydraulic_tables(spara, z, dz),
+        )  # peat profile tables, reused from the cache for identical profiles
+        self.pF, self.Ksat = tables["pF"], tables["Ksat"]
         (
             self.dwtToSto,
             self.stoToGwl,
@@ -50,12 +66,16 @@ class StripHydrology:
             self.C,
             self.dwtToRat,
             self.dwtToAfp,
-        ) = CWTr(
-            self.nLyrs, z, dz, self.pF, self.Ksat, direction="negative"
+        ) = hydraulic_functions(
+            tables
         )  # interpolated storage, transmissivity, diff water capacity, and ratio between aifilled porosoty in rooting zone to total airf porosity  functions
 
         self.L = spara.L  # compartemnt width, m
         self.n = spara.n  # number of computation nodes
+        self.nscens = nscens
+        self.shape = (
+            (self.n,) if nscens is None else (nscens, self.n)
+        )  # shape of the head arrays
         self.dy = float(self.L / self.n)  # node width m
         sl = spara.slope  # slope %
         lev = 1.0  # basic level of soil surface
@@ -66,6 +86,21 @@ class StripHydrology:
         self.dt = 1  # time step, days
         self.implic = 1.0  # 0.5                                                  # 0-forward Euler, 1-backward Euler, 0.5-Crank-Nicolson
         self.DrIrr = False
+        self.solve_mode = (
+            spara.strip_solve_mode if nscens is None else "banded"
+        )  # 'dense' full matrix inversion, 'banded' tridiagonal solver
+        self.nonlinear_mode = (
+            spara.strip_nonlinear_solve_mode
+        )  # 'picard' or 'newton' iteration
+        self.max_iterations = spara.strip_max_iterations
+        self.tolerance = spara.strip_tolerance  # convergence criterion, m
+        self.iterations = 0  # number of iterations in the latest time step
+        self.time_stepping = spara.strip_time_stepping  # 'fixed' or 'adaptive'
+        self.step_tolerance = (
+            spara.strip_step_tolerance
+        )  # local error tolerance of the adaptive step, m per day of step length
+        self.dt_min = 1.0 / 96.0  # shortest adaptive substep, days
+        self.max_substeps = 1000  # max number of adaptive solves in a day
         self.dwt = spara.initial_h  # h in the compartment
         self.H = (
             self.ele + self.dwt
@@ -73,15 +108,59 @@ class StripHydrology:
 
         self.Kmap = np.tile(self.Ksat, (self.n, 1))  # Ksat map (col, lyr)
         self.residence_time = np.zeros(
-            self.n
+            self.shape
         )  # residence time from column to the ditch, days
 
         print("Peat strip initialized")
 
+    def build_hydraulic_tables(self, spara, z, dz):
+        """
+        Peat hydraulic properties and the CWTr tables of the strip profile
+        """
+        if spara.vonP:
+            lenvp = len(spara.vonP_top)
+            vonP = np.ones(spara.nLyrs) * spara.vonP_bottom
+            vonP[0:lenvp] = spara.vonP_top
+            ptype = spara.peat_type_bottom * spara.nLyrs
+            lenpt = len(spara.peat_type)
+            ptype[0:lenpt] = spara.peat_type
+            pF, Ksat = peat_hydrol_properties(
+                vonP, var="H", ptype=ptype
+            )  # peat hydraulic properties after Päivänen 1973
+        else:
+            lenbd = len(spara.bd_top)  # Bulk density in unit of g/cm3
+            bd = np.ones(spara.nLyrs) * spara.bd_bottom
+            bd[0:lenbd] = spara.bd_top  # degree of  decomposition, von Post scale
+            ptype = spara.peat_type_bottom * spara.nLyrs
+            lenpt = len(spara.peat_type)
+            ptype[0:lenpt] = spara.peat_type
+            pF, Ksat = peat_hydrol_properties(
+                bd, var="bd", ptype=ptype
+            )  # peat hydraulic properties after Päivänen 1973
+
+        for n in range(spara.nLyrs):
+            if z[n] < 0.41:
+                Ksat[n] = Ksat[n] * spara.anisotropy
+            else:
+                Ksat[n] = Ksat[n] * 1.0
+
+        tables = hydraulic_tables(spara.nLyrs, z, dz, pF, Ksat, direction="negative")
+        tables["pF"], tables["Ksat"] = pF, Ksat
+        return tables
+
     def reset_domain(self):
-        self.A = np.zeros((self.n, self.n))  # computation matrix
-        self.dwt = np.ones(self.n) * self.spara.initial_h  # right hand side vector
+        if self.solve_mode == "banded":
+            self.A = np.zeros(
+                (3,) + self.shape
+            )  # diagonals of the computation matrix, for each scenario
+        else:
+            self.A = np.zeros((self.n, self.n))  # computation matrix
+        self.dwt = np.ones(self.shape) * self.spara.initial_h  # right hand side vector
         self.H = self.ele + self.dwt  # head with respect to absolute reference level, m
+        self.H_previous = self.H.copy()  # head in the previous time step, m
+        self.dt_previous = 1.0  # length of the previous time step, days
+        self.H_day_previous = self.H.copy()  # head one day before, m
+        self.quiet = False  # the adaptive step met the tolerance in one step
         # self.sruno = 0.
         self.roff = 0.0
         print("Resetting strip scenario")
@@ -90,23 +169,22 @@ class StripHydrology:
         """
         IN:
             d day number
-            h0ts boudary (ditch depth, m) in time series
-            p rainfall-et m, arrayn n length
+            h0ts boudary (ditch depth, m) in time series, in lock-step an array (nscens,)
+            p rainfall-et m, arrayn n length, in lock-step (nscens, n)
             moss as object
         """
         n = self.n
-        Htmp = self.H.copy()
-        Htmp1 = self.H.copy()
-        self.dwt = Htmp - self.ele
+        self.dwt = self.H - self.ele
         # S = p/1000.*np.ones(n)                                                # source/sink, in m
         S = p.copy()  # *np.ones(n)                                              # source/sink, in m
-        self.dwt[0] = h0ts_west
-        self.dwt[n - 1] = h0ts_east  # symmetrical boundaries, set water level
+        self.dwt[..., 0] = h0ts_west
+        self.dwt[..., n - 1] = h0ts_east  # symmetrical boundaries, set water level
 
         # TESTING here
         # airv = self.hToSto(self.ele)-self.hToSto(Htmp-self.ele)                # air volume, in m
         airv = np.maximum(
-            self.dwtToSto(np.zeros(n)) - self.dwtToSto(self.dwt), np.zeros(n)
+            self.dwtToSto(np.zeros(self.shape)) - self.dwtToSto(self.dwt),
+            np.zeros(self.shape),
         )
 
         S = np.where(S > airv, airv, S)
@@ -116,68 +194,423 @@ class StripHydrology:
 
         # self.sruno += self.surface_runoff
         # self.sruno += np.where(np.ones(len(airv))*(p)/1000. > airv, np.ones(len(airv))*(p)/1000.-airv, 0.0)  #cut the surface water above to runoff
-        Tr0 = self.dwtToTra(self.dwt)  # Transmissivity from the previous time step
+        if self.time_stepping == "adaptive":
+            self.roffwest, self.roffeast, self.iterations = self.run_adaptive_day(
+                S, h0ts_west, h0ts_east
+            )
+        else:
+            Htmp1, Trminus1, Trplus1, it, _ = self.solve_step(S, h0ts_west, h0ts_east)
+            self.iterations = it + 1  # number of linear solves in the time step
+            self.H_previous = self.H.copy()
+            self.H = Htmp1.copy()
+
+            # **********************construction*****************
+            self.roffwest, self.roffeast = self.runoff(
+                self.H, Trminus1, Trplus1, self.dt, self.dy, self.L
+            )
+        if d % 365 == 0:
+            print("  - day #", d, "iterations", self.iterations)
+        self.surface_runoff
+        self.roff = (
+            self.roffwest + self.roffeast + np.mean(self.surface_runoff, axis=-1)
+        )
 
+        self.dwt = self.H - self.ele
+        self.air_ratio = self.dwtToRat(self.dwt)
+        self.afp = self.dwtToAfp(self.dwt)
+        # **************************************************
+
+        return self.dwt, self.H, self.roff, self.air_ratio, self.afp
+
+    def solve_step(self, S, h0ts_west, h0ts_east, linearized=False):
+        """
+        Head at the end of a time step of length self.dt
+        Input:
+            S source/sink, m day-1
+            h0ts boundary (ditch depth, m)
+            linearized: only one linear solve with coefficients from the old head
+        Output:
+            Htmp1 new head, m
+            Trminus1, Trplus1 transmissivities between nodes at the new head
+            it iteration index of the last iteration
+            correction estimate of the head change still missing from the nonlinear solution, m,
+                zero if the iteration converged and inf if it did not
+        """
+        n = self.n
+        dwt = self.H - self.ele
+        dwt[..., 0] = h0ts_west
+        dwt[..., n - 1] = h0ts_east  # symmetrical boundaries, set water level
+        Tr0 = self.dwtToTra(dwt)  # Transmissivity from the previous time step
         Trminus0, Trplus0 = self.gmeanTr(
             Tr0
         )  # geometric mean of adjacent node transmissivities
         Hminus, Hplus = self.Hadjacent(self.H)  # vector of adjacent node H
 
-        for it in range(100):  # iteration loop for implicit solution
-            Tr1 = self.dwtToTra(Htmp1 - self.ele)  # transmissivity in new iteration
-            Tr0 = np.maximum(self.dwtToTra(self.H - self.ele), 0.0)
-            Tr1 = np.maximum(self.dwtToTra(Htmp1 - self.ele), 0.0)
-            CC = self.C(Htmp1 - self.ele)  # storage coefficient in new iteration
-            Trminus1, Trplus1 = self.gmeanTr(
-                Tr1
-            )  # geometric mean of adjacent node transmissivity
-            alfa = CC * self.dy**2 / self.dt
-            self.A = self.Amatrix(
-                self.A, n, self.implic, Trminus1, Trplus1, alfa
-            )  # construct tridiaginal matrix
-            self.A = self.boundConst(self.A, n)  # constant head boundaries to A matrix
-            hs = self.rightSide(
+        if linearized:
+            G, Trminus1, Trplus1 = self.picard_step(
+                self.H, S, Trminus0, Hminus, Trplus0, Hplus, h0ts_west, h0ts_east
+            )
+            Htmp1 = np.minimum(G, self.ele)  # cut the surface water
+            b = self.rightSide(
                 S,
-                self.dt,
                 self.dy,
                 self.implic,
-                alfa,
+                np.zeros(n),
                 self.H,
                 Trminus0,
                 Hminus,
                 Trplus0,
                 Hplus,
                 self.DrIrr,
-                Htmp1,
+                self.H,
                 self.ele,
                 h0ts_west,
                 h0ts_east,
-            )  # right hand side of the equation
-            Htmp1 = np.linalg.multi_dot([np.linalg.inv(self.A), hs])  # solve equation
-            # Htmp1 = np.matmul(np.linalg.inv(self.A),hs)            # solve equation
+            )
+            R, terms = self.newton_residual(G, b, h0ts_west, h0ts_east)
+            diagonal = terms["alfa"].copy()
+            diagonal[1 : n - 1] += self.implic * (terms["F"][: n - 2] + terms["F"][1:])
+            diagonal[0] = diagonal[n - 1] = 1.0
+            correction = np.max(
+                np.abs(R / diagonal)
+            )  # one Jacobi sweep of the nonlinear equations
+            return Htmp1, Trminus1, Trplus1, 0, correction
+
+        if self.nscens is not None:
+            Htmp1, Trminus1, Trplus1, it, _ = self.iterate_picard_scenarios(
+                S, Trminus0, Hminus, Trplus0, Hplus, h0ts_west, h0ts_east
+            )
+            return Htmp1, Trminus1, Trplus1, it, 0.0
+        if self.nonlinear_mode == "newton":
+            Htmp1, Trminus1, Trplus1, it, converged = self.iterate_newton(
+                S, Trminus0, Hminus, Trplus0, Hplus, h0ts_west, h0ts_east
+            )
+        else:
+            Htmp1, Trminus1, Trplus1, it, converged = self.iterate_picard(
+                S, Trminus0, Hminus, Trplus0, Hplus, h0ts_west, h0ts_east
+            )
+        correction = 0.0 if converged else np.inf
+        return Htmp1, Trminus1, Trplus1, it, correction
 
+    def run_adaptive_day(self, S, h0ts_west, h0ts_east):
+        """
+        Advances the head over one day with adaptive time steps.
+        The day is first solved in one step. The local error of a backward Euler step is estimated
+        from the difference between the solution and a linear extrapolation of the previous heads.
+        A step with error above self.step_tolerance per day of step length, or without a converged
+        iteration, is rejected and the day continues in substeps sized by the error estimate.
+        After a quiet day, whose single step met the tolerance, the next day starts with one
+        linearised solve that is accepted if also its remaining nonlinear correction meets the
+        tolerance. Substeps are not shortened below self.dt_min: a step of that length is accepted
+        even if it does not meet the tolerance, with a warning.
+        Output:
+            roffwest, roffeast runoff to the ditches during the day, m
+            iterations number of linear solves during the day
+        """
+        self.H_previous, self.dt_previous = (
+            self.H_day_previous,
+            1.0,
+        )  # the first step is predicted from the previous day
+        self.H_day_previous = self.H.copy()
+        t = 0.0  # time within the day, days
+        dt = 1.0
+        linearized = self.quiet
+        self.quiet = True
+        roffwest, roffeast = 0.0, 0.0
+        iterations = 0
+        solves = 0
+        while t < 1.0 - 1.0e-9:
+            solves += 1
+            if solves > self.max_substeps:
+                raise RuntimeError(
+                    f"Adaptive strip time step did not finish the day in {self.max_substeps} solves"
+                )
+            dt = min(dt, 1.0 - t)
+            self.dt = dt
+            Htmp1, Trminus1, Trplus1, it, correction = self.solve_step(
+                S, h0ts_west, h0ts_east, linearized=linearized
+            )
+            iterations += it + 1
+            H_predicted = self.H + dt / self.dt_previous * (self.H - self.H_previous)
+            error = (
+                dt / (dt + self.dt_previous) * np.max(np.abs(Htmp1 - H_predicted))
+                + correction
+            )  # local error estimate, m
+            tolerance = self.step_tolerance * dt  # error per unit step
+            if linearized and error > tolerance:
+                linearized = False  # solve the nonlinear system instead
+                continue
+            if error > tolerance and dt > self.dt_min:
+                self.quiet = False
+                dt = max(
+                    dt * max(0.2, 0.9 * tolerance / error), self.dt_min
+                )  # reject the step
+                continue
+            if error > tolerance:
+                warnings.warn(
+                    "Strip substep of the shortest length did not meet the step tolerance",
+                    RuntimeWarning,
+                    stacklevel=2,
+                )
+            west, east = self.runoff(Htmp1, Trminus1, Trplus1, dt, self.dy, self.L)
+            roffwest += west
+            roffeast += east
+            self.H_previous = self.H.copy()
+            self.H = Htmp1.copy()
+            self.dt_previous = dt
+            t += dt
+            growth = (
+                2.0 if error == 0.0 else min(2.0, max(0.2, 0.9 * tolerance / error))
+            )
+            dt = max(dt * growth, self.dt_min)
+        self.dt = 1
+        return roffwest, roffeast, iterations
+
+    def iterate_picard(self, S, Trminus0, Hminus, Trplus0, Hplus, h0ts_west, h0ts_east):
+        """
+        Picard iteration: transmissivity and storage coefficient are taken from the latest iterate
+        and the linear system is solved again until the head does not change
+        Returns also the index of the last iteration and whether the iteration converged
+        """
+        Htmp = self.H.copy()
+        Htmp1 = self.H.copy()
+        converged = False
+        for it in range(self.max_iterations):  # iteration loop for implicit solution
+            Htmp1, Trminus1, Trplus1 = self.picard_step(
+                Htmp1, S, Trminus0, Hminus, Trplus0, Hplus, h0ts_west, h0ts_east
+            )  # solve equation
             Htmp1 = np.where(Htmp1 > self.ele, self.ele, Htmp1)  # cut the surface water
             conv = max(np.abs(Htmp1 - Htmp))  # define convergence
             Htmp = Htmp1.copy()  # new wt to old for new iteration
-            if conv < 1.0e-7:
-                if d % 365 == 0:
-                    print("  - day #", d, "iterations", it)
+            if conv < self.tolerance:
+                converged = True
                 break
-        self.H = Htmp1.copy()
+        return Htmp1, Trminus1, Trplus1, it, converged
 
-        # **********************construction*****************
-        self.roffwest, self.roffeast = self.runoff(
-            self.H, Trminus1, Trplus1, self.dt, self.dy, self.L
-        )
-        self.surface_runoff
-        self.roff = self.roffwest + self.roffeast + np.mean(self.surface_runoff)
+    def iterate_picard_scenarios(
+        self, S, Trminus0, Hminus, Trplus0, Hplus, h0ts_west, h0ts_east
+    ):
+        """
+        Picard iteration of all scenarios together: the scenarios that have not converged are
+        solved in one banded system per iteration and a converged scenario stops iterating,
+        so each scenario gets the same iterates as alone. Input as in iterate_picard with the
+        scenarios in the first axis.
+        Returns also the index of the last iteration and the convergence of each scenario,
+        arrays (nscens,)
+        """
+        Htmp1 = self.H.copy()
+        Trminus1 = np.zeros(self.shape)
+        Trplus1 = np.zeros(self.shape)
+        h0_west = np.broadcast_to(h0ts_west, self.nscens)
+        h0_east = np.broadcast_to(h0ts_east, self.nscens)
+        it = np.zeros(self.nscens, dtype=int)
+        active = np.arange(self.nscens)  # scenarios still iterating
+        for iteration in range(self.max_iterations):
+            Hnew, Trminus1[active], Trplus1[active] = self.picard_step(
+                Htmp1[active],
+                S[active],
+                Trminus0[active],
+                Hminus[active],
+                Trplus0[active],
+                Hplus[active],
+                h0_west[active],
+                h0_east[active],
+                H=self.H[active],
+            )
+            Hnew = np.where(Hnew > self.ele, self.ele, Hnew)  # cut the surface water
+            conv = np.max(np.abs(Hnew - Htmp1[active]), axis=-1)  # define convergence
+            Htmp1[active] = Hnew
+            it[active] = iteration
+            active = active[conv >= self.tolerance]
+            if len(active) == 0:
+                break
+        converged = np.ones(self.nscens, dtype=bool)
+        converged[active] = False  # still iterating after max_iterations
+        return Htmp1, Trminus1, Trplus1, it, converged
 
-        self.dwt = self.H - self.ele
-        self.air_ratio = self.dwtToRat(self.dwt)
-        self.afp = self.dwtToAfp(self.dwt)
-        # **************************************************
+    def picard_step(
+        self,
+        Htmp1,
+        S,
+        Trminus0,
+        Hminus,
+        Trplus0,
+        Hplus,
+        h0ts_west,
+        h0ts_east,
+        H=None,
+    ):
+        """
+        One linear solve with transmissivity and storage coefficient from the iterate Htmp1.
+        H is the head in the beginning of the step, self.H if None; in lock-step Htmp1 and H
+        are given for the scenarios that are still iterating.
+        """
+        n = self.n
+        if H is None:
+            H = self.H
+        Tr1 = np.maximum(
+            self.dwtToTra(Htmp1 - self.ele), 0.0
+        )  # transmissivity in new iteration
+        CC = self.C(Htmp1 - self.ele)  # storage coefficient in new iteration
+        Trminus1, Trplus1 = self.gmeanTr(
+            Tr1
+        )  # geometric mean of adjacent node transmissivity
+        alfa = CC * self.dy**2 / self.dt
+        if self.solve_mode == "banded":
+            A = (
+                self.A if self.nscens is None else self.A[:, : len(Htmp1)]
+            )  # in lock-step the first rows of the buffer hold the iterating scenarios
+            A = self.Amatrix_banded(
+                A, n, self.implic, Trminus1, Trplus1, alfa
+            )  # fill the diagonals in place
+            A = self.boundConst_banded(A, n)  # constant head boundaries
+        else:
+            self.A = self.Amatrix(
+                self.A, n, self.implic, Trminus1, Trplus1, alfa
+            )  # construct tridiaginal matrix
+            A = self.boundConst(self.A, n)  # constant head boundaries to A matrix
+        hs = self.rightSide(
+            S,
+            self.dy,
+            self.implic,
+            alfa,
+            H,
+            Trminus0,
+            Hminus,
+            Trplus0,
+            Hplus,
+            self.DrIrr,
+            Htmp1,
+            self.ele,
+            h0ts_west,
+            h0ts_east,
+        )  # right hand side of the equation
+        return self.solve_system(A, hs), Trminus1, Trplus1
+
+    def iterate_newton(self, S, Trminus0, Hminus, Trplus0, Hplus, h0ts_west, h0ts_east):
+        """
+        Newton iteration with the analytic Jacobian of the discrete equations.
+        The unknown is the head G before the surface cut, H = min(G, ele), so that the iteration
+        converges to the same solution as the Picard iteration. For interior nodes the residual is
+            R_i = alfa_i (G_i - H_i,old) + implic (F_i-1/2 (G_i - G_i-1) + F_i+1/2 (G_i - G_i+1)) - b_i
+        where F is the geometric mean of node transmissivities and alfa the storage coefficient term,
+        both evaluated at H. The Dirichlet rows are lagged as in the Picard iteration.
+        The Jacobian is tridiagonal and solved as a banded system, the step is damped with a
+        backtracking line search. If the line search does not reduce the residual, the rest of the
+        time step continues with Picard steps. Initial guess is the linear extrapolation of the
+        previous days' heads. Returns as iterate_picard.
+        """
+        n = self.n
+        zeros = np.zeros(n)
+        b = self.rightSide(
+            S,
+            self.dy,
+            self.implic,
+            zeros,
+            self.H,
+            Trminus0,
+            Hminus,
+            Trplus0,
+            Hplus,
+            self.DrIrr,
+            self.H,
+            self.ele,
+            h0ts_west,
+            h0ts_east,
+        )  # source and explicit part of the right hand side
+        G = self.H + self.dt / self.dt_previous * (
+            self.H - self.H_previous
+        )  # warm start
+        G[0], G[n - 1] = self.H[0], self.H[n - 1]
+        Htmp = np.minimum(G, self.ele)
+        R, terms = self.newton_residual(G, b, h0ts_west, h0ts_east)
+        newton = True  # switches to Picard steps if the Newton direction fails
+        converged = False
+        for it in range(self.max_iterations):
+            if newton:
+                J = self.newton_jacobian(G, terms)
+                step = linalg.solve_banded(
+                    (1, 1), J, -R, overwrite_ab=True, check_finite=False
+                )
+                norm0 = np.max(np.abs(R))
+                lam = 1.0
+                while lam >= 0.1:  # backtracking line search
+                    G1 = G + lam * step
+                    R, terms = self.newton_residual(G1, b, h0ts_west, h0ts_east)
+                    if np.max(np.abs(R)) <= norm0:
+                        break
+                    lam *= 0.5
+                else:  # no descent along the Newton direction
+                    newton = False
+            if not newton:
+                G1, _, _ = self.picard_step(
+                    Htmp, S, Trminus0, Hminus, Trplus0, Hplus, h0ts_west, h0ts_east
+                )
+                R, terms = self.newton_residual(G1, b, h0ts_west, h0ts_east)
+            G = G1
+            Htmp1 = np.minimum(G, self.ele)  # cut the surface water
+            conv = max(np.abs(Htmp1 - Htmp))  # define convergence
+            Htmp = Htmp1
+            if conv < self.tolerance:
+                converged = True
+                break
+        Trminus1, Trplus1 = self.gmeanTr(terms["Tr"])
+        return Htmp1, Trminus1, Trplus1, it, converged
 
-        return self.dwt, self.H, self.roff, self.air_ratio, self.afp
+    def newton_residual(self, G, b, h0ts_west, h0ts_east):
+        """
+        Residual of the discrete equations and the terms needed in the Jacobian
+        """
+        n = self.n
+        H = np.minimum(G, self.ele)
+        dwt = H - self.ele
+        Tr = np.maximum(self.dwtToTra(dwt), 0.0)
+        F = np.sqrt(Tr[: n - 1] * Tr[1:])  # transmissivity between adjacent nodes
+        dG = G[1:] - G[: n - 1]
+        alfa = self.C(dwt) * self.dy**2 / self.dt
+        q = F * dG
+        R = alfa * (G - self.H) - b
+        R[1 : n - 1] += self.implic * (q[: n - 2] - q[1:])
+        h_west, h_east = self.boundary_heads(
+            self.DrIrr, H, self.ele, h0ts_west, h0ts_east
+        )
+        R[0] = G[0] - h_west
+        R[n - 1] = G[n - 1] - h_east
+        terms = {"Tr": Tr, "F": F, "dG": dG, "alfa": alfa, "dwt": dwt}
+        return R, terms
+
+    def newton_jacobian(self, G, terms):
+        """
+        Tridiagonal Jacobian of the residual in banded storage:
+        row 0 upper diagonal, row 1 main diagonal, row 2 lower diagonal
+        """
+        n = self.n
+        Tr, F, dG, alfa, dwt = (
+            terms["Tr"],
+            terms["F"],
+            terms["dG"],
+            terms["alfa"],
+            terms["dwt"],
+        )
+        unsaturated = G < self.ele  # coefficients are constant above the surface
+        dTr = np.where((Tr > 0.0) & unsaturated, self.dwtToTra(dwt, 1), 0.0)
+        dalfa = np.where(
+            unsaturated, self.C.derivative(dwt) * self.dy**2 / self.dt, 0.0
+        )
+        Fsafe = np.where(F > 0.0, F, 1.0)
+        dFleft = np.where(F > 0.0, 0.5 * Tr[1:] * dTr[: n - 1] / Fsafe, 0.0)
+        dFright = np.where(F > 0.0, 0.5 * Tr[: n - 1] * dTr[1:] / Fsafe, 0.0)
+
+        J = np.zeros((3, n))
+        J[1, :] = alfa + dalfa * (G - self.H)
+        J[1, 1 : n - 1] += self.implic * (
+            F[: n - 2] + F[1:] + dFright[: n - 2] * dG[: n - 2] - dFleft[1:] * dG[1:]
+        )
+        J[2, : n - 2] = self.implic * (-F[: n - 2] + dFleft[: n - 2] * dG[: n - 2])
+        J[0, 2:] = self.implic * (-F[1:] - dFright[1:] * dG[1:])
+        J[1, 0] = 1.0  # Dirichlet, west boundary
+        J[1, n - 1] = 1.0  # Dirichlet, east boundary
+        return J
 
     def Hadjacent(self, H):
         """
@@ -186,11 +619,10 @@ class StripHydrology:
         Output:
             Hwest H(i-1), Heast H(i+1)
         """
-        n = len(H)
-        Hwest = H[0 : n - 1]
-        Hwest = np.append(Hwest, 0.0)
-        Heast = H[1:]
-        Heast = np.insert(Heast, 0, 0.0)
+        n = H.shape[-1]
+        zero = np.zeros(H.shape[:-1] + (1,))
+        Hwest = np.concatenate([H[..., 0 : n - 1], zero], axis=-1)
+        Heast = np.concatenate([zero, H[..., 1:]], axis=-1)
         return Hwest, Heast
 
     def Amatrix(self, A, n, implic, Trwest, Treast, alfa):
@@ -214,6 +646,44 @@ class StripHydrology:
         A[n - 1, n - 2] = 0.0  # Dirichlet, east boundary
         return A
 
+    def Amatrix_banded(self, A, n, implic, Trwest, Treast, alfa):
+        """
+        Tridiagonal matrix in the banded storage of scipy.linalg.solve_banded:
+        row 0 upper diagonal, row 1 main diagonal, row 2 lower diagonal.
+        In lock-step the diagonals of each scenario are in A[:, scenario]
+        """
+        A[0, ..., 1:] = -implic * Treast[..., 1:]  # East element
+        A[1, ...] = implic * (Trwest + Treast) + alfa  # diagonal element
+        A[2, ..., : n - 1] = -implic * Trwest[..., : n - 1]  # West element
+        return A
+
+    def boundConst_banded(self, A, n):
+        """
+        Diriclet (constant head boundary conditions) in banded storage. The unused corners of the
+        diagonals are kept zero, in lock-step the buffer is reused after solves that overwrite it.
+        """
+        A[0, ..., 0] = 0.0
+        A[2, ..., n - 1] = 0.0
+        A[1, ..., 0] = 1.0
+        A[0, ..., 1] = 0.0  # Dirichlet, west boundary
+        A[1, ..., n - 1] = 1.0
+        A[2, ..., n - 2] = 0.0  # Dirichlet, east boundary
+        return A
+
+    def solve_system(self, A, hs):
+        if self.solve_mode == "banded":
+            # Scenarios in lock-step are one block diagonal system: the Dirichlet rows
+            # separate the strips, and the unused corners of their diagonals are zero
+            return linalg.solve_banded(
+                (1, 1),
+                A.reshape(3, -1),
+                hs.ravel(),
+                overwrite_ab=True,
+                check_finite=False,
+            ).reshape(hs.shape)
+        else:
+            return np.linalg.multi_dot([np.linalg.inv(A), hs])
+
     def boundNoFlow(A, n, implic, Trwest, Treast, alfa):
         """
         Diriclet (constant head boundary conditions)
@@ -229,7 +699,6 @@ class StripHydrology:
     def rightSide(
         self,
         S,
-        dt,
         dy,
         implic,
         alfa,
@@ -245,25 +714,38 @@ class StripHydrology:
         h0_east,
     ):
         hs = (
-            S * dt * dy**2
+            S * dy**2
             + alfa * H
             + (1 - implic) * (Trminus0 * Hminus)
             - (1 - implic) * (Trminus0 + Trplus0) * H
             + (1 - implic) * (Trplus0 * Hplus)
         )
-        n = len(Htmp1)
+        n = Htmp1.shape[-1]
+        hs[..., 0], hs[..., n - 1] = self.boundary_heads(
+            DrIrr, Htmp1, ele, h0_west, h0_east
+        )
+        return hs
 
+    def boundary_heads(self, DrIrr, Htmp1, ele, h0_west, h0_east):
+        """
+        Head in the west and east ditch nodes for the Dirichlet rows
+        """
+        n = Htmp1.shape[-1]
         if not DrIrr:
-            hs[0] = Htmp1[1] if Htmp1[0] > Htmp1[1] else min(ele[0] + h0_west, Htmp1[1])
-            hs[n - 1] = (
-                Htmp1[n - 2]
-                if Htmp1[n - 1] > Htmp1[n - 2]
-                else min(ele[n - 1] + h0_east, Htmp1[n - 2])
+            h_west = np.where(
+                Htmp1[..., 0] > Htmp1[..., 1],
+                Htmp1[..., 1],
+                np.minimum(ele[0] + h0_west, Htmp1[..., 1]),
+            )
+            h_east = np.where(
+                Htmp1[..., n - 1] > Htmp1[..., n - 2],
+                Htmp1[..., n - 2],
+                np.minimum(ele[n - 1] + h0_east, Htmp1[..., n - 2]),
             )  # if wt below canal water level, lower the canal wl to prevent water inflow to compartment
         else:
-            hs[0] = ele[0] + h0_west
-            hs[n - 1] = ele[n - 1] + h0_east
-        return hs
+            h_west = ele[0] + h0_west
+            h_east = ele[n - 1] + h0_east
+        return h_west, h_east
 
     def gmeanTr(self, Tr):
         """
@@ -272,20 +754,21 @@ class StripHydrology:
         Output:
             Transmissivity, tr in west surface sqrt(Tr(i-1)*Tr(i)) and east sqrt(Tr(i)*Tr(i+1))
         """
-        n = len(Tr)
-        trwest = np.maximum(Tr[: n - 1] * Tr[1:], 0.0)
+        n = Tr.shape[-1]
+        zero = np.zeros(Tr.shape[:-1] + (1,))
+        trwest = np.maximum(Tr[..., : n - 1] * Tr[..., 1:], 0.0)
         # Trwest = np.sqrt(Tr[:n-1]*Tr[1:])
         Trwest = np.sqrt(trwest)
-        Trwest = np.append(Trwest, 0.0)
-        treast = np.maximum(Tr[1:] * Tr[: n - 1], 0.0)
+        Trwest = np.concatenate([Trwest, zero], axis=-1)
+        treast = np.maximum(Tr[..., 1:] * Tr[..., : n - 1], 0.0)
         # Treast = np.sqrt(Tr[1:]*Tr[:n-1])
         Treast = np.sqrt(treast)
-        Treast = np.insert(Treast, 0, 0.0)
+        Treast = np.concatenate([zero, Treast], axis=-1)
         return Trwest, Treast
 
     def runoff(self, H, Trminus, Trplus, dt, dy, L):
-        roffwest = ((H[1] - H[0]) / dy * Trminus[0] * dt) / L
-        roffeast = (H[-2] - H[-1]) / dy * Trplus[-1] * dt / L
+        roffwest = ((H[..., 1] - H[..., 0]) / dy * Trminus[..., 0] * dt) / L
+        roffeast = (H[..., -2] - H[..., -1]) / dy * Trplus[..., -1] * dt / L
         return roffwest, roffeast
 
     def create_outarrays(self, nrounds, ndays, ncols):
@@ -312,6 +795,9 @@ class StripHydrology:
         stpout["surfacerunoff"] = np.zeros(
             (nrounds, ndays, ncols), dtype=float
         )  # daily surfacerunoff, here in m, from each column
+        stpout["iterations"] = np.zeros(
+            (nrounds, ndays), dtype=int
+        )  # number of nonlinear iterations in each day
 
         return stpout
 
@@ -327,24 +813,46 @@ class StripHydrology:
         stpout["surfacerunoff"][r, d, :] = (
             self.surface_runoff
         )  # daily surfacerunoff, here in m, from each column
+        stpout["iterations"][r, d] = self.iterations
 
         return stpout
 
     def update_residence_time(self, dfwt):
-        timetoditch = np.zeros(self.n)  # residence time from column to ditch, days
+        """
+        Residence time of water from each column to the ditch, days
+            dfwt daily water tables of the year, data frame (days, n), in lock-step array (nscens, days, n)
+        """
         porosity = 0.9
         K = 10 ** (-4) * 86400  # generic Koivusalo et al, 2008
 
         dist = np.arange(0, self.n * self.dy, self.dy)  # distance array
-        H = self.ele + dfwt.mean(axis=0)  # water table height to common datum
+        mean_wt = (
+            dfwt.mean(axis=-2) if isinstance(dfwt, np.ndarray) else dfwt.mean(axis=0)
+        )
+        H = self.ele + mean_wt  # water table height to common datum
         rtime = self.dy / (
-            K * np.gradient(H, dist) / porosity
+            K * np.gradient(H, dist, axis=-1) / porosity
         )  # residence time within a column
-        self.ixwest = np.where(rtime > 0)  # separate with directions, west, east
-        self.ixeast = np.where(rtime < 0)
-
-        timetoditch[self.ixwest] = np.cumsum(rtime[self.ixwest])
-        timetoditch[self.ixeast] = np.flip(np.cumsum(np.flip(rtime[self.ixeast] * -1)))
+        self.west = rtime > 0  # separate with directions, west, east
+        self.east = rtime < 0
+        self.ixwest = np.where(self.west)
+        self.ixeast = np.where(self.east)
+        self.west_share = (
+            np.count_nonzero(self.west, axis=-1) / self.n
+        )  # share of columns
+        self.east_share = np.count_nonzero(self.east, axis=-1) / self.n
+
+        timetoditch = np.where(
+            self.west, np.cumsum(np.where(self.west, rtime, 0.0), axis=-1), 0.0
+        )  # cumulative from the west ditch, each strip separately
+        timetoditch = np.where(
+            self.east,
+            np.flip(
+                np.cumsum(np.flip(np.where(self.east, rtime * -1, 0.0), -1), axis=-1),
+                -1,
+            ),
+            timetoditch,
+        )  # and from the east ditch
 
         self.residence_time = timetoditch
 
@@ -11,7 +11,7 @@ import numpy as np
 import pandas as pd
 
 from susi.core.canopygrid import CanopyGrid
-from susi.core.esom import Esom
+from susi.core.esom import Esom, EsomSubstances
 from susi.core.fertilization import Fertilization
 
 # from docclass import DocModel
@@ -24,12 +24,14 @@ from susi.core.strip import StripHydrology, drain_depth_development
 from susi.core.susi_io import print_site_description
 from susi.io.simulation_configuration_model import SimulationParams
 from susi.core.susi_utils import (
+    CompiledForcing,
     get_temp_sum,
     heterotrophic_respiration_yr,
     ojanen_2019,
     rew_drylimit,
 )
-from susi.core.temperature import PeatTemperature
+from susi.core.table_cache import table_cache
+from susi.core.temperature import PeatTemperature, PeatTemperatureColumns
 from susi.io.susi_parameter_model import (
     CanopyStateParametersArray,
     OrganicLayerParametersArray,
@@ -85,6 +87,7 @@ class Susi:
         length = (end_date - start_date).days + 1  # simulation time in days
         yrs = end_yr - start_yr + 1  # simulation time in years
         ts = get_temp_sum(forc)  # temperature sum degree days
+        forcing = CompiledForcing(forc)  # daily forcing as arrays
         nscens = len(spara.ditch_depth_east)  # number of scenarios
         n = spara.n  # number of columns along the strip
 
@@ -121,6 +124,8 @@ class Susi:
             ageSim,
             mottifile,
             photopara,
+            column_groups=spara.vegetation_column_groups,
+            table_cache=table_cache(spara),
         )  # create stand class
         stand.update()
         # spara = stand.update_spara(spara)
@@ -152,18 +157,25 @@ class Susi:
         )
         out.initialize_gv()  # output variables to netCDF
 
-        esmass = Esom(
-            spara, sfc, 366 * yrs, substance="Mass"
-        )  # initializing organic matter decomposition instace for mass
-        esN = Esom(
-            spara, sfc, 366 * yrs, substance="N"
-        )  # initializing organic matter decomposition instace for N
-        esP = Esom(
-            spara, sfc, 366 * yrs, substance="P"
-        )  # initializing organic matter decomposition instace for P
-        esK = Esom(
-            spara, sfc, 366 * yrs, substance="K"
-        )  # initializing organic matter decomposition instace for K
+        if spara.esom_engine == "combined":
+            esoms = EsomSubstances(
+                spara, sfc, 366 * yrs
+            )  # organic matter decomposition of mass, N, P and K in one state array
+            esmass, esN, esP, esK = esoms.members  # per-substance views
+        else:
+            esoms = None
+            esmass = Esom(
+                spara, sfc, 366 * yrs, substance="Mass"
+            )  # initializing organic matter decomposition instace for mass
+            esN = Esom(
+                spara, sfc, 366 * yrs, substance="N"
+            )  # initializing organic matter decomposition instace for N
+            esP = Esom(
+                spara, sfc, 366 * yrs, substance="P"
+            )  # initializing organic matter decomposition instace for P
+            esK = Esom(
+                spara, sfc, 366 * yrs, substance="K"
+            )  # initializing organic matter decomposition instace for K
         ferti = Fertilization(spara)  # initializing fertilization object
 
         out.initialize_esom("Mass")  # creating output variables for organic matter
@@ -201,9 +213,18 @@ class Susi:
         stp = StripHydrology(spara)  # initialize soil hydrology model
         out.initialize_strip(stp)  # outputs for soil hydrology
 
-        pt = PeatTemperature(
-            spara, forc["T"].mean()
-        )  # initialize peat temperature model
+        if spara.temperature_columns:
+            pt = PeatTemperatureColumns(
+                spara, forc["T"].mean(), (1, n)
+            )  # peat temperature model for each column, one scenario at a time
+            column_temperatures = np.zeros(
+                (366, n, spara.nLyrs)
+            )  # daily peat temperatures in each column during the year
+        else:
+            pt = PeatTemperature(
+                spara, forc["T"].mean()
+            )  # initialize peat temperature model
+            column_temperatures = None
         out.initialize_temperature()
 
         ch4s = Methane(n, yrs)  # methane output model
@@ -230,7 +251,16 @@ class Susi:
             rounds, length, n
         )  # outputs for canopy hydrology model
 
+        cpy.precompute_forcing(
+            forcing.T, forcing.Prec / 86400.0, forcing.vpd, dtc
+        )  # weather terms of the canopy for the whole period, same in all scenarios
+
         # ***********Scenario loop ********************************************************
+        # The ditch depth scenarios run one after another: stand, ground vegetation and
+        # fertilization hold one scenario at a time, and their annual update feeds the canopy
+        # and strip of the next year. The lock-step strip StripHydrology(spara, nscens) and the
+        # (nscens, ncols) state of CanopyGrid and MossLayer are for use once these models carry
+        # a scenario axis.
 
         for r, dr in enumerate(
             zip(
@@ -283,10 +313,13 @@ class Susi:
             )
             out.write_groundvegetation(r, 0, groundvegetation)
 
-            esmass.reset_storages()
-            esN.reset_storages()
-            esP.reset_storages()
-            esK.reset_storages()
+            if esoms is not None:
+                esoms.reset_storages()
+            else:
+                esmass.reset_storages()
+                esN.reset_storages()
+                esP.reset_storages()
+                esK.reset_storages()
 
             out.write_esom(r, 0, "Mass", esmass, inivals=True)
             out.write_esom(r, 0, "N", esN, inivals=True)
@@ -295,6 +328,8 @@ class Susi:
 
             stp.reset_domain()
             pt.reset_domain()
+            if r > 0:
+                cpy.precompute_phenology()  # continues from the end of the previous scenario
 
             d = 0  # day index
             start = 0  # day counter in annual loop
@@ -314,12 +349,12 @@ class Susi:
                     reww = rew_drylimit(
                         dwt
                     )  # for each column: moisture limitation from ground water level (Feddes-function)
-                    doy = forc.iloc[d, 14]  # day of the year
-                    ta = forc.iloc[d, 4]  # air temperature deg C
-                    vpd = forc.iloc[d, 13]  # vapor pressure deficit
-                    rg = forc.iloc[d, 8]  # solar radiation
-                    par = forc.iloc[d, 10]  # photosynthetically active radiation
-                    prec = forc.iloc[d, 7] / 86400.0  # precipitation
+                    doy = forcing.doy[d]  # day of the year
+                    ta = forcing.T[d]  # air temperature deg C
+                    vpd = forcing.vpd[d]  # vapor pressure deficit
+                    rg = forcing.Rg[d]  # solar radiation
+                    par = forcing.Par[d]  # photosynthetically active radiation
+                    prec = forcing.Prec[d] / 86400.0  # precipitation
 
                     potinf, trfall, interc, evap, ET, transpi, efloor, MBE, SWE = (
                         cpy.run_timestep(
@@ -334,6 +369,7 @@ class Susi:
                             LAIconif=stand.leafarea,
                             Rew=reww,
                             beta=moss.Ree,
+                            day=d,
                         )
                     )  # canopy hydrology computation
 
@@ -367,12 +403,22 @@ class Susi:
                     )  # strip/peat hydrology
                     stpout = stp.update_outarrays(r, d, stpout)
 
-                    z, peat_temperature = pt.run_timestep(
-                        ta,
-                        np.mean(SWE),
-                        np.mean(efloor),
-                        solution_mode=spara.temperature_solve_mode,
-                    )  # peat temperature in different depths
+                    if spara.temperature_columns:
+                        z, column_temperature = pt.run_timestep(
+                            ta,
+                            SWE,
+                            efloor,
+                            solution_mode=spara.temperature_solve_mode,
+                        )  # peat temperature in different depths in each column
+                        column_temperatures[dd] = column_temperature[0]
+                        peat_temperature = np.mean(column_temperature[0], axis=0)
+                    else:
+                        z, peat_temperature = pt.run_timestep(
+                            ta,
+                            np.mean(SWE),
+                            np.mean(efloor),
+                            solution_mode=spara.temperature_solve_mode,
+                        )  # peat temperature in different depths
                     peat_temperatures[r, d, :] = peat_temperature
 
                     swes[r, d] = np.mean(SWE)  # snow water equivalent
@@ -380,6 +426,7 @@ class Susi:
                 # ******* End of daily loop*****************************
 
                 # ----- Hydrology and temperature-related variables to time-indexed dataframes -----------------
+                weather = forcing.year(yr)  # forcing of the year
                 sday = datetime.datetime(yr, 1, 1)  # start day of the year
                 df_peat_temperatures = pd.DataFrame(
                     peat_temperatures[r, start : start + days, :],
@@ -434,9 +481,7 @@ class Susi:
                     ageSim["dominant"],
                 )
 
-                stand.assimilate(
-                    forc.loc[str(yr)], dfwt.loc[str(yr)], dfafp.loc[str(yr)]
-                )
+                stand.assimilate(weather, dfwt.loc[str(yr)], dfafp.loc[str(yr)])
                 stand.update()
 
                 # --------- Locate cuttings here--------------------
@@ -464,10 +509,13 @@ class Susi:
                 # ---------------- Fertilization --------------------------------
                 if yr >= spara.fertilization.application_year:
                     pH_increment = ferti.ph_effect(yr)
-                    esmass.update_soil_pH(pH_increment)
-                    esN.update_soil_pH(pH_increment)
-                    esP.update_soil_pH(pH_increment)
-                    esK.update_soil_pH(pH_increment)
+                    if esoms is not None:
+                        esoms.update_soil_pH(pH_increment)
+                    else:
+                        esmass.update_soil_pH(pH_increment)
+                        esN.update_soil_pH(pH_increment)
+                        esP.update_soil_pH(pH_increment)
+                        esK.update_soil_pH(pH_increment)
                 ferti.nutrient_release(yr)
                 out.write_fertilization(r, year + 1, ferti)
 
@@ -477,6 +525,11 @@ class Susi:
                     harvested volume and biomass to outputs
                     construct balcances at the end of simulation, join to outputs
                 """
+                year_column_temperatures = (
+                    column_temperatures[:days]
+                    if column_temperatures is not None
+                    else None
+                )  # peat temperatures of the year in each column
                 nonwoodylitter = (
                     stand.nonwoodylitter
                     + stand.nonwoody_lresid
@@ -489,15 +542,6 @@ class Susi:
                     + stand.woody_litter_mort
                     + groundvegetation.woodylitter
                 ) / 10000.0
-                esmass.run_yr(
-                    forc.loc[str(yr)],
-                    df_peat_temperatures,
-                    dfwt,
-                    nonwoodylitter,
-                    woodylitter,
-                )
-                esmass.compose_export(stp, df_peat_temperatures)
-                out.write_esom(r, year + 1, "Mass", esmass)
 
                 n_nonwoodylitter = (
                     stand.n_nonwoodylitter
@@ -512,14 +556,6 @@ class Susi:
                     + stand.n_woody_litter_mort
                     + groundvegetation.n_litter_w
                 ) / 10000.0
-                esN.run_yr(
-                    forc.loc[str(yr)],
-                    df_peat_temperatures,
-                    dfwt,
-                    n_nonwoodylitter,
-                    n_woodylitter,
-                )
-                out.write_esom(r, year + 1, "N", esN)
 
                 p_nonwoodylitter = (
                     stand.p_nonwoodylitter
@@ -533,14 +569,6 @@ class Susi:
                     + stand.p_woody_litter_mort
                     + groundvegetation.p_litter_w
                 ) / 10000.0
-                esP.run_yr(
-                    forc.loc[str(yr)],
-                    df_peat_temperatures,
-                    dfwt,
-                    p_nonwoodylitter,
-                    p_woodylitter,
-                )
-                out.write_esom(r, year + 1, "P", esP)
 
                 k_nonwoodylitter = (
                     stand.k_nonwoodylitter
@@ -554,13 +582,74 @@ class Susi:
                     + stand.k_woody_litter_mort
                     + groundvegetation.k_litter_w
                 ) / 10000.0
-                esK.run_yr(
-                    forc.loc[str(yr)],
-                    df_peat_temperatures,
-                    dfwt,
-                    k_nonwoodylitter,
-                    k_woodylitter,
+                if year == 0 and spara.esom_initial_state != "mor":
+                    for substance, es, litter in (
+                        ("Mass", esmass, (nonwoodylitter, woodylitter)),
+                        ("N", esN, (n_nonwoodylitter, n_woodylitter)),
+                        ("P", esP, (p_nonwoodylitter, p_woodylitter)),
+                        ("K", esK, (k_nonwoodylitter, k_woodylitter)),
+                    ):
+                        es.initialize_mor(
+                            spara.esom_initial_state,
+                            weather,
+                            df_peat_temperatures,
+                            dfwt,
+                            *litter,
+                            year_column_temperatures,
+                        )  # mor storages in equilibrium with the first year
+                        out.write_esom(r, 0, substance, es, inivals=True)
+                if esoms is not None:
+                    esoms.run_yr(
+                        weather,
+                        df_peat_temperatures,
+                        dfwt,
+                        {
+                            "Mass": (nonwoodylitter, woodylitter),
+                            "N": (n_nonwoodylitter, n_woodylitter),
+                            "P": (p_nonwoodylitter, p_woodylitter),
+                            "K": (k_nonwoodylitter, k_woodylitter),
+                        },
+                        year_column_temperatures,
+                    )
+                else:
+                    esmass.run_yr(
+                        weather,
+                        df_peat_temperatures,
+                        dfwt,
+                        nonwoodylitter,
+                        woodylitter,
+                        year_column_temperatures,
+                    )
+                    esN.run_yr(
+                        weather,
+                        df_peat_temperatures,
+                        dfwt,
+                        n_nonwoodylitter,
+                        n_woodylitter,
+                        year_column_temperatures,
+                    )
+                    esP.run_yr(
+                        weather,
+                        df_peat_temperatures,
+                        dfwt,
+                        p_nonwoodylitter,
+                        p_woodylitter,
+                        year_column_temperatures,
+                    )
+                    esK.run_yr(
+                        weather,
+                        df_peat_temperatures,
+                        dfwt,
+                        k_nonwoodylitter,
+                        k_woodylitter,
+                        year_column_temperatures,
+                    )
+                esmass.compose_export(
+                    stp, df_peat_temperatures, year_column_temperatures
                 )
+                out.write_esom(r, year + 1, "Mass", esmass)
+                out.write_esom(r, year + 1, "N", esN)
+                out.write_esom(r, year + 1, "P", esP)
                 out.write_esom(r, year + 1, "K", esK)
 
                 stand.update_nutrient_status(
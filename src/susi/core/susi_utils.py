@@ -135,9 +135,70 @@ def peat_hydrol_properties(x, unit="g/cm3", var="bd", ptype="A"):
     return vgen, Ksat
 
 
+class LookupTable:
+    """
+    Piecewise linear interpolation table, replaces scipy interp1d for the hydraulic functions
+    that are called several times in each time step.
+    On a uniform grid the interval is found with index arithmetic, otherwise with a binary search.
+    Input:
+        x grid, monotonic, increasing or decreasing
+        y values in the grid points
+        fill_value 'extrapolate' for linear extrapolation from the end intervals,
+            or tuple (below, above) of constant values outside the grid
+    """
+
+    def __init__(self, x, y, fill_value="extrapolate"):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        order = np.argsort(x, kind="stable")
+        self.x = x[order]  # grid, increasing
+        self.y = y[order]  # values in the grid
+        self.slopes = np.diff(self.y) / np.diff(self.x)  # slope in each interval
+        self.x0 = self.x[0]
+        self.dx = (self.x[-1] - self.x[0]) / (len(self.x) - 1)  # grid spacing
+        self.inv_dx = 1.0 / self.dx
+        self.uniform = np.allclose(
+            np.diff(self.x), self.dx, rtol=1e-9, atol=0.0
+        )  # index arithmetic only in fixed grid spacing
+        self.last = len(self.x) - 2  # index of the last interval
+        self.fill_value = fill_value
+
+    def interval(self, xnew):
+        """
+        Index of the grid interval of each xnew, end intervals used outside the grid
+        """
+        if self.uniform:
+            ix = ((xnew - self.x0) * self.inv_dx).astype(
+                np.intp
+            )  # truncation equals floor after the clip below
+        else:
+            ix = np.searchsorted(self.x, xnew) - 1
+        return np.minimum(np.maximum(ix, 0), self.last)
+
+    def __call__(self, xnew):
+        xnew = np.asarray(xnew, dtype=float)
+        ix = self.interval(xnew)
+        ynew = self.y[ix] + self.slopes[ix] * (xnew - self.x[ix])
+        if not isinstance(self.fill_value, str):
+            below, above = self.fill_value
+            ynew = np.where(xnew < self.x[0], below, ynew)
+            ynew = np.where(xnew > self.x[-1], above, ynew)
+        return ynew
+
+    def derivative(self, xnew):
+        """
+        Analytic derivative of the interpolant, constant in each grid interval
+        """
+        xnew = np.asarray(xnew, dtype=float)
+        dy = self.slopes[self.interval(xnew)]
+        if not isinstance(self.fill_value, str):
+            dy = np.where((xnew < self.x[0]) | (xnew > self.x[-1]), 0.0, dy)
+        return dy
+
+
 def CWTr(nLyrs, z, dz, pF, Ksat, direction="positive"):
     """
-    Returns interpolation functions
+    Returns interpolation functions, LookupTable objects except the transmissivity spline
         sto=f(gwl)  profile water storage as a function ofground water level
         gwl=f(sto)  ground water level
         tra=f(gwl)  transissivity
@@ -149,6 +210,14 @@ def CWTr(nLyrs, z, dz, pF, Ksat, direction="positive"):
         Ksat saturated hydraulic conductivity in m s-1
         direction: positive or negative downwards
     """
+    return hydraulic_functions(hydraulic_tables(nLyrs, z, dz, pF, Ksat, direction))
+
+
+def hydraulic_tables(nLyrs, z, dz, pF, Ksat, direction="positive"):
+    """
+    Tabulated values behind the CWTr interpolation functions as a dict of arrays,
+    input as in CWTr. Kept separate so that the tables can be stored in the table cache.
+    """
     # -------Parameters ---------------------
     z = np.array(z)
     dz = np.array(dz)
@@ -184,7 +253,7 @@ def CWTr(nLyrs, z, dz, pF, Ksat, direction="positive"):
             for g in gwl
         ]
 
-    gwlToSto = interp1d(np.array(gwl), np.array(sto), fill_value="extrapolate")
+    gwlToSto = LookupTable(gwl, sto)
     airtot = sto[0] - sto  # m air in the profile
     airroot = storoot[0] - storoot  # m air in the rooting zone
     afproot = (storoot2[0] - storoot2) / (
@@ -201,28 +270,42 @@ def CWTr(nLyrs, z, dz, pF, Ksat, direction="positive"):
     gwl.reverse()
     ratio.reverse()
     afproot.reverse()
-    stoToGwl = interp1d(np.array(sto), np.array(gwl), fill_value="extrapolate")
-    gwlToRatio = interp1d(np.array(gwl[1:]), np.array(ratio), fill_value="extrapolate")
-    gwlToAfp = interp1d(np.array(gwl), np.array(afproot), fill_value="extrapolate")
-    C = interp1d(
-        np.array(gwl),
-        np.array(np.gradient(gwlToSto(gwl)) / np.gradient(gwl)),
-        fill_value="extrapolate",
-    )  # storage coefficient function
-
-    del gwl, sto, ratio, afproot
+    C = np.gradient(gwlToSto(gwl)) / np.gradient(gwl)  # storage coefficient
 
     # ----------Transmissivity-------------------
     K = np.array(Ksat * 86400.0)  # from m/s to m/day
     tr = [sum(K[t:] * dz[t:]) for t in range(nLyrs)]
     if direction == "positive":
-        gwlToTra = interS(z, np.array(tr))
+        tra_z = z
     else:
         z = list(z)
         z.reverse()
         tr.reverse()
-        gwlToTra = interS(-np.array(z), np.array(tr))
-    del tr
+        tra_z = -np.array(z)
+    return {
+        "gwl": np.array(gwl),
+        "sto": np.array(sto),
+        "C": np.array(C),
+        "ratio": np.array(ratio),
+        "afp": np.array(afproot),
+        "tra_z": np.array(tra_z),
+        "tra": np.array(tr),
+    }
+
+
+def hydraulic_functions(tables):
+    """
+    Interpolation functions of CWTr from the tables of hydraulic_tables
+    """
+    gwl = tables["gwl"]
+    gwlToSto = LookupTable(gwl, tables["sto"])
+    stoToGwl = LookupTable(tables["sto"], gwl)
+    gwlToTra = interS(tables["tra_z"], tables["tra"])
+    C = LookupTable(
+        gwl, tables["C"]
+    )  # storage coefficient function, C.derivative gives its slope
+    gwlToRatio = LookupTable(gwl[1:], tables["ratio"])
+    gwlToAfp = LookupTable(gwl, tables["afp"])
     return gwlToSto, stoToGwl, gwlToTra, C, gwlToRatio, gwlToAfp
 
 
@@ -459,6 +542,44 @@ def read_FMI_weather(ID, start_date, end_date, sourcefile=None):
     return fmi
 
 
+class CompiledForcing:
+    """
+    Daily forcing from read_FMI_weather compiled once into named contiguous arrays, so that the
+    daily loop indexes arrays by day instead of positional data frame lookups, and the first and
+    last day of each year for the annual models.
+    Input:
+        forc data frame of read_FMI_weather, daily DatetimeIndex in ascending order
+    """
+
+    variables = ("T", "Tmax", "Tmin", "Prec", "Rg", "h2o", "Par", "RH", "esa", "vpd")
+
+    def __init__(self, forc):
+        for name in self.variables:
+            setattr(
+                self, name, np.ascontiguousarray(forc[name].to_numpy(dtype=np.float64))
+            )  # float64 array (days,)
+        self.doy = forc.index.dayofyear.to_numpy()  # day of the year
+        years = forc.index.year.to_numpy()
+        self.years = np.unique(years)
+        self.start = np.searchsorted(years, self.years)  # first day of each year
+        self.stop = np.searchsorted(
+            years, self.years, side="right"
+        )  # day after the last day of each year
+        self.offsets = {
+            int(yr): (int(start), int(stop))
+            for yr, start, stop in zip(self.years, self.start, self.stop)
+        }
+
+    def year(self, yr):
+        """
+        Forcing of the year yr as a dict of array views by variable name, for the annual models
+        """
+        start, stop = self.offsets[yr]
+        return {
+            name: getattr(self, name)[start:stop] for name in self.variables + ("doy",)
+        }
+
+
 def nutrient_release(sfc, sfc_specification, co2release, N=None, P=None, K=None):
     # sfc                                                                         # soil fertility class
     # sfc_specification    1 (Myrtillus I and Vaccinium I) 2 (Myrtillus II, Vaccinium II)
@@ -1618,7 +1739,8 @@ def assimilation_yr(ppara, dfforc, wt, afp, LAI, LAI_above):
     Mäkelä et al. 2008. Empirical model of stand GPP LUE approach. Global Change Biology 14: 92-108
     IN:
         (develpment of all sided leaf area index (LAI) m2 m-2)
-        LAI, double sided LAI m2 m-2
+        LAI, double sided LAI m2 m-2, shape (ncols) or (layers, ncols) for several canopy layers
+        LAI_above, double sided LAI above the canopy layer m2 m-2, shape as in LAI
         meteorological input data:
         rg in W/m2
         vpd in kPa
@@ -1629,25 +1751,26 @@ def assimilation_yr(ppara, dfforc, wt, afp, LAI, LAI_above):
         Nconc, Pconc, Kconc nutrient concentration in stand
         hdom dominant height of the stand (used in computation of respiration)
         wt water table [m] negative down, as pandas dataframe shape (days, nodes)
+        afp air-filled porosity in the root zone, shape as in wt
     OUT:
-        Net primary production NPP in kg/ha/yr
+        Net primary production NPP in kg/ha/yr, shape as in LAI
         Xa
     """
 
-    attenuation = np.exp(-0.2 * LAI_above)
-    days, ncols = np.shape(wt)
-    par = np.zeros((ncols, 366))
-    rg, vpd, Ta = dfforc["Rg"], dfforc["vpd"], dfforc["T"]
+    LAI = np.asarray(LAI, dtype=float)
+    LAI_above = np.asarray(LAI_above, dtype=float)
+    wt = np.asarray(wt, dtype=float)
+    days = len(wt)
+    daily = (days,) + (1,) * LAI.ndim  # weather broadcast over layers and columns
+    soil = (days,) + (1,) * (LAI.ndim - wt.ndim + 1) + wt.shape[1:]  # shared by layers
+    rg, vpd, Ta = (np.asarray(dfforc[v], dtype=float) for v in ("Rg", "vpd", "T"))
 
-    for m in range(ncols):
-        par[m, 0:days] = (
-            rg * 4.6 * 0.5 / 1000000.0 * 86400.0 * attenuation[m]
-        )  # Unit conversion to mol/m2/day, 0.5 is the share of par from rg
+    attenuation = np.exp(-0.2 * LAI_above)
+    par = (rg * 4.6 * 0.5 / 1000000.0 * 86400.0).reshape(daily) * attenuation
+    # Unit conversion to mol/m2/day, 0.5 is the share of par from rg
 
     """ Eq 2 """
-    fL = np.zeros((ncols, 366))
-    for m in range(ncols):
-        fL[m:days] = 1.0 / (ppara.gamma * par[m] + 1.0)  # Light modifier
+    fL = 1.0 / (ppara.gamma * par + 1.0)  # Light modifier
 
     """Eq. 3a and 3b"""
     sim_len = len(Ta)
@@ -1658,21 +1781,17 @@ def assimilation_yr(ppara, dfforc, wt, afp, LAI, LAI_above):
     Sk = np.maximum(Xk - ppara.X0, np.zeros(sim_len))
 
     """Eq 4"""
-    fs = np.zeros(366)
-    fs[: len(Sk)] = np.minimum(Sk / ppara.Smax, 1.0)  # Final temperature adustment
+    fs = np.minimum(Sk / ppara.Smax, 1.0).reshape(daily)  # Final temperature adustment
 
     """Eq 5"""
-    fd = np.ones(
-        366
+    fd = np.exp(ppara.kappa * vpd).reshape(
+        daily
     )  # Vapor pressure deficit function: limits photos when stomata are closed
-    fd[: len(vpd)] = np.exp(ppara.kappa * vpd)  # Eq 5
 
     # ************* From here on: different in different columns********************************
     """Eq 6"""  # Soil water content modifyer
     rew = rew_drylimit(wt)
-    days, ncols = np.shape(rew)
-    rewarr = np.zeros((366, ncols))
-    rewarr[:days, :] = rew
+    fREW = ((1.0 + ((1.0 - rew) / ppara.alfa) ** ppara.nu) ** (-1.0)).reshape(soil)
 
     """air filled porosity function"""
 
@@ -1680,47 +1799,24 @@ def assimilation_yr(ppara, dfforc, wt, afp, LAI, LAI_above):
     afptmp = np.array([1.0, 0.1, 0.0])  # afp in root zone
     afp_response = np.array([1.0, 1.0, 0.0])  # relative water uptake
     fafp = interp1d(afptmp, afp_response, fill_value="extrapolate")
-    f_fafp = fafp(afp)
-    fafparr = np.zeros((366, ncols))
-    fafparr[:days, :] = f_fafp
-
-    npp_arr = np.zeros(ncols)
-    npp_arr_pot = np.zeros(ncols)
-
-    for column in range(ncols):
-        fREW = (1.0 + ((1.0 - rewarr[:, column]) / ppara.alfa) ** ppara.nu) ** (-1.0)
-        fAFP = fafparr[:, column]
-        """ Beer-Lambert function: LAI function"""  # Fabrika 2013
-        kext = 0.2
-
-        """Eq 1"""
-        Pk = (
-            ppara.beta
-            * (1.0 - np.exp(-kext * LAI[column]))
-            * par[column]
-            * fL[column]
-            * fs
-            * fd
-            * fREW
-            * fAFP
-        )  # canopy GPP gC m-2 day-1
-        # Pk=ppara['beta'] *(1.- np.exp(-kext*LAI[column])) * par * fL * fs * fd * fREW    #canopy GPP gC m-2 day-1
-        Pk_pot = (
-            ppara.beta
-            * (1.0 - np.exp(-kext * LAI[column]))
-            * par[column]
-            * fL[column]
-            * fs
-            * fd
-            * 1.0
-            * 1.0
-        )  # growth that is not restricted by edaphic factors gC m-2 day-1
-
-        """Respi"""
-        NPP = Pk * 0.5 * 2.0
-        NPP_pot = Pk_pot * 0.5 * 2.0  # Change from gC m-2 to g organic matter
-        npp_arr[column] = sum(NPP)
-        npp_arr_pot[column] = sum(NPP_pot)
+    fAFP = fafp(np.asarray(afp, dtype=float)).reshape(soil)
+
+    """ Beer-Lambert function: LAI function"""  # Fabrika 2013
+    kext = 0.2
+
+    """Eq 1"""
+    light = ppara.beta * (1.0 - np.exp(-kext * LAI))
+    Pk_pot = (
+        light * par * fL * fs * fd
+    )  # growth that is not restricted by edaphic factors gC m-2 day-1
+    Pk = Pk_pot * fREW * fAFP  # canopy GPP gC m-2 day-1
+    # Pk=ppara['beta'] *(1.- np.exp(-kext*LAI[column])) * par * fL * fs * fd * fREW    #canopy GPP gC m-2 day-1
+
+    """Respi"""
+    NPP = Pk * 0.5 * 2.0
+    NPP_pot = Pk_pot * 0.5 * 2.0  # Change from gC m-2 to g organic matter
+    npp_arr = np.cumsum(NPP, axis=0)[-1]  # summed in the order of days
+    npp_arr_pot = np.cumsum(NPP_pot, axis=0)[-1]
 
     return npp_arr * 10.0, npp_arr_pot * 10.0  # kg/ha organic matter
 
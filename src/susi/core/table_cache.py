@@ -0,0 +1,124 @@
+"""
+Persistent cache for compiled peat hydraulic tables
+
+Tables are stored as .npz files named by a hash of the parameters they were built from,
+so the same peat profile is computed only once across runs and processes.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+CACHE_VERSION = 1  # increase when the content of the cached tables changes
+LOAD_ERRORS = (
+    OSError,
+    ValueError,
+    zipfile.BadZipFile,
+)  # missing file, or removed or being written by another process
+
+
+class TableCache:
+    def __init__(self, directory, max_mb):
+        """
+        Input:
+            directory folder for the .npz files, created if missing
+            max_mb size cap of the folder in MB, least recently used tables are removed first
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_mb * 1.0e6
+
+    def key(self, name, params):
+        """
+        Content address of the tables: sha256 of the table name and the parameters
+        """
+        content = json.dumps(
+            {"version": CACHE_VERSION, "name": name, "params": params},
+            sort_keys=True,
+            default=lambda a: np.asarray(a).tolist(),
+        )
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def load(self, key):
+        """
+        Returns the dict of tables or None if not in the cache
+        """
+        path = self.directory / (key + ".npz")
+        try:
+            with np.load(path) as npz:
+                tables = {k: npz[k] for k in npz.files}
+            os.utime(path)  # mark as recently used
+        except LOAD_ERRORS:
+            return None
+        return tables
+
+    def save(self, key, tables):
+        """
+        Writes the tables atomically and trims the cache to the size cap
+        """
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **tables)
+            os.replace(tmp, self.directory / (key + ".npz"))
+        finally:
+            if os.path.exists(tmp):  # not moved in place, the write failed
+                os.remove(tmp)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used tables until the cache is below the size cap
+        """
+        files = []
+        for path in self.directory.glob("*.npz"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files[:-1]:  # the latest table is always kept
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            total -= size
+
+    def fetch(self, name, params, build):
+        """
+        Tables for the parameters, from the cache or from build() that returns a dict of arrays
+        """
+        key = self.key(name, params)
+        tables = self.load(key)
+        if tables is None:
+            tables = build()
+            self.save(key, tables)
+        return tables
+
+
+def table_cache(spara):
+    """
+    TableCache in spara.table_cache_dir, None if it is not set
+    """
+    if spara.table_cache_dir is None:
+        return None
+    return TableCache(spara.table_cache_dir, spara.table_cache_max_mb)
+
+
+def cached_tables(spara, name, params, build):
+    """
+    Compiled tables through the cache in spara.table_cache_dir, without cache if it is not set
+    """
+    cache = table_cache(spara)
+    if cache is None:
+        return build()
+    return cache.fetch(name, params, build)
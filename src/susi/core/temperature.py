@@ -31,6 +31,8 @@ class PeatTemperature:
         self.Nt = 24  # number of subtimesteps in the time step (here every 2 hrs)
 
         self.A = self.create_matrix(mode=spara.temperature_solve_mode)
+        if spara.temperature_solve_mode == "propagator":
+            self.P, self.q_top, self.q_bottom = self.create_propagator(self.A)
 
         print("Peat temperature profile initialized")
 
@@ -109,6 +111,27 @@ class PeatTemperature:
 
         return A
 
+    def create_propagator(self, A):
+        """
+        The Nt substeps of a day with constant boundary values form one affine map
+            T_next = P T + q_top Ta + q_bottom lower_boundary
+        Each substep solves u = A^-1 b, where b is T with the boundary values in the first and
+        last element, so u = A^-1 E T + A^-1[:, 0] Ta + A^-1[:, -1] lower_boundary, with E
+        the identity matrix without the boundary rows. The map is composed Nt times.
+        """
+        Ainv = linalg.inv(A)
+        AE = Ainv.copy()
+        AE[:, 0] = 0.0
+        AE[:, -1] = 0.0  # A^-1 E, boundary elements of T are replaced
+        P = np.eye(self.nLyrs + 1)
+        q_top = np.zeros(self.nLyrs + 1)
+        q_bottom = np.zeros(self.nLyrs + 1)
+        for n in range(self.Nt):
+            P = AE @ P
+            q_top = AE @ q_top + Ainv[:, 0]
+            q_bottom = AE @ q_bottom + Ainv[:, -1]
+        return P, q_top, q_bottom
+
     def create_matrix(self, mode: str):
         if mode == "sparse":
             return self.create_matrix_sparse()
@@ -116,6 +139,8 @@ class PeatTemperature:
             return self.create_matrix_dense()
         elif mode == "dense_banded":
             return self.create_matrix_dense_banded()
+        elif mode == "propagator":
+            return self.create_matrix_dense()
 
     def solve_system(self, b, mode: str):
         if mode == "sparse":
@@ -157,6 +182,14 @@ class PeatTemperature:
         else:
             Ta = Ta + T_cool
 
+        if solution_mode == "propagator":
+            self.Tsoil = (
+                self.P @ self.Tsoil
+                + self.q_top * Ta
+                + self.q_bottom * self.lower_boundary
+            )  # all substeps of the day at once
+            return self.z[: self.nLyrs_hydro], self.Tsoil[: self.nLyrs_hydro]
+
         u = np.zeros(self.nLyrs + 1)
         for n in range(0, self.Nt):
             b = self.Tsoil.copy()
@@ -172,3 +205,68 @@ class PeatTemperature:
             (nrounds, ndays, nLyrs)
         )  # daily peat temperature profiles
         return peat_temperatures
+
+
+class PeatTemperatureColumns(PeatTemperature):
+    def __init__(self, spara, mean_Ta, shape):
+        """
+        Peat temperature profiles for each column (and scenario) solved at once
+        input:
+            spara, contains dimensions of soil (peat) object
+            mean_Ta is mean air temperature over the whole time, set as lower boundary condition
+            shape of the profile batch, e.g. (nscens, ncols); the state is shape + (nLyrs+1,)
+        The matrix is the same for all profiles: its small, well conditioned inverse is computed
+        once and each substep solves all profiles with one matrix product,
+        or in 'propagator' mode the daily map is applied to all profiles with one product.
+        """
+        super().__init__(spara, mean_Ta)
+        self.shape = tuple(shape)
+        if spara.temperature_solve_mode != "propagator":
+            self.Ainv = linalg.inv(
+                self.create_matrix_dense()
+            )  # shared solution operator of the substep
+
+    def reset_domain(self):
+        self.Tsoil = np.ones(self.shape + (self.nLyrs + 1,)) * self.mean_Ta
+        self.lower_boundary = self.mean_Ta
+
+    def run_timestep(self, Ta, SWE, efloor, solution_mode: str):
+        """
+        Parameters
+        ----------
+        Ta : float
+            Air temperature, deg C.
+        SWE : np array (float)
+            Snow water equivalent in each column, m, shape of the batch or broadcastable to it.
+        efloor : np array (float)
+            evaporation from surface layer in each column m.
+
+        Returns
+        -------
+        z : np array (float)
+            depth of layers, m
+        Tsoil : np array (float)
+            peat temperature (deg C), shape + (nLyrs,)
+
+        """
+        # Cooling by evaporation
+        e_consumed = np.asarray(efloor) * 1000 * self.heat_of_vaporization / self.Nt
+        T_cool = -e_consumed / self.heat_capacity
+        Ta = np.broadcast_to(
+            np.where(np.asarray(SWE) > 0.01, max(-5.0, Ta), Ta + T_cool), self.shape
+        )  # surface temperature in each column
+
+        if solution_mode == "propagator":
+            self.Tsoil = (
+                self.Tsoil @ self.P.T
+                + Ta[..., np.newaxis] * self.q_top
+                + self.lower_boundary * self.q_bottom
+            )  # all substeps of the day at once
+        else:
+            u = self.Tsoil.reshape(-1, self.nLyrs + 1).T.copy()  # profiles as columns
+            for n in range(self.Nt):
+                u[0] = Ta.ravel()  # boundary conditions
+                u[-1] = self.lower_boundary
+                u = self.Ainv @ u
+            self.Tsoil = u.T.reshape(self.shape + (self.nLyrs + 1,))
+        return self.z[: self.nLyrs_hydro], self.Tsoil[..., : self.nLyrs_hydro]
@@ -17,6 +17,7 @@ from pydantic import (
 from susi.io.app_structure import AppStructure
 from susi.io.extra_pydantic_types import (
     PositiveFloat,
+    PositiveInt,
     NonNegativeFloat,
     NonPositiveFloat,
 )
@@ -69,7 +70,8 @@ class OrganicLayerParameters(StrictFrozenModel):
 
 class OrganicLayerParametersArray:
     """
-    Same class as OrganicLayerParameters, but with all fields a numpy array of given length.
+    Same class as OrganicLayerParameters, but with all fields a numpy array of given length,
+    or of shape (nscens, ncols) for the scenarios in lock-step.
     """
 
     org_depth: np.ndarray
@@ -81,7 +83,9 @@ class OrganicLayerParametersArray:
     pond_storage: np.ndarray
 
     def __init__(
-        self, organic_layer_parameters: OrganicLayerParameters, array_length: int
+        self,
+        organic_layer_parameters: OrganicLayerParameters,
+        array_length: int | tuple[int, int],
     ):
         for name, value in organic_layer_parameters.model_dump().items():
             setattr(self, name, value * np.ones(array_length))
@@ -117,7 +121,8 @@ class CanopyStateParameters(StrictFrozenModel):
 
 class CanopyStateParametersArray:
     """
-    Same as CanopyStateParameters, but with all array elements
+    Same as CanopyStateParameters, but with all array elements, of given length
+    or of shape (nscens, ncols) for the scenarios in lock-step
     """
 
     lai_conif: np.ndarray
@@ -129,7 +134,9 @@ class CanopyStateParametersArray:
     swe: np.ndarray
 
     def __init__(
-        self, canopy_state_parameters: CanopyStateParameters, array_length: int
+        self,
+        canopy_state_parameters: CanopyStateParameters,
+        array_length: int | tuple[int, int],
     ):
         for name, value in canopy_state_parameters.model_dump().items():
             setattr(self, name, value * np.ones(array_length))
@@ -378,11 +385,124 @@ class TemperatureSolverEnum(str, Enum):
     Tested with a 90 x 90 matrix (the usual size)
     - "dense_banded" is 3x faster than "sparse"
     - "dense_banded" is 4x faster than "dense"
+    - "propagator" precomputes the daily map of the 24 substeps and needs one matrix-vector
+      product per day, about 50x faster than "dense_banded"
     """
 
     sparse = "sparse"
     dense = "dense"
     dense_banded = "dense_banded"
+    propagator = "propagator"
+
+
+class StripSolverEnum(str, Enum):
+    """
+    Options for the linear solver of the strip hydrology.
+
+    - "dense" inverts the full n x n matrix in every iteration, O(n^3)
+    - "banded" stores only the three diagonals and solves the tridiagonal system, O(n)
+    """
+
+    dense = "dense"
+    banded = "banded"
+
+
+class StripNonlinearSolverEnum(str, Enum):
+    """
+    Options for the nonlinear iteration of the strip hydrology.
+
+    - "picard" re-linearises the transmissivity and storage coefficient with the latest iterate
+    - "newton" uses the analytic Jacobian of the discrete equations with a backtracking line search,
+      started from an extrapolation of the previous days' heads. The Jacobian is always solved as a
+      banded system.
+    """
+
+    picard = "picard"
+    newton = "newton"
+
+
+class StripTimeSteppingEnum(str, Enum):
+    """
+    Options for the time step of the strip hydrology.
+
+    - "fixed" solves one step of one day
+    - "adaptive" divides stiff days into substeps controlled by a local error estimate and, on quiet
+      days, accepts a single linearised solve for the whole day. Outputs are still daily.
+    """
+
+    fixed = "fixed"
+    adaptive = "adaptive"
+
+
+class EsomDecomposeEnum(str, Enum):
+    """
+    Options for the daily decomposition step of the organic matter model.
+
+    - "sparse" assembles the daily transfer matrix of the storages as a sparse matrix
+    - "inplace" applies the same flows directly to the storage array with a preallocated work
+      buffer, results are identical
+    """
+
+    sparse = "sparse"
+    inplace = "inplace"
+
+
+class EsomRateEnum(str, Enum):
+    """
+    Options for the evaluation of the decomposition rates of the organic matter model.
+
+    - "daily" evaluates the rate functions inside the daily loop, one day at a time
+    - "year" evaluates the rates of all days of the year with vectorised calls before the daily
+      loop, results are identical
+    """
+
+    daily = "daily"
+    year = "year"
+
+
+class EsomEngineEnum(str, Enum):
+    """
+    Options for running the organic matter model of mass, N, P and K.
+
+    - "separate" runs an independent model for each substance
+    - "combined" keeps the storages of all substances in one array, computes the decomposition
+      rates once and updates all substances with one call of the in-place kernel, results are
+      identical
+    """
+
+    separate = "separate"
+    combined = "combined"
+
+
+class EsomInitialStateEnum(str, Enum):
+    """
+    Options for the initial mor storages of the organic matter model.
+
+    - "mor" computes them from the mor layer thickness and bulk density (h_mor, rho_mor)
+    - "steady_state" solves the equilibrium with the mean decomposition rates and litter input of
+      the first year
+    - "spin_up" finds the periodic steady state over the annual cycle of the first year with
+      Anderson acceleration of the annual map, replaces a spin-up simulation of several decades
+    """
+
+    mor = "mor"
+    steady_state = "steady_state"
+    spin_up = "spin_up"
+
+
+class EsomStepEnum(str, Enum):
+    """
+    Options for the time step of the organic matter model.
+
+    - "daily" applies the decomposition one day at a time
+    - "blocks" groups consecutive days with similar rates (esom_step_tolerance) and advances
+      each group in one step with the matrix power of the daily transfer matrix of the mean rates.
+      A group always starts on the litter input day. Daily cumulative output inside a group is
+      interpolated linearly.
+    """
+
+    daily = "daily"
+    blocks = "blocks"
 
 
 class ExtraParameters(
@@ -395,6 +515,50 @@ class ExtraParameters(
 
     # Temporal parameter to test sparse and dense temperature solvers
     temperature_solve_mode: TemperatureSolverEnum
+    # Peat temperature profile in each column from its own snow and evaporation,
+    # instead of one profile from the strip means
+    temperature_columns: bool = False
+    # Assimilation of each canopy layer computed only for the groups of columns where the layer
+    # has trees, the other columns have no production, results are identical
+    vegetation_column_groups: bool = True
+
+    # Linear solver for the strip hydrology
+    strip_solve_mode: StripSolverEnum = StripSolverEnum.dense
+    strip_nonlinear_solve_mode: StripNonlinearSolverEnum = (
+        StripNonlinearSolverEnum.picard
+    )
+    strip_max_iterations: PositiveInt = Field(
+        default=100, description="Maximum number of nonlinear iterations per day"
+    )
+    strip_tolerance: PositiveFloat = Field(
+        default=1.0e-7,
+        description="Convergence tolerance of the nonlinear iteration, max change in head, m",
+    )
+    strip_time_stepping: StripTimeSteppingEnum = StripTimeSteppingEnum.fixed
+    strip_step_tolerance: PositiveFloat = Field(
+        default=0.05,
+        description="Local error tolerance of the adaptive time step, max error in head per day of step length, m",
+    )
+
+    # Daily decomposition step of the organic matter model
+    esom_decompose_mode: EsomDecomposeEnum = EsomDecomposeEnum.inplace
+    esom_rate_mode: EsomRateEnum = EsomRateEnum.year
+    esom_engine: EsomEngineEnum = EsomEngineEnum.combined
+    esom_initial_state: EsomInitialStateEnum = EsomInitialStateEnum.mor
+    esom_step_mode: EsomStepEnum = EsomStepEnum.daily
+    esom_step_tolerance: PositiveFloat = Field(
+        default=0.5,
+        description="Max sum over a group of days of the departure of the daily decomposition rates from the first day, fraction of a storage",
+    )
+    # Folder for the daily storages of the organic matter model over the whole run,
+    # one .npy file for each substance and run, not recorded if None
+    esom_history_dir: Path | None = None
+
+    # Persistent cache of the compiled peat hydraulic tables, not in use if None
+    table_cache_dir: Path | None = None
+    table_cache_max_mb: PositiveFloat = Field(
+        default=100.0, description="Size cap of the table cache folder, MB"
+    )
 
     # Time
     start_date: datetime.datetime  # Start date for simulation
@@ -0,0 +1,43 @@
+"""
+Micro-benchmark of the peat hydraulic lookup tables against scipy interp1d.
+Both interpolators are built on the same CWTr grid of the golden test strip and evaluated
+for vectors of water table depths of the size used in the strip and in Esom.
+
+Run: python src/tools/benchmark_lookup_tables.py
+"""
+
+import timeit
+from functools import partial
+
+import numpy as np
+from scipy.interpolate import interp1d
+
+from inputs.parameters import golden_test
+from susi.core.strip import StripHydrology
+
+spara = golden_test.PARAMETERS.extra_parameters
+stp = StripHydrology(spara)
+tables = {
+    "dwtToSto": stp.dwtToSto,
+    "stoToGwl": stp.stoToGwl,
+    "C": stp.C,
+    "dwtToRat": stp.dwtToRat,
+    "dwtToAfp": stp.dwtToAfp,
+}
+rng = np.random.default_rng(0)
+repeats = 20000
+
+print("table      n   interp1d us  LookupTable us  speed-up  max abs diff")
+for name, table in tables.items():
+    reference = interp1d(table.x, table.y, fill_value="extrapolate")
+    for n in (spara.n, 10 * spara.n):
+        if name == "stoToGwl":
+            x = rng.uniform(table.x[0], table.x[-1], n)
+        else:
+            x = rng.uniform(-1.5, 0.0, n)  # water table depths, m
+        t_ref = timeit.timeit(partial(reference, x), number=repeats) / repeats * 1e6
+        t_lut = timeit.timeit(partial(table, x), number=repeats) / repeats * 1e6
+        diff = np.max(np.abs(reference(x) - table(x)))
+        print(
+            f"{name:9s} {n:4d} {t_ref:12.1f} {t_lut:15.1f} {t_ref / t_lut:9.1f} {diff:13.2e}"
+        )
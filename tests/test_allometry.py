@@ -0,0 +1,27 @@
+import numpy as np
+
+from susi.core.allometry import Allometry
+from susi.core.canopylayer import UPDATE_VARIABLES
+from susi.io.app_structure import AppStructure
+
+
+def test_stacked_interpolation_matches_allometry_functions():
+    allometry = Allometry()
+    allometry.motti_development(str(AppStructure().input_folder) + "/CF_41.xlsx", 3)
+    names = [name for name in allometry.allometry_f if name.startswith("bmTo")]
+    stacked = allometry.stacked(names)
+    assert allometry.stacked(names) is stacked
+    rng = np.random.default_rng(22)
+    for x, *_ in stacked.grids:
+        bm = np.concatenate(
+            [
+                x,  # grid points
+                (x[1:] + x[:-1]) / 2.0,
+                rng.uniform(x[0] - 50.0, x[-1] + 50.0, 500),  # also outside the table
+                [np.nan],
+            ]
+        )
+        values = stacked(bm)
+        for name in names:
+            np.testing.assert_array_equal(values[name], allometry.allometry_f[name](bm))
+    assert set(UPDATE_VARIABLES) <= set(names)
@@ -0,0 +1,105 @@
+import copy
+
+import numpy as np
+
+from inputs.parameters import golden_test
+from susi.core.canopygrid import CanopyGrid
+from susi.core.mosslayer import MossLayer
+from susi.core.susi_utils import rew_drylimit
+from susi.io.susi_parameter_model import (
+    CanopyStateParametersArray,
+    OrganicLayerParametersArray,
+)
+
+
+def make_grid(shape):
+    cpara = copy.deepcopy(golden_test.PARAMETERS.canopy_parameters)
+    cpy = CanopyGrid(cpara, CanopyStateParametersArray(cpara.state, shape))
+    moss = MossLayer(
+        OrganicLayerParametersArray(
+            golden_test.PARAMETERS.organic_layer_parameters, shape
+        )
+    )
+    return cpy, moss
+
+
+def test_scenarios_in_one_grid_match_single_grids():
+    rng = np.random.default_rng(12)
+    ndays, nscens, n = 120, 3, 10
+    ta = 5.0 + 12.0 * np.sin(2 * np.pi * (np.arange(ndays) - 60) / 365)
+    prec = np.where(rng.random(ndays) < 0.4, rng.uniform(1.0, 15.0, ndays), 0.0)
+    rg = rng.uniform(20.0, 250.0, ndays)
+    vpd = rng.uniform(0.1, 1.5, ndays)
+    dwt = rng.uniform(-0.8, -0.05, (ndays, nscens, n))  # water table of each scenario
+    hc = rng.uniform(5.0, 15.0, (nscens, n))
+    lai = rng.uniform(1.0, 4.0, (nscens, n))
+
+    def run(cpy, moss, dwt, hc, lai):
+        outputs = []
+        for d in range(ndays):
+            potinf, _, interc, _, ET, transpi, efloor, _, SWE = cpy.run_timestep(
+                d + 1,
+                86400.0,
+                ta[d],
+                prec[d] / 86400.0,
+                rg[d],
+                0.5 * rg[d],
+                vpd[d],
+                hc=hc,
+                LAIconif=lai,
+                Rew=rew_drylimit(dwt[d]),
+                beta=moss.Ree,
+            )
+            potinf, efloor, _ = moss.interception(potinf, efloor)
+            outputs.append(np.array([potinf, interc, ET, transpi, efloor, SWE]))
+        return np.array(outputs)
+
+    batch = run(*make_grid((nscens, n)), dwt, hc, lai)
+    for r in range(nscens):
+        single = run(*make_grid(n), dwt[:, r], hc[r], lai[r])
+        np.testing.assert_array_equal(batch[:, :, r], single)
+
+
+def test_precomputed_weather_terms_match_daily_computation():
+    rng = np.random.default_rng(19)
+    ndays, n = 400, 8
+    ta = 3.0 + 14.0 * np.sin(2 * np.pi * (np.arange(ndays) - 100) / 365)
+    ta[::7] = rng.choice([0.0, 0.5, 1.0], len(ta[::7]))  # rain/snow limits
+    prec = np.where(rng.random(ndays) < 0.5, rng.uniform(0.5, 20.0, ndays), 0.0)
+    rg = rng.uniform(5.0, 250.0, ndays)
+    vpd = rng.uniform(0.05, 1.5, ndays)
+    dwt = rng.uniform(-0.8, -0.05, (ndays, n))
+    hc = rng.uniform(5.0, 15.0, n)
+    lai = rng.uniform(1.0, 4.0, n)
+
+    def run(precompute):
+        cpy, moss = make_grid(n)
+        if precompute:
+            cpy.precompute_forcing(ta, prec / 86400.0, vpd, 86400.0)
+        outputs = []
+        for scenario in range(2):  # the same weather again, as in the next scenario
+            if precompute and scenario > 0:
+                cpy.precompute_phenology()
+            for d in range(ndays):
+                out = cpy.run_timestep(
+                    d % 365 + 1,
+                    86400.0,
+                    ta[d],
+                    prec[d] / 86400.0,
+                    rg[d],
+                    0.5 * rg[d],
+                    vpd[d],
+                    hc=hc,
+                    LAIconif=lai,
+                    Rew=rew_drylimit(dwt[d]),
+                    beta=moss.Ree,
+                    day=d if precompute else None,
+                )
+                moss.interception(out[0], out[6])
+                outputs.append(np.array(out))
+        return np.array(outputs), cpy.X
+
+    daily, X = run(False)
+    precomputed, X_pre = run(True)
+    np.testing.assert_array_equal(precomputed, daily)
+    assert X_pre == X
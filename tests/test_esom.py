@@ -0,0 +1,267 @@
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from inputs.parameters import golden_test
+from susi.core.esom import Esom, EsomSubstances, rate_blocks
+
+
+def make_esom(substance, **updates):
+    spara = golden_test.PARAMETERS.extra_parameters.model_copy(update=updates)
+    return Esom(spara, np.full(spara.n, 3), 366, substance=substance)
+
+
+@pytest.mark.parametrize("substance", ["Mass", "N", "P", "K"])
+def test_inplace_decompose_matches_sparse(substance):
+    rng = np.random.default_rng(2)
+    es = make_esom(substance)
+    M = es.M.copy()
+    M[:, :, :2] = rng.uniform(0.0, 1.0, M[:, :, :2].shape)
+    for _ in range(30):
+        rates = [rng.uniform(0.0, 0.01, (es.x, es.y)) for _ in range(9)]
+        es.M = M.copy()
+        sparse = es.decompose(*rates, es.M)
+        inplace = es.decompose_inplace(*rates, M)
+        np.testing.assert_array_equal(inplace, sparse)
+
+
+def test_year_rates_match_daily_rates():
+    rng = np.random.default_rng(3)
+    es = make_esom("Mass")
+    days = 365
+    air = rng.normal(3.0, 10.0, days)
+    tp = [rng.normal(5.0, 3.0, days) for _ in range(3)]
+    wts = rng.uniform(-1.0, 0.0, (days, es.y))
+    year = es.get_year_rates(air, *tp, wts)
+    for n, daily in enumerate(es.daily_rates(air, *tp, wts)):
+        for k_year, k_day in zip(year, daily):
+            np.testing.assert_array_equal(
+                k_year[n], np.broadcast_to(k_day, k_year[n].shape)
+            )
+
+
+@pytest.mark.parametrize("rate_mode", ["year", "daily"])
+def test_combined_engine_matches_separate_substances(rate_mode):
+    rng = np.random.default_rng(4)
+    spara = golden_test.PARAMETERS.extra_parameters.model_copy(
+        update={"esom_rate_mode": rate_mode}
+    )
+    sfc = np.full(spara.n, 3)
+    index = pd.date_range("2001-01-01", periods=365)
+    weather = pd.DataFrame({"T": rng.normal(3.0, 10.0, 365)}, index=index)
+    peat_temperatures = pd.DataFrame(rng.normal(5.0, 3.0, (365, 12)), index=index)
+    water_tables = pd.DataFrame(rng.uniform(-1.0, 0.0, (365, spara.n)), index=index)
+    litter = {
+        name: (rng.uniform(0.0, 0.3, spara.n), rng.uniform(0.0, 0.1, spara.n))
+        for name in ("Mass", "N", "P", "K")
+    }
+    combined = EsomSubstances(spara, sfc, 366)
+    combined.update_soil_pH(0.5)
+    combined.run_yr(weather, peat_temperatures, water_tables, litter)
+    for name, es in combined.substances.items():
+        separate = Esom(spara, sfc, 366, substance=name)
+        separate.update_soil_pH(0.5)
+        separate.run_yr(weather, peat_temperatures, water_tables, *litter[name])
+        np.testing.assert_array_equal(es.M, separate.M)
+        np.testing.assert_array_equal(es.cumulative_out, separate.cumulative_out)
+        np.testing.assert_array_equal(es.out_root_lyr, separate.out_root_lyr)
+
+
+def test_history_records_daily_storages(tmp_path):
+    rng = np.random.default_rng(5)
+    spara = golden_test.PARAMETERS.extra_parameters.model_copy(
+        update={"esom_history_dir": tmp_path}
+    )
+    index = pd.date_range("2001-01-01", periods=365)
+    weather = pd.DataFrame({"T": rng.normal(3.0, 10.0, 365)}, index=index)
+    peat_temperatures = pd.DataFrame(rng.normal(5.0, 3.0, (365, 12)), index=index)
+    water_tables = pd.DataFrame(rng.uniform(-1.0, 0.0, (365, spara.n)), index=index)
+    es = Esom(spara, np.full(spara.n, 3), 366, substance="N")
+    es.run_yr(weather, peat_temperatures, water_tables, 0.01, 0.005)
+    history = np.load(tmp_path / "esom_N_0.npy")
+    assert history.shape == (366, 1, spara.n, 11)
+    np.testing.assert_array_equal(history[364], es.M)
+    np.testing.assert_array_equal(history[:365, :, :, 10], es.cumulative_out[:365])
+
+
+@pytest.mark.parametrize("columns", [False, True])
+def test_compose_export_matches_node_loop(columns):
+    rng = np.random.default_rng(6)
+    es = make_esom("Mass")
+    days = 365
+    es.ini_i, es.end_i = 0, days
+    es.cumulative_out[:days] = np.cumsum(
+        rng.uniform(0.0, 1e-4, (days, es.x, es.y)), axis=0
+    )
+    peat_temperatures = pd.DataFrame(rng.normal(5.0, 3.0, (days, 12)))
+    column_temperatures = rng.normal(5.0, 3.0, (days, es.y, 12)) if columns else None
+    rtime = np.where(np.arange(es.y) < 8, 1.0, -1.0)
+    stp = SimpleNamespace(
+        n=es.y,
+        residence_time=rng.uniform(0.0, 100.0, es.y),
+        west=rtime > 0,
+        east=rtime < 0,
+        west_share=8 / es.y,
+        east_share=(es.y - 8) / es.y,
+    )
+    es.compose_export(stp, peat_temperatures, column_temperatures)
+
+    peat_T = column_temperatures[:, :, 2] if columns else peat_temperatures[2].values
+    doc = np.zeros((es.x, es.y))
+    for x in range(es.x):
+        for y in range(es.y):
+            T = peat_T[:, y] if columns else peat_T
+            doc[x, y] = (
+                np.sum(
+                    0.066
+                    * np.exp(-0.061 * T)
+                    * np.gradient(es.cumulative_out[:days, x, y])
+                )
+                * 10000
+                * 0.5
+            )
+    np.testing.assert_array_equal(es.hmw, (1 - 0.04) * doc)
+    hmwtoditch = es.hmw * np.exp(-0.0004 * stp.residence_time)
+    np.testing.assert_array_equal(es.hmw_to_west, 8 / es.y * np.mean(hmwtoditch[0, :8]))
+
+
+def seasonal_year(rng, n):
+    index = pd.date_range("2001-01-01", periods=365)
+    season = np.sin(2 * np.pi * (np.arange(365) - 100) / 365)
+    weather = pd.DataFrame({"T": 3.0 + 10.0 * season}, index=index)
+    peat_temperatures = pd.DataFrame(
+        np.outer(5.0 + 6.0 * season, np.ones(12)), index=index
+    )
+    water_tables = pd.DataFrame(
+        -0.4 - 0.2 * season[:, np.newaxis] + rng.uniform(-0.1, 0.1, (365, n)),
+        index=index,
+    )
+    return weather, peat_temperatures, water_tables
+
+
+def test_steady_state_is_fixed_point_of_daily_step():
+    rng = np.random.default_rng(7)
+    es = make_esom("Mass")
+    rates = rng.uniform(0.001, 0.01, (9, es.x, es.y))
+    mor = es.steady_state(rates, 0.25, 0.1)
+    M = np.zeros((es.x, es.y, 11))
+    M[:, :, 2:7] = mor
+    M[:, :, 0], M[:, :, 1] = 0.25 / 365, 0.1 / 365
+    es.decompose_inplace(*rates, M)
+    np.testing.assert_allclose(M[:, :, 2:7], mor, rtol=1e-12)
+
+
+def test_spin_up_reaches_periodic_steady_state():
+    rng = np.random.default_rng(8)
+    es = make_esom("Mass")
+    year = seasonal_year(rng, es.y)
+    mor, years = es.spin_up(*year, 0.25, 0.1)
+    assert years < 20
+    es.M[:, :, 2:7] = mor
+    es.run_yr(*year, 0.25, 0.1)
+    np.testing.assert_allclose(es.M[:, :, 2:7], mor, atol=1e-8)
+
+
+def test_spin_up_warns_without_convergence():
+    rng = np.random.default_rng(8)
+    es = make_esom("Mass")
+    year = seasonal_year(rng, es.y)
+    with pytest.warns(RuntimeWarning, match="did not converge in 2 years"):
+        _, years = es.spin_up(*year, 0.25, 0.1, max_years=2)
+    assert years == 2
+
+
+def test_rate_blocks_cover_year_and_break_at_litter_day():
+    rng = np.random.default_rng(9)
+    rates = [rng.uniform(0.0, 0.01, (365, 2, 3)) for _ in range(9)]
+    for tolerance in (0.0, 0.05, 10.0):
+        blocks = rate_blocks(rates, tolerance)
+        assert blocks[0][0] == 0 and blocks[-1][1] == 365
+        assert all(a[1] == b[0] for a, b in itertools.pairwise(blocks))
+        assert 243 in [start for start, _ in blocks]
+    assert len(rate_blocks(rates, 0.0)) == 365
+
+
+@pytest.mark.parametrize("tolerance, rtol", [(0.0, 1e-10), (0.5, 2e-3)])
+def test_block_steps_follow_daily_steps(tolerance, rtol):
+    rng = np.random.default_rng(10)
+    year = seasonal_year(rng, golden_test.PARAMETERS.extra_parameters.n)
+    daily = make_esom("Mass")
+    blocks = make_esom("Mass", esom_step_mode="blocks", esom_step_tolerance=tolerance)
+    for _ in range(2):
+        daily.run_yr(*year, 0.25, 0.1)
+        blocks.run_yr(*year, 0.25, 0.1)
+    for block_value, daily_value in (
+        (blocks.M, daily.M),
+        (blocks.cumulative_out, daily.cumulative_out),
+    ):
+        scale = np.abs(daily_value).max()
+        assert np.abs(block_value - daily_value).max() <= rtol * scale
+
+
+@pytest.mark.parametrize("columns", [False, True])
+def test_scenarios_match_separate_runs(columns):
+    rng = np.random.default_rng(11)
+    spara = golden_test.PARAMETERS.extra_parameters
+    sfc, nscens = np.full(spara.n, 3), 3
+    index = pd.date_range("2001-01-01", periods=365)
+    weather = pd.DataFrame({"T": rng.normal(3.0, 10.0, 365)}, index=index)
+    peat_temperatures = rng.normal(5.0, 3.0, (nscens, 365, 12))
+    column_temperatures = (
+        rng.normal(5.0, 3.0, (nscens, 365, spara.n, 12)) if columns else None
+    )
+    water_tables = rng.uniform(-1.0, 0.0, (nscens, 365, spara.n))
+    litter = {
+        name: (
+            rng.uniform(0.0, 0.3, (nscens, spara.n)),
+            rng.uniform(0.0, 0.1, (nscens, spara.n)),
+        )
+        for name in ("Mass", "N", "P", "K")
+    }
+    rtime = rng.uniform(-1.0, 1.0, (nscens, spara.n))
+    stp = SimpleNamespace(
+        residence_time=rng.uniform(0.0, 100.0, (nscens, spara.n)),
+        west=rtime > 0,
+        east=rtime < 0,
+        west_share=np.count_nonzero(rtime > 0, axis=1) / spara.n,
+        east_share=np.count_nonzero(rtime < 0, axis=1) / spara.n,
+    )
+    scenarios = EsomSubstances(spara, sfc, 366, nscens=nscens)
+    scenarios.run_yr(
+        weather, peat_temperatures, water_tables, litter, column_temperatures
+    )
+    esmass = scenarios.substances["Mass"]
+    esmass.compose_export(stp, peat_temperatures, column_temperatures)
+    for r in range(nscens):
+        single = EsomSubstances(spara, sfc, 366)
+        single.run_yr(
+            weather,
+            pd.DataFrame(peat_temperatures[r], index=index),
+            pd.DataFrame(water_tables[r], index=index),
+            {name: (nw[r], w[r]) for name, (nw, w) in litter.items()},
+            column_temperatures[r] if columns else None,
+        )
+        single_stp = SimpleNamespace(
+            **{name: getattr(stp, name)[r] for name in vars(stp)}
+        )
+        single.substances["Mass"].compose_export(
+            single_stp,
+            pd.DataFrame(peat_temperatures[r], index=index),
+            column_temperatures[r] if columns else None,
+        )
+        for name, es in single.substances.items():
+            view = scenarios.substances[name].scenario(r)
+            np.testing.assert_array_equal(view.M, es.M)
+            np.testing.assert_array_equal(view.out, es.out)
+            np.testing.assert_array_equal(view.out_root_lyr, es.out_root_lyr)
+            np.testing.assert_array_equal(view.woodylitter, [es.woodylitter])
+        view = esmass.scenario(r)
+        np.testing.assert_array_equal(
+            view.hmwtoditch, single.substances["Mass"].hmwtoditch
+        )
+        np.testing.assert_array_equal(
+            view.hmw_to_west, single.substances["Mass"].hmw_to_west[0]
+        )
@@ -0,0 +1,38 @@
+import numpy as np
+
+from susi.core.gvegetation import Gvegetation
+
+
+def test_compiled_equations():
+    rng = np.random.default_rng(25)
+    n, nscens = 12, 3
+    species = np.array([2, 1, 4] * 4)  # spruce mires, pine bogs and open peat
+    gv = Gvegetation(n, 6900000.0, 3400000.0, np.full(n, 3), species)
+    ba = rng.uniform(0.0, 30.0, (nscens, n))
+    stems = rng.uniform(0.0, 2000.0, (nscens, n))
+    vol = rng.uniform(0.0, 300.0, (nscens, n))
+    age = rng.uniform(10.0, 80.0, (nscens, n))
+    ts = 1150.0
+
+    batch = gv.gv_biomass_and_nutrients(ts, vol, stems, ba, age)
+    for r in range(nscens):
+        single = gv.gv_biomass_and_nutrients(ts, vol[r], stems[r], ba[r], age[r])
+        for b, s in zip(batch, single):
+            np.testing.assert_array_equal(b[r], s)
+
+    gv_tot = batch[0][0]
+    ix = species == 2
+    expected = (
+        np.square(
+            35.52
+            + 0.001 * gv.longitude * gv.dem[ix]
+            - 1.1 * gv.drain_s**2
+            - 2e-5 * vol[0, ix] * stems[0, ix]
+            + 4e-5 * stems[0, ix] * age[0, ix]
+            + 0.139 * gv.longitude * gv.drain_s
+        )
+        - 0.5
+        + 116.54
+    )  # spruce mire total, Eq. 39
+    np.testing.assert_array_equal(gv_tot[ix], expected)
+    np.testing.assert_array_equal(gv_tot[species == 4], 0.0)
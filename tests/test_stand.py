@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from inputs.parameters import golden_test
+from susi.core.stand import Stand
+from susi.io.app_structure import AppStructure
+
+MOTTIFILE = {
+    "path": str(AppStructure().input_folder) + "/",
+    "dominant": {1: "CF_41.xlsx"},
+    "subdominant": {1: "CF_41.xlsx"},
+    "under": {0: "susi_motti_input_lyr_2.xlsx"},
+}
+
+
+@pytest.fixture(scope="module")
+def stands():
+    spara = golden_test.PARAMETERS.extra_parameters
+    n = spara.n
+    canopylayers = {
+        "dominant": np.ones(n, dtype=int),
+        # the subdominant layer grows only in half of the strip
+        "subdominant": np.where(np.arange(n) < n // 2, 1, 0),
+        "under": np.zeros(n, dtype=int),
+    }
+    age = dict(spara.age, subdominant=np.full(n, 15.0))
+    return [
+        Stand(
+            1,
+            5,
+            canopylayers,
+            n,
+            spara.sfc,
+            age,
+            MOTTIFILE,
+            golden_test.PARAMETERS.photo_parameters,
+            column_groups=column_groups,
+        )
+        for column_groups in (False, True)
+    ]
+
+
+def test_assimilation_in_tree_columns_matches_all_columns(stands):
+    rng = np.random.default_rng(20)
+    days, n = 365, stands[0].ncols
+    index = pd.date_range("2001-01-01", periods=days)
+    doy = np.arange(days)
+    weather = {
+        "T": 10.0 * np.sin(2 * np.pi * (doy - 100) / 365) + 3.0,
+        "Rg": rng.uniform(5.0, 250.0, days),
+        "vpd": rng.uniform(0.05, 1.5, days),
+    }
+    wt = pd.DataFrame(rng.uniform(-0.9, -0.05, (days, n)), index=index)
+    afp = pd.DataFrame(rng.uniform(0.0, 0.3, (days, n)), index=index)
+
+    for stand in stands:
+        stand.assimilate(weather, wt, afp)
+        stand.update()
+
+    every, grouped = stands
+    for layer, grouped_layer in zip(every.clyrs, grouped.clyrs):
+        np.testing.assert_array_equal(grouped_layer.NPP, layer.NPP)
+        np.testing.assert_array_equal(grouped_layer.NPP_pot, layer.NPP_pot)
+    for name in ("biomass", "volume", "leafarea", "nonwoodylitter", "n_demand"):
+        np.testing.assert_array_equal(getattr(grouped, name), getattr(every, name))
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from susi.core.stem_curve import AssortmentTable, StemCurve
+
+
+@pytest.fixture(scope="module")
+def stems():
+    rng = np.random.default_rng(24)
+    n = 60
+    d13 = rng.uniform(3.0, 45.0, n)
+    h = np.clip(d13 * rng.uniform(0.6, 1.2, n) + 2.0, 3.0, 35.0)
+    return d13, h, rng.integers(1, 4, n)
+
+
+def test_vectorised_bucking_matches_single_stems(stems):
+    d13, h, sp = stems
+    stemcurve = StemCurve()
+    cutPoints = stemcurve.buckStems(d13, h, sp)
+    volume = stemcurve.assortmentVolumes(d13, h, sp)
+    for i in range(len(d13)):
+        single = stemcurve.buckStem(d13[i], h[i], sp[i])
+        for kind in ("stump", "log", "pulp"):
+            np.testing.assert_allclose(cutPoints[kind][i], single[kind], atol=1e-9)
+        single = stemcurve.predictAssortmentVolumes(d13[i], h[i], sp[i])
+        for kind in single:
+            np.testing.assert_allclose(
+                volume[kind][i], single[kind], rtol=1e-8, atol=1e-8
+            )
+
+
+def test_assortment_table(stems):
+    d13, h, sp = stems
+    volume = StemCurve().assortmentVolumes(d13, h, sp)
+    table = AssortmentTable()(d13, h, sp)
+    np.testing.assert_allclose(table["total"], volume["total"], rtol=0.02)
+    for kind in ("log", "pulp", "residual"):
+        assert abs(table[kind].sum() / volume[kind].sum() - 1.0) < 0.1
@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from inputs.parameters import golden_test
+from susi.core.mosslayer import MossLayer
+from susi.core.strip import StripHydrology, drain_depth_development
+from susi.io.susi_parameter_model import OrganicLayerParametersArray
+
+
+def run_strip(ndays=60, residuals=None, **updates):
+    spara = golden_test.PARAMETERS.extra_parameters.model_copy(update=updates)
+    stp = StripHydrology(spara)
+    stp.reset_domain()
+    if residuals is not None:
+        # records the residual of the last Newton iterate of each day
+        newton_residual = stp.newton_residual
+
+        def recorded_residual(*args):
+            R, terms = newton_residual(*args)
+            residuals[-1] = np.max(np.abs(R[1:-1] / terms["alfa"][1:-1]))  # in m
+            return R, terms
+
+        stp.newton_residual = recorded_residual
+    moss = MossLayer(
+        OrganicLayerParametersArray(
+            golden_test.PARAMETERS.organic_layer_parameters, spara.n
+        )
+    )
+    h0ts = drain_depth_development(ndays, -0.5, -0.7)
+    rain = np.tile([0.0, 0.0, 0.002, 0.03], ndays)
+    dwts = np.zeros((ndays, spara.n))
+    iterations = np.zeros(ndays, dtype=int)
+    for d in range(ndays):
+        if residuals is not None:
+            residuals.append(np.nan)
+        potinf, _, _ = moss.interception(rain[d] * np.ones(spara.n), np.zeros(spara.n))
+        stp.run_timestep(d, h0ts[d], h0ts[d], potinf - 0.0015, moss)
+        dwts[d] = stp.dwt
+        iterations[d] = stp.iterations
+    return dwts, iterations
+
+
+@pytest.mark.parametrize("L", [40.0, 200.0])
+def test_banded_solver_matches_dense(L):
+    dense, _ = run_strip(L=L, strip_solve_mode="dense")
+    banded, _ = run_strip(L=L, strip_solve_mode="banded")
+    np.testing.assert_allclose(banded, dense, atol=1e-10)
+
+
+def test_newton_converges_to_the_solution():
+    _, picard_iterations = run_strip(strip_solve_mode="banded")
+    residuals = []
+    newton, newton_iterations = run_strip(
+        residuals=residuals,
+        strip_solve_mode="banded",
+        strip_nonlinear_solve_mode="newton",
+    )
+    reference_residuals = []
+    reference, _ = run_strip(
+        residuals=reference_residuals,
+        strip_solve_mode="banded",
+        strip_nonlinear_solve_mode="newton",
+        strip_tolerance=1e-12,
+        strip_max_iterations=1000,
+    )
+    assert max(reference_residuals) < 1e-9  # the discrete equations are solved
+    assert max(residuals) < 1e-5
+    np.testing.assert_allclose(newton, reference, atol=1e-6)
+    assert newton_iterations.max() < 100
+    assert newton_iterations.sum() < picard_iterations.sum()
+
+
+def run_strip_balance(ndays=60, **updates):
+    """Daily infiltration, storage change and ditch runoff of the strip, m."""
+    spara = golden_test.PARAMETERS.extra_parameters.model_copy(update=updates)
+    stp = StripHydrology(spara)
+    stp.reset_domain()
+    infiltration = []
+    run_adaptive_day = stp.run_adaptive_day
+
+    def recorded_day(S, *args):
+        infiltration.append(np.sum(S[1:-1]) * stp.dy / stp.L)
+        return run_adaptive_day(S, *args)
+
+    stp.run_adaptive_day = recorded_day
+    moss = MossLayer(
+        OrganicLayerParametersArray(
+            golden_test.PARAMETERS.organic_layer_parameters, spara.n
+        )
+    )
+    h0ts = drain_depth_development(ndays, -0.5, -0.7)
+    rain = np.tile([0.0, 0.0, 0.002, 0.03], ndays)
+    storage = np.zeros(ndays + 1)
+    runoff = np.zeros(ndays)
+    dwts = np.zeros((ndays, spara.n))
+    storage[0] = np.sum(stp.dwtToSto(stp.dwt)[1:-1]) * stp.dy / stp.L
+    for d in range(ndays):
+        potinf, _, _ = moss.interception(rain[d] * np.ones(spara.n), np.zeros(spara.n))
+        stp.run_timestep(d, h0ts[d], h0ts[d], potinf - 0.0015, moss)
+        storage[d + 1] = np.sum(stp.dwtToSto(stp.dwt)[1:-1]) * stp.dy / stp.L
+        runoff[d] = stp.roffwest + stp.roffeast
+        dwts[d] = stp.dwt
+    return np.array(infiltration), np.diff(storage), runoff, dwts
+
+
+def test_adaptive_time_stepping_follows_daily_steps():
+    fixed, fixed_iterations = run_strip(ndays=120, strip_solve_mode="banded")
+    adaptive, adaptive_iterations = run_strip(
+        ndays=120, strip_solve_mode="banded", strip_time_stepping="adaptive"
+    )
+    assert np.abs(adaptive - fixed).mean() < 0.01
+    assert adaptive_iterations.sum() < 0.6 * fixed_iterations.sum()
+
+
+def test_adaptive_time_stepping_conserves_water():
+    infiltration, storage, runoff, _ = run_strip_balance(
+        strip_solve_mode="banded",
+        strip_time_stepping="adaptive",
+        strip_step_tolerance=0.01,
+    )
+    assert infiltration.max() > 0.01  # wet days fill the strip
+    np.testing.assert_allclose(infiltration, runoff + storage, atol=1e-3)
+
+
+def test_tighter_step_tolerance_converges_to_daily_steps():
+    _, _, fixed_runoff, fixed = run_strip_balance(ndays=120, strip_solve_mode="banded")
+    imbalances, runoffs, dwts = [], [], []
+    for tolerance in [0.05, 0.01, 0.002]:
+        infiltration, storage, runoff, adaptive = run_strip_balance(
+            ndays=120,
+            strip_solve_mode="banded",
+            strip_time_stepping="adaptive",
+            strip_step_tolerance=tolerance,
+        )
+        imbalances.append(np.abs(infiltration - runoff - storage).max())
+        runoffs.append(runoff.sum())
+        dwts.append(adaptive)
+        assert np.abs(adaptive - fixed).mean() < 0.01
+        np.testing.assert_allclose(runoff.sum(), fixed_runoff.sum(), rtol=0.05)
+    assert imbalances[0] > imbalances[1] > imbalances[2]
+    # the substeps settle, the last two tolerances agree better than the first two
+    assert np.abs(dwts[2] - dwts[1]).mean() < np.abs(dwts[1] - dwts[0]).mean()
+    assert abs(runoffs[2] - runoffs[1]) < abs(runoffs[1] - runoffs[0])
+
+
+@pytest.mark.parametrize(
+    "updates", [{"strip_max_iterations": 2}, {"strip_step_tolerance": 1e-6}]
+)
+def test_adaptive_time_stepping_finishes_days_without_convergence(updates):
+    with pytest.warns(RuntimeWarning, match="did not meet the step tolerance"):
+        dwts, iterations = run_strip(
+            ndays=8,
+            strip_solve_mode="banded",
+            strip_time_stepping="adaptive",
+            **updates,
+        )
+    assert np.isfinite(dwts).all()
+    assert iterations.max() < 1000
+
+
+@pytest.mark.parametrize("mode", ["picard", "newton"])
+def test_convergence_on_the_last_allowed_iteration(mode):
+    spara = golden_test.PARAMETERS.extra_parameters.model_copy(
+        update={"strip_solve_mode": "banded", "strip_nonlinear_solve_mode": mode}
+    )
+    stp = StripHydrology(spara)
+    stp.reset_domain()
+    S = np.full(spara.n, 0.005)
+    *_, it, correction = stp.solve_step(S, -0.7, -0.7)
+    assert it > 0 and correction == 0.0
+    stp.max_iterations = it + 1
+    assert stp.solve_step(S, -0.7, -0.7)[-1] == 0.0
+    stp.max_iterations = it
+    assert stp.solve_step(S, -0.7, -0.7)[-1] == np.inf
+
+
+def test_scenarios_in_lock_step_match_single_strips():
+    ndays, depths = 60, [(-0.3, -0.5), (-0.5, -0.7), (-0.9, -0.9)]
+    spara = golden_test.PARAMETERS.extra_parameters.model_copy(
+        update={"strip_solve_mode": "banded"}
+    )
+    stp = StripHydrology(spara, nscens=len(depths))
+    stp.reset_domain()
+    moss = MossLayer(
+        OrganicLayerParametersArray(
+            golden_test.PARAMETERS.organic_layer_parameters, (len(depths), spara.n)
+        )
+    )
+    h0ts = np.array([drain_depth_development(ndays, *d) for d in depths]).T
+    rain = np.tile([0.001, 0.002, 0.0, 0.0], ndays)
+    dwts = np.zeros((ndays, len(depths), spara.n))
+    iterations = np.zeros((ndays, len(depths)), dtype=int)
+    for d in range(ndays):
+        potinf, _, _ = moss.interception(
+            rain[d] * np.ones((len(depths), spara.n)), np.zeros((len(depths), spara.n))
+        )
+        stp.run_timestep(d, h0ts[d], h0ts[d], potinf - 0.0015, moss)
+        dwts[d] = stp.dwt
+        iterations[d] = stp.iterations
+    stp.update_residence_time(np.moveaxis(dwts, 0, 1))
+    for r in range(len(depths)):
+        single = StripHydrology(spara)
+        single.reset_domain()
+        moss = MossLayer(
+            OrganicLayerParametersArray(
+                golden_test.PARAMETERS.organic_layer_parameters, spara.n
+            )
+        )
+        for d in range(ndays):
+            potinf, _, _ = moss.interception(
+                rain[d] * np.ones(spara.n), np.zeros(spara.n)
+            )
+            single.run_timestep(d, h0ts[d, r], h0ts[d, r], potinf - 0.0015, moss)
+            np.testing.assert_array_equal(dwts[d, r], single.dwt)
+            assert iterations[d, r] == single.iterations
+        single.update_residence_time(pd.DataFrame(dwts[:, r]))
+        np.testing.assert_array_equal(stp.residence_time[r], single.residence_time)
+        np.testing.assert_array_equal(stp.west[r], single.west)
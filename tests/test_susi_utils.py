@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.interpolate import interp1d
+
+from inputs.parameters import golden_test
+from susi.core.susi_utils import CompiledForcing, LookupTable, assimilation_yr
+
+
+@pytest.mark.parametrize(
+    "x",
+    [
+        np.linspace(0.0, -6.0, 150),  # uniform, decreasing as in CWTr
+        np.sort(np.random.default_rng(1).uniform(-6.0, 0.0, 150)),  # non-uniform
+    ],
+)
+def test_lookup_table_matches_interp1d(x):
+    y = np.exp(x) + 0.1 * x**2
+    xnew = np.random.default_rng(2).uniform(-7.0, 1.0, (5, 40))
+    table = LookupTable(x, y)
+    reference = interp1d(x, y, fill_value="extrapolate")
+    np.testing.assert_allclose(table(xnew), reference(xnew), rtol=1e-12, atol=1e-14)
+
+    fill_value = (y[0], y[-1])
+    table = LookupTable(x, y, fill_value=fill_value)
+    reference = interp1d(x, y, fill_value=fill_value, bounds_error=False)
+    np.testing.assert_allclose(table(xnew), reference(xnew), rtol=1e-12, atol=1e-14)
+
+
+def test_lookup_table_derivative():
+    x = np.linspace(-6.0, 0.0, 150)
+    table = LookupTable(x, np.sin(x))
+    xnew = np.random.default_rng(3).uniform(-6.0, 0.0, 100)
+    h = 1e-7
+    midpoint = 0.5 * (table.x[table.interval(xnew)] + table.x[table.interval(xnew) + 1])
+    xnew = midpoint + 0.4 * (xnew - midpoint)  # stay inside the grid interval
+    np.testing.assert_allclose(
+        table.derivative(xnew), (table(xnew + h) - table(xnew - h)) / (2 * h), rtol=1e-6
+    )
+
+
+def test_compiled_forcing_matches_data_frame():
+    rng = np.random.default_rng(4)
+    index = pd.date_range("1983-01-01", "1985-12-31")
+    columns = ["ID", "Kunta", "lon", "lat", "T", "Tmax", "Tmin", "Prec", "Rg"]
+    columns += ["h2o", "Par", "RH", "esa", "vpd"]
+    forc = pd.DataFrame(rng.normal(size=(len(index), len(columns))), index, columns)
+    forc["doy"] = forc.index.dayofyear  # column layout of read_FMI_weather
+    forcing = CompiledForcing(forc)
+    for d in rng.integers(0, len(index), 20):
+        assert forcing.doy[d] == forc.iloc[d, 14]
+        assert forcing.T[d] == forc.iloc[d, 4]
+        assert forcing.vpd[d] == forc.iloc[d, 13]
+        assert forcing.Prec[d] == forc.iloc[d, 7]
+    for yr in (1983, 1984, 1985):
+        weather = forcing.year(yr)
+        assert len(weather["T"]) == len(forc.loc[str(yr)])
+        for name in ("T", "Rg", "vpd", "doy"):
+            np.testing.assert_array_equal(weather[name], forc.loc[str(yr), name])
+
+
+def test_assimilation_of_stacked_layers_matches_single_layers():
+    rng = np.random.default_rng(23)
+    days, n = 365, 12
+    doy = np.arange(days)
+    forc = pd.DataFrame(
+        {
+            "T": 10.0 * np.sin(2 * np.pi * (doy - 100) / 365) + 3.0,
+            "Rg": rng.uniform(5.0, 250.0, days),
+            "vpd": rng.uniform(0.05, 1.5, days),
+        },
+        index=pd.date_range("2001-01-01", periods=days),
+    )
+    wt = rng.uniform(-0.9, -0.05, (days, n))
+    afp = rng.uniform(0.0, 0.3, (days, n))
+    lai = rng.uniform(0.0, 8.0, (3, n))
+    lai[2, :4] = 0.0  # layer missing in part of the strip
+    lai_above = rng.uniform(0.0, 6.0, (3, n))
+
+    ppara = golden_test.PARAMETERS.photo_parameters
+    npp, npp_pot = assimilation_yr(ppara, forc, wt, afp, lai, lai_above)
+    assert npp.shape == (3, n)
+    for layer in range(3):
+        single = assimilation_yr(ppara, forc, wt, afp, lai[layer], lai_above[layer])
+        np.testing.assert_array_equal(npp[layer], single[0])
+        np.testing.assert_array_equal(npp_pot[layer], single[1])
+    np.testing.assert_array_equal(npp[2, :4], 0.0)
@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pytest
+
+from inputs.parameters import golden_test
+from susi.core import allometry
+from susi.core.strip import StripHydrology
+from susi.core.table_cache import TableCache
+from susi.io.app_structure import AppStructure
+
+
+def test_cache_reuses_tables(tmp_path):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {"a": np.arange(5.0)}
+
+    cache = TableCache(tmp_path, max_mb=1.0)
+    first = cache.fetch("test", {"x": [1, 2]}, build)
+    second = TableCache(tmp_path, max_mb=1.0).fetch("test", {"x": [1, 2]}, build)
+    cache.fetch("test", {"x": [1, 3]}, build)
+    assert len(calls) == 2
+    np.testing.assert_array_equal(first["a"], second["a"])
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = TableCache(tmp_path, max_mb=0.02)  # room for two tables
+    tables = {"a": np.zeros(1000)}
+    keys = [cache.key("test", {"i": i}) for i in range(3)]
+    cache.save(keys[0], tables)
+    cache.save(keys[1], tables)
+    os.utime(tmp_path / (keys[1] + ".npz"), (0, 0))  # oldest use
+    cache.save(keys[2], tables)
+    assert cache.load(keys[0]) is not None
+    assert cache.load(keys[1]) is None
+    assert cache.load(keys[2]) is not None
+
+
+def test_failed_save_leaves_no_temporary_file(tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    cache = TableCache(tmp_path, max_mb=1.0)
+    monkeypatch.setattr(np, "savez", fail)
+    with pytest.raises(OSError):
+        cache.save(cache.key("test", {}), {"a": np.zeros(10)})
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_strip_tables_from_cache(tmp_path):
+    spara = golden_test.PARAMETERS.extra_parameters
+    cached = spara.model_copy(update={"table_cache_dir": tmp_path})
+    stp = StripHydrology(spara)
+    StripHydrology(cached)  # fills the cache
+    stp_cached = StripHydrology(cached)
+    dwt = np.linspace(-2.0, 0.0, 50)
+    for name in ("dwtToSto", "C", "dwtToRat", "dwtToAfp"):
+        np.testing.assert_array_equal(
+            getattr(stp_cached, name)(dwt), getattr(stp, name)(dwt)
+        )
+    np.testing.assert_array_equal(stp_cached.dwtToTra(dwt), stp.dwtToTra(dwt))
+    np.testing.assert_array_equal(stp_cached.Ksat, stp.Ksat)
+
+
+def test_motti_tables_from_cache(tmp_path, monkeypatch):
+    mfile = str(AppStructure().input_folder) + "/CF_41.xlsx"
+    parsed = allometry.read_motti_tables(mfile)
+    monkeypatch.setattr(allometry, "_motti_tables", {})
+    allometry.motti_tables(mfile, TableCache(tmp_path, max_mb=1.0))  # fills the cache
+    monkeypatch.setattr(allometry, "_motti_tables", {})  # as in a new process
+    monkeypatch.setattr(allometry, "read_motti_tables", None)  # no Excel parsing
+    cached = allometry.motti_tables(mfile, TableCache(tmp_path, max_mb=1.0))
+    assert cached.keys() == parsed.keys()
+    for name, column in parsed.items():
+        assert cached[name].dtype == column.dtype
+        np.testing.assert_array_equal(cached[name], column)
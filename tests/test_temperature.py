@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from inputs.parameters import golden_test
+from susi.core.temperature import PeatTemperature, PeatTemperatureColumns
+
+
+def test_propagator_matches_dense_banded():
+    rng = np.random.default_rng(0)
+    ndays = 400
+    Ta = rng.normal(3.0, 10.0, ndays)
+    SWE = np.where(rng.random(ndays) < 0.3, 0.05, 0.0)
+    efloor = rng.uniform(0.0, 0.003, ndays)
+    profiles = {}
+    for mode in ("dense_banded", "propagator"):
+        spara = golden_test.PARAMETERS.extra_parameters.model_copy(
+            update={"temperature_solve_mode": mode}
+        )
+        pt = PeatTemperature(spara, mean_Ta=3.0)
+        pt.reset_domain()
+        profiles[mode] = np.array(
+            [pt.run_timestep(Ta[d], SWE[d], efloor[d], mode)[1] for d in range(ndays)]
+        )
+    np.testing.assert_allclose(
+        profiles["propagator"], profiles["dense_banded"], atol=1e-9
+    )
+
+
+@pytest.mark.parametrize("mode", ["dense_banded", "propagator"])
+def test_columns_match_single_profiles(mode):
+    rng = np.random.default_rng(1)
+    ndays, shape = 60, (2, 5)
+    Ta = rng.normal(3.0, 10.0, ndays)
+    SWE = np.where(rng.random((ndays,) + shape) < 0.3, 0.05, 0.0)
+    efloor = rng.uniform(0.0, 0.003, (ndays,) + shape)
+    spara = golden_test.PARAMETERS.extra_parameters.model_copy(
+        update={"temperature_solve_mode": mode}
+    )
+    columns = PeatTemperatureColumns(spara, 3.0, shape)
+    columns.reset_domain()
+    batched = np.array(
+        [columns.run_timestep(Ta[d], SWE[d], efloor[d], mode)[1] for d in range(ndays)]
+    )
+    for idx in np.ndindex(shape):
+        pt = PeatTemperature(spara, mean_Ta=3.0)
+        pt.reset_domain()
+        single = np.array(
+            [
+                pt.run_timestep(Ta[d], SWE[d][idx], efloor[d][idx], mode)[1]
+                for d in range(ndays)
+            ]
+        )
+        np.testing.assert_allclose(batched[(slice(None),) + idx], single, atol=1e-9)